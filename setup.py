@@ -63,6 +63,7 @@ extras_require = {
     'tests': [
         'flake8',
         'pytest',
+        'pytest-benchmark',
         'python-coveralls',
         'requre',
         'pre-commit',
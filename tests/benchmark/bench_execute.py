@@ -0,0 +1,110 @@
+""" Benchmarks of the test execution """
+
+import collections
+import itertools
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+import tmt.utils
+
+pytest.importorskip('pytest_benchmark')
+
+# Number of tests of each framework to be executed
+TESTS = int(os.environ.get('TMT_BENCHMARK_TESTS', '1000'))
+
+# Image used for the container provision
+IMAGE = os.environ.get('TMT_BENCHMARK_IMAGE', 'fedora')
+
+# Number of measured runs for each provision method
+ROUNDS = 3
+
+# Timed spans contributing to the per-test overhead
+OVERHEAD_SPANS = [
+    'test-metadata', 'test-environment', 'test', 'guest-pull', 'test-check']
+
+# Script emulating a passing beakerlib test (without beakerlib installed)
+BEAKERLIB_TEST = (
+    'printf "%s\\n" TESTRESULT_RESULT_STRING=PASS TESTRESULT_STATE=complete'
+    ' > "$BEAKERLIB_DIR/TestResults"')
+
+
+def generate_tree(path, size):
+    """ Create a tree with trivial shell and beakerlib-style tests """
+    os.makedirs(os.path.join(path, '.fmf'))
+    with open(os.path.join(path, '.fmf', 'version'), 'w') as version:
+        version.write('1\n')
+    frameworks = dict(shell='true', beakerlib=BEAKERLIB_TEST)
+    for framework, script in frameworks.items():
+        lines = [f'framework: {framework}', f"test: '{script}'"]
+        for number in range(size):
+            lines.extend([
+                f'/test-{number:05}:',
+                f'    summary: Trivial {framework} test {number}',
+                ])
+        os.makedirs(os.path.join(path, 'tests', framework))
+        with open(os.path.join(path, 'tests', framework, 'main.fmf'), 'w') \
+                as metadata:
+            metadata.write('\n'.join(lines) + '\n')
+    with open(os.path.join(path, 'plan.fmf'), 'w') as metadata:
+        metadata.write('discover:\n    how: fmf\nexecute:\n    how: tmt\n')
+
+
+@pytest.fixture(scope='module')
+def execute_tree(tmp_path_factory):
+    """ Path to a generated tree with trivial tests """
+    path = str(tmp_path_factory.mktemp('execute'))
+    generate_tree(path, TESTS)
+    return path
+
+
+@pytest.mark.parametrize('how', ['local', 'container'])
+def test_execute(benchmark, execute_tree, tmp_path, how):
+    """ Execute trivial tests, measure the per-test framework overhead """
+    provision = ['provision', '--how', how]
+    if how == 'container':
+        if shutil.which('podman') is None:
+            pytest.skip('Podman is not available.')
+        provision.extend(['--image', IMAGE])
+    workdirs = (str(tmp_path / f'run-{index}') for index in itertools.count())
+    rusages = []
+
+    def setup():
+        command = [
+            sys.executable, '-m', 'tmt', '--root', execute_tree, 'run',
+            '--id', next(workdirs), 'discover', *provision, 'execute',
+            'finish']
+        return (command,), dict()
+
+    def run(command):
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+        # Collect the resource usage of the finished process
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = os.WEXITSTATUS(status)
+        assert process.returncode == 0
+        rusages.append(rusage)
+        return command[command.index('--id') + 1]
+
+    workdir = benchmark.pedantic(run, setup=setup, rounds=ROUNDS)
+
+    # Overhead breakdown of the last run, peak memory of all runs
+    total = 2 * TESTS
+    timings = tmt.utils.yaml_to_dict(tmt.utils.Common().read(
+        os.path.join(workdir, tmt.utils.TIMINGS_FILENAME)))
+    durations = collections.defaultdict(float)
+    for span in timings['spans']:
+        durations[span['span']] += span['duration']
+    benchmark.extra_info['tests'] = total
+    benchmark.extra_info['tests_per_second'] = round(
+        total / benchmark.stats.stats.mean, 1)
+    benchmark.extra_info['time_per_test_ms'] = round(
+        benchmark.stats.stats.mean / total * 1000, 3)
+    benchmark.extra_info['overhead_per_test_ms'] = {
+        name: round(durations[name] / total * 1000, 3)
+        for name in OVERHEAD_SPANS}
+    # Kilobytes on Linux
+    benchmark.extra_info['peak_memory_mb'] = round(
+        max(rusage.ru_maxrss for rusage in rusages) / 1024, 1)
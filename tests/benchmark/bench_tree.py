@@ -0,0 +1,84 @@
+""" Benchmarks of metadata tree operations """
+
+import subprocess
+import sys
+
+import click
+import pytest
+
+import tmt
+import tmt.cli
+import tmt.utils
+
+pytest.importorskip('pytest_benchmark')
+
+# Typical filters used for selecting tests
+FILTERS = [
+    'tier: 1',
+    'tag: tag-3',
+    'tier: 2 & component: component-7',
+    ]
+
+
+def test_tests(benchmark, tree_path):
+    """ Load the tree and initialize all tests """
+    tests = benchmark(lambda: tmt.Tree(path=tree_path).tests())
+    assert tests
+
+
+def test_plans(benchmark, tree_path):
+    """ Load the tree and initialize all plans """
+    plans = benchmark(lambda: tmt.Tree(path=tree_path).plans())
+    assert len(plans) == 10
+
+
+@pytest.mark.parametrize('filter_', FILTERS)
+def test_filters_conditions(benchmark, tree_path, filter_):
+    """ Select tests from an already loaded tree using a filter """
+    tree = tmt.Tree(path=tree_path)
+    nodes = list(tree.tree.prune(keys=['test']))
+
+    def select():
+        # New tree object for each round so that the index is built
+        return tmt.Tree(tree=tree.tree)._filters_conditions(
+            nodes, tmt.Test, [filter_], [], [], [])
+
+    assert benchmark(select)
+
+
+@pytest.mark.parametrize('format_', ['dict', 'execute'])
+def test_export(benchmark, tree_path, format_):
+    """ Export all tests """
+    tests = tmt.Tree(path=tree_path).tests()
+    exported = benchmark(
+        lambda: [test.export(format_=format_) for test in tests])
+    assert len(exported) == len(tests)
+
+
+def test_discover_save_load(benchmark, tree_path, tmp_path):
+    """ Store discovered tests in the workdir and load them back """
+    tree = tmt.Tree(path=tree_path)
+    context = click.Context(tmt.cli.run)
+    context.params = {tmt.utils.PLAN_SKIP_WORKTREE_INIT: True}
+    run = tmt.Run(id_=str(tmp_path / 'run'), tree=tree, context=context)
+    run._save_tree(tree)
+    run._workdir_load(run._workdir_path)
+    discover = run.plans[0].discover
+    tests = tree.tests()
+
+    def round_trip():
+        discover._tests = tests
+        discover.save()
+        discover.load()
+        return discover.tests()
+
+    assert len(benchmark(round_trip)) == len(tests)
+
+
+def test_tests_ls(benchmark, tree_path):
+    """ List tests using the command line (including the startup) """
+    output = benchmark(
+        subprocess.run,
+        [sys.executable, '-m', 'tmt', '--root', tree_path, 'tests', 'ls'],
+        check=True, stdout=subprocess.PIPE)
+    assert output.stdout
@@ -0,0 +1,86 @@
+""" Synthetic metadata trees shared by the benchmarks """
+
+import os
+
+import pytest
+
+# Numbers of tests in generated trees, e.g. TMT_BENCHMARK_SIZES=1000,10000
+SIZES = [
+    int(size) for size in
+    os.environ.get('TMT_BENCHMARK_SIZES', '1000,10000,50000').split(',')]
+
+# Number of tests stored in a single metadata file
+TESTS_PER_FILE = 1000
+
+# Number of plans in generated trees
+PLANS = 10
+
+
+def generate_tree(path, size):
+    """ Create an fmf tree with given number of tests and a few plans """
+    os.makedirs(os.path.join(path, '.fmf'))
+    with open(os.path.join(path, '.fmf', 'version'), 'w') as version:
+        version.write('1\n')
+
+    # Tests, common metadata inherited from the group
+    for group, first in enumerate(range(0, size, TESTS_PER_FILE)):
+        directory = os.path.join(path, 'tests', f'group-{group:03}')
+        os.makedirs(directory)
+        lines = [
+            'contact: Tester <tester@example.com>',
+            'framework: shell',
+            'duration: 5m',
+            'require: [make, gcc]',
+            ]
+        for number in range(first, min(first + TESTS_PER_FILE, size)):
+            lines.extend([
+                f'/test-{number:05}:',
+                f'    summary: Synthetic test number {number}',
+                '    test: ./test.sh',
+                f'    tier: "{number % 3}"',
+                f'    tag: [tag-{number % 10}, tag-{number % 7}]',
+                f'    component: [component-{number % 20}]',
+                f'    link: [https://issues.example.com/{number % 100}]',
+                ])
+            if number % 10 == 0:
+                lines.extend([
+                    '    adjust:',
+                    '        enabled: false',
+                    '        when: distro == rhel-7',
+                    ])
+        with open(os.path.join(directory, 'main.fmf'), 'w') as metadata:
+            metadata.write('\n'.join(lines) + '\n')
+
+    # Plans selecting tests by tier and tags
+    lines = ['discover:', '    how: fmf', 'execute:', '    how: tmt']
+    for number in range(PLANS):
+        lines.extend([
+            f'/plan-{number:02}:',
+            f'    summary: Synthetic plan number {number}',
+            '    discover+:',
+            f'        filter: "tier: {number % 3} & tag: tag-{number}"',
+            ])
+    os.makedirs(os.path.join(path, 'plans'))
+    with open(os.path.join(path, 'plans', 'main.fmf'), 'w') as metadata:
+        metadata.write('\n'.join(lines) + '\n')
+
+
+@pytest.fixture(scope='session', autouse=True)
+def cache_directory(tmp_path_factory):
+    """ Keep tmt cache out of the user home directory """
+    original = os.environ.get('TMT_CACHE')
+    os.environ['TMT_CACHE'] = str(tmp_path_factory.mktemp('cache'))
+    yield os.environ['TMT_CACHE']
+    if original is None:
+        del os.environ['TMT_CACHE']
+    else:
+        os.environ['TMT_CACHE'] = original
+
+
+@pytest.fixture(
+    scope='session', params=SIZES, ids=lambda size: f'{size}-tests')
+def tree_path(request, tmp_path_factory):
+    """ Path to a generated tree with given number of tests """
+    path = str(tmp_path_factory.mktemp(f'tree-{request.param}'))
+    generate_tree(path, request.param)
+    return path
@@ -0,0 +1,15 @@
+import os
+
+import pytest
+
+
+@pytest.fixture(scope='session', autouse=True)
+def cache_directory(tmp_path_factory):
+    """ Keep tmt cache out of the user home directory """
+    original = os.environ.get('TMT_CACHE')
+    os.environ['TMT_CACHE'] = str(tmp_path_factory.mktemp('cache'))
+    yield os.environ['TMT_CACHE']
+    if original is None:
+        del os.environ['TMT_CACHE']
+    else:
+        os.environ['TMT_CACHE'] = original
@@ -3,8 +3,10 @@
 import os
 import shutil
 import tempfile
+import time
 
 import click.testing
+import fmf
 import pytest
 
 import tmt
@@ -114,3 +116,172 @@ def test_link():
         Link(dict(depends='other'))
     with pytest.raises(SpecificationError, match='Unexpected link key'):
         Link(dict(verifies='story', url='https://example.org', ref='devel'))
+
+
+def test_tree_cache(tmpdir):
+    """ Cached tree is used only while metadata files are unchanged """
+    root = tmpdir.join('root')
+    root.join('.fmf', 'version').write('1', ensure=True)
+    test = root.join('test.fmf')
+    test.write('test: ./test.sh\nsummary: first')
+    # Pretend the files were modified long enough ago
+    for path in [test, root.join('.fmf', 'version')]:
+        os.utime(str(path), (0, 0))
+    cache_directory = str(tmpdir.join('cache'))
+
+    cache = tmt.utils.TreeCache(str(root), {}, directory=cache_directory)
+    assert cache.load() is None
+    cache.save(fmf.Tree(str(root)))
+    cache = tmt.utils.TreeCache(str(root), {}, directory=cache_directory)
+    assert cache.load().find('/test').get('summary') == 'first'
+
+    # Different context uses a separate cache
+    cache = tmt.utils.TreeCache(
+        str(root), {'distro': ['fedora']}, directory=cache_directory)
+    assert cache.load() is None
+
+    # Modified and freshly created files invalidate the cache
+    test.write('test: ./test.sh\nsummary: second')
+    cache = tmt.utils.TreeCache(str(root), {}, directory=cache_directory)
+    assert cache.load() is None
+    # Recently modified metadata are not cached
+    cache.save(fmf.Tree(str(root)))
+    cache = tmt.utils.TreeCache(str(root), {}, directory=cache_directory)
+    assert cache.load() is None
+
+
+def test_tree_cache_evict(tmpdir):
+    """ Old and least recently used trees are removed """
+    root = tmpdir.join('root')
+    root.join('.fmf', 'version').write('1', ensure=True)
+    root.join('test.fmf').write('test: ./test.sh')
+    for path in [root.join('test.fmf'), root.join('.fmf', 'version')]:
+        os.utime(str(path), (0, 0))
+    cache_directory = str(tmpdir.join('cache'))
+    tree = fmf.Tree(str(root))
+
+    # Fill the cache with trees for different contexts
+    paths = []
+    for index in range(3):
+        cache = tmt.utils.TreeCache(
+            str(root), {'index': [str(index)]}, directory=cache_directory)
+        cache.save(tree)
+        used = time.time() - 100 + index
+        os.utime(cache.path, (used, used))
+        paths.append(cache.path)
+    assert all(os.path.exists(path) for path in paths)
+
+    # Size limit keeps the recently used trees only
+    size = os.path.getsize(paths[0])
+    cache = tmt.utils.TreeCache(
+        str(root), {'index': ['3']}, directory=cache_directory,
+        size=2 * size, age=10 ** 10)
+    cache.save(tree)
+    assert [os.path.exists(path) for path in paths] == [False, False, True]
+
+    # Trees not used for a long time are removed
+    cache = tmt.utils.TreeCache(
+        str(root), {'index': ['4']}, directory=cache_directory, age=0)
+    cache.save(tree)
+    assert os.listdir(os.path.dirname(cache.path)) == [
+        os.path.basename(cache.path)]
+
+
+def test_tree_filters(tmpdir):
+    """ Indexed filters match the same tests as fmf.utils.filter() """
+    root = tmpdir.join('root')
+    root.join('.fmf', 'version').write('1', ensure=True)
+    root.join('main.fmf').write(
+        'test: ./test.sh\n'
+        '/one:\n  tag: [fast, net]\n  tier: 1\n  component: bash\n'
+        '  link: {verifies: /stories/one}\n'
+        '/two:\n  tag: slow\n  tier: 2\n  enabled: false\n'
+        '  link: [{relates: https://example.org/bug/2}]\n'
+        '/three:\n  tier: 1\n  custom: value\n')
+    tree = tmt.Tree(str(root))
+
+    def names(**kwargs):
+        return [test.name for test in tree.tests(**kwargs)]
+
+    filters = [
+        'tag: fast', 'tag: f.*', 'tag: -fast', 'tier: 1 | tag: slow',
+        'tier: 1 & tag: net', 'tier: 1, 2 & tag: -slow', 'enabled: false',
+        'enabled: True', 'custom: val.*', 'tier: 1 | custom: value',
+        'component: bash', '/one', 'unknown: value']
+    # Metadata used for filtering are the same as in the objects
+    for test in tree.tests():
+        assert tmt.Test._filter_metadata(test.node) == test._metadata
+
+    for filter_ in filters:
+        expected = []
+        for test in tree.tests():
+            data = dict(test._metadata)
+            data.update({
+                key: [value, str(value).lower()]
+                for key, value in data.items() if isinstance(value, bool)})
+            try:
+                if fmf.utils.filter(filter_, data, regexp=True):
+                    expected.append(test.name)
+            except fmf.utils.FilterError:
+                pass
+        assert names(filters=[filter_]) == expected, filter_
+
+    assert names(filters=['tier: 1', 'tag: -net']) == ['/three']
+    assert names(links=['verifies:/stories/one']) == ['/one']
+    assert names(links=['bug/2', '/stories']) == ['/one', '/two']
+    assert names(links=['blocks:.*']) == []
+    assert names(filters=['tier: 1'], excludes=['/thr']) == ['/one']
+
+
+def test_tree_lazy_objects(tmpdir, monkeypatch):
+    """ Test objects are created only for selected nodes when possible """
+    root = tmpdir.join('root')
+    root.join('.fmf', 'version').write('1', ensure=True)
+    root.join('main.fmf').write(
+        'test: ./test.sh\n/one:\n  tag: fast\n/two:\n  tag: slow\n'
+        '/three:\n  tag: slow\n')
+    tree = tmt.Tree(str(root))
+    created = []
+    original = tmt.Test.__init__
+
+    def init(self, data, name=None):
+        created.append(data.name)
+        original(self, data, name)
+    monkeypatch.setattr(tmt.Test, '__init__', init)
+
+    # Excluded nodes are never converted into objects
+    assert [test.name for test in tree.tests(excludes=['/t'])] == ['/one']
+    assert created == ['/one']
+    # Filters and conditions are evaluated against the node data
+    for _ in range(2):
+        created.clear()
+        assert [test.name for test in tree.tests(filters=['tag: fast'])] \
+            == ['/one']
+        assert created == ['/one']
+    created.clear()
+    assert [test.name for test in tree.tests(
+        conditions=["'slow' in tag"])] == ['/three', '/two']
+    assert sorted(created) == ['/three', '/two']
+
+
+def test_run_jobs_unexpected_error(tmpdir, monkeypatch):
+    """ Unexpected error in one plan does not break the others """
+    root = tmpdir.join('root')
+    root.join('.fmf', 'version').write('1', ensure=True)
+    root.join('plans.fmf').write(
+        'discover:\n  how: shell\n  tests: []\n'
+        'execute:\n  how: tmt\n/one:\n/two:\n')
+    original = tmt.base.Plan.go
+
+    def go(plan):
+        if plan.name == '/plans/one':
+            raise OSError('disk on fire')
+        original(plan)
+
+    monkeypatch.setattr(tmt.base.Plan, 'go', go)
+    result = click.testing.CliRunner().invoke(tmt.cli.main, [
+        '--root', str(root), 'run', '--id', str(tmpdir.join('run')),
+        '--jobs', '2', 'discover'])
+    assert result.exit_code == 2
+    assert 'OSError: disk on fire' in result.output
+    assert '/plans/two' in result.output
@@ -1,3 +1,5 @@
+import json
+import os
 import shutil
 
 import pytest
@@ -85,3 +87,70 @@ def test_dependencies():
     assert libraries[1].repo == 'openssl'
     assert libraries[1].name == '/certgen'
     shutil.rmtree(parent.workdir)
+
+
+def test_dependencies_local(tmpdir, monkeypatch):
+    """ Resolve nested and cyclic dependencies, detect conflicts """
+    monkeypatch.setenv('TMT_CACHE', str(tmpdir.join('cache')))
+    run = tmt.utils.Common().run
+
+    def repository(name, libraries):
+        path = str(tmpdir.join(name))
+        tmpdir.join(name, '.fmf', 'version').write('1', ensure=True)
+        for library, require in libraries.items():
+            tmpdir.join(name, library, 'main.fmf').write(
+                f'require: {json.dumps(require)}\n', ensure=True)
+        run(['git', 'init', '--quiet', '--initial-branch', 'main', path])
+        run(['git', 'add', '.'], cwd=path)
+        run(['git', '-c', 'user.name=tmt', '-c', 'user.email=tmt@localhost',
+             'commit', '--quiet', '--message', 'init'], cwd=path)
+        return path
+
+    first = repository('first', {'one': [
+        dict(url=str(tmpdir.join('second')), name='/two'), 'package-one']})
+    second = repository('second', {'two': [
+        dict(url=first, name='/one'), 'package-two']})
+    parent = tmt.utils.Common(workdir=str(tmpdir.join('workdir')))
+    requires, recommends, libraries = tmt.beakerlib.dependencies(
+        [dict(url=first, name='/one'), 'wget'], ['forest'], parent=parent)
+    assert sorted(requires) == ['package-one', 'package-two', 'wget']
+    assert recommends == ['forest']
+    assert [str(library) for library in libraries] == [
+        'first/one', 'second/two']
+
+    # The first library of the repository wins
+    parent = tmt.utils.Common(workdir=str(tmpdir.join('conflict')))
+    with pytest.raises(tmt.utils.GeneralError, match="using ref 'other'"):
+        tmt.beakerlib.dependencies([
+            dict(url=first, name='/one'),
+            dict(url=second, name='/two'),
+            dict(url=first, name='/one', ref='other')], parent=parent)
+
+
+def test_library_store(tmpdir, monkeypatch):
+    """ Library is fetched once per run and linked to each plan """
+    monkeypatch.setenv('TMT_CACHE', str(tmpdir.join('cache')))
+    run = tmt.utils.Common().run
+    origin = str(tmpdir.join('origin'))
+    tmpdir.join('origin', '.fmf', 'version').write('1', ensure=True)
+    tmpdir.join('origin', 'lib', 'main.fmf').write(
+        'require: [wget]\n', ensure=True)
+    run(['git', 'init', '--quiet', '--initial-branch', 'main', origin])
+    run(['git', 'add', '.'], cwd=origin)
+    run(['git', '-c', 'user.name=tmt', '-c', 'user.email=tmt@localhost',
+         'commit', '--quiet', '--message', 'init'], cwd=origin)
+
+    top = tmt.utils.Common(workdir=str(tmpdir.join('run')))
+    libraries = [
+        tmt.beakerlib.Library(
+            dict(url=origin, name='/lib'),
+            parent=tmt.utils.Common(parent=top, name=name, workdir=True))
+        for name in ['first', 'second']]
+    stored = tmpdir.join('run', tmt.beakerlib.STORE_DIRECTORY).listdir()
+    assert len(stored) == 1
+    for library in libraries:
+        assert library.ref == 'main'
+        assert library.require == ['wget']
+        metadata = os.path.join(library.tree.root, 'lib', 'main.fmf')
+        assert os.path.samefile(
+            metadata, str(stored[0].join('lib', 'main.fmf')))
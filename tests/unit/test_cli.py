@@ -124,3 +124,12 @@ def test_systemd():
         tmt.cli.main, ['--root', example('systemd'), 'plan', 'show'])
     assert result.exit_code == 0
     assert 'Tier two functional tests' in result.output
+
+
+def test_plans_lint():
+    """ Lint plans (explores all plugins) """
+    result = runner.invoke(
+        tmt.cli.main, ['--root', example('mini'), 'plans', 'lint'])
+    assert result.exception is None
+    assert result.exit_code == 0
+    assert '/ci' in result.output
@@ -0,0 +1,46 @@
+# coding: utf-8
+
+import os
+from subprocess import run
+
+import tmt
+from tmt.steps.discover.fmf import DiscoverFmf
+
+
+def git(*args, cwd):
+    return run(
+        ['git', '-c', 'user.name=tmt', '-c', 'user.email=tmt@example.org']
+        + list(args), cwd=cwd, check=True, capture_output=True,
+        text=True).stdout.strip()
+
+
+def test_copy_git_metadata_worktree(tmpdir):
+    """ Worktree gets its own repository, the original stays untouched """
+    origin = tmpdir.mkdir('origin')
+    git('init', '--quiet', cwd=origin)
+    origin.join('file').write('first')
+    git('add', 'file', cwd=origin)
+    git('commit', '--quiet', '-m', 'first', cwd=origin)
+    first = git('rev-parse', 'HEAD', cwd=origin)
+    origin.join('file').write('second')
+    git('commit', '--quiet', '-am', 'second', cwd=origin)
+    worktree = str(tmpdir.join('worktree'))
+    git('worktree', 'add', '--quiet', '--detach', worktree, cwd=origin)
+    head = git('rev-parse', 'HEAD', cwd=worktree)
+    with open(os.path.join(worktree, 'file'), 'w') as changed:
+        changed.write('changed')
+
+    plan = tmt.utils.Common(name='/plan', workdir=str(tmpdir.join('run')))
+    plugin = DiscoverFmf.__new__(DiscoverFmf)
+    tmt.utils.Common.__init__(plugin, parent=plan, name='default-0')
+    plugin.testdir = os.path.join(plugin.workdir, 'tests')
+    tmt.utils.copy_tree(worktree, plugin.testdir, method='git')
+    plugin._copy_git_metadata(worktree)
+
+    testdir = plugin.testdir
+    assert os.path.isdir(os.path.join(testdir, '.git'))
+    assert git('rev-parse', 'HEAD', cwd=testdir) == head
+    assert git('status', '--porcelain', cwd=testdir) == 'M file'
+    git('checkout', '--quiet', '-f', first, cwd=testdir)
+    assert git('rev-parse', 'HEAD', cwd=worktree) == head
+    assert git('status', '--porcelain', cwd=worktree) == 'M file'
@@ -0,0 +1,213 @@
+# coding: utf-8
+
+import os
+from types import SimpleNamespace
+
+import tmt
+from tmt.steps.execute import RESULTS_JOURNAL, Execute, finished_test
+from tmt.steps.execute.internal import (REBOOT_REQUEST_FILENAME,
+                                        ExecuteInternal, shard_tests)
+
+
+def tests_with_durations(*durations):
+    return [
+        SimpleNamespace(name=f'/test/{index}', duration=duration)
+        for index, duration in enumerate(durations)]
+
+
+def test_shard_tests_balance():
+    """ Longest tests are spread first, shards are balanced """
+    tests = tests_with_durations('1h', '30m', '20m', '5m', '5m')
+    shards = shard_tests(tests, 2)
+    assert [test.name for test in shards[0]] == ['/test/0']
+    assert [test.name for test in shards[1]] == [
+        '/test/1', '/test/2', '/test/3', '/test/4']
+
+
+def test_shard_tests_order():
+    """ Tests keep the discover order within each shard """
+    tests = tests_with_durations('1m', '5m', '2m', '5m', '1m', '3m')
+    shards = shard_tests(tests, 3)
+    assert sorted(test.name for shard in shards for test in shard) == sorted(
+        test.name for test in tests)
+    for shard in shards:
+        names = [test.name for test in shard]
+        assert names == sorted(names)
+
+
+def test_shard_tests_more_shards_than_tests():
+    """ Extra shards stay empty """
+    tests = tests_with_durations('5m')
+    shards = shard_tests(tests, 3)
+    assert [len(shard) for shard in shards] == [1, 0, 0]
+
+
+def test_results_journal(tmpdir):
+    """ Recorded results survive an interrupted execution """
+    plan = tmt.utils.Common(name='/plan', workdir=str(tmpdir))
+    plan.my_run = None
+    guest = SimpleNamespace(name='default-0')
+    step = Execute(plan, {})
+    for name in ['/one', '/two']:
+        os.makedirs(os.path.join(step.workdir, 'data', name[1:], 'data'))
+    step.record(
+        tmt.Result(dict(result='pass', log=['out']), '/one'), guest)
+    step.status('todo')
+    step.save()
+    # Simulate a kill in the middle of writing the next record
+    step.write(RESULTS_JOURNAL, '{"guest": "default-0", "na', mode='a')
+
+    step = Execute(plan, {})
+    step.load()
+    assert [result.name for result in step.results()] == ['/one']
+    assert list(step.recorded(guest)) == ['/one']
+    assert step.recorded(SimpleNamespace(name='other')) == {}
+
+    # Data of the test without a result are removed
+    step._cleanup_unfinished()
+    assert sorted(os.listdir(step.workdir)) == ['data', RESULTS_JOURNAL]
+    assert os.path.isdir(os.path.join(step.workdir, 'data', 'one'))
+    assert not os.path.exists(os.path.join(step.workdir, 'data', 'two'))
+
+
+def test_finished_test(tmpdir):
+    """ Finished tests are detected from the pulled test data """
+    directory = tmpdir.join('test')
+    directory.join('data').ensure(dir=True)
+    directory.join('TestResults').write('TESTRESULT_STATE=incomplete\n')
+    assert not finished_test(str(directory))
+    directory.join('output.txt').write('')
+    assert not finished_test(str(directory))
+    directory.join('TestResults').write('TESTRESULT_STATE="complete"\n')
+    assert finished_test(str(directory))
+    assert not finished_test(str(directory), beakerlib=False)
+    directory.join('data', 'restraint-result').write('TESTRESULT=PASS\n')
+    assert finished_test(str(directory), beakerlib=False)
+
+    # Finished tests are kept even without a journal
+    plan = tmt.utils.Common(name='/plan', workdir=str(tmpdir))
+    plan.my_run = None
+    step = Execute(plan, {})
+    for name in ['finished', 'started']:
+        data = tmpdir.join('execute', 'data', name)
+        data.join('metadata.yaml').write('', ensure=True)
+        data.join('output.txt').write('')
+    data.dirpath('finished', 'TestResults').write('TESTRESULT_STATE=complete')
+    step._cleanup_unfinished()
+    assert os.listdir(os.path.join(step.workdir, 'data')) == ['finished']
+
+
+def test_reboot_after_result(tmpdir):
+    """ Test rebooted after reporting its result continues running """
+    plan = tmt.utils.Common(name='/plan', workdir=str(tmpdir))
+    plan.my_run = None
+    plan.data_directory = str(tmpdir.join('data'))
+    plugin = ExecuteInternal(Execute(plan, {}), {'name': 'default'})
+    plugin._detect_finished = True
+    guest = SimpleNamespace(
+        name='default-0', localhost=True, push=lambda *args: None,
+        pull=lambda **kwargs: None, reboot=lambda **kwargs: None)
+    test = SimpleNamespace(name='/test', framework='shell')
+    with open(plugin.data_path(
+            test, 'metadata.yaml', full=True, create=True), 'w'):
+        pass
+    executed = []
+
+    def execute(test, guest, progress, extra_environment):
+        data = plugin.data_path(test, 'data', full=True, create=True)
+        executed.append(test._reboot_count)
+        # Report the result first, then request a reboot
+        if not test._reboot_count:
+            with open(os.path.join(data, 'restraint-result'), 'w') as file:
+                file.write('TESTRESULT=PASS\n')
+            with open(os.path.join(data, REBOOT_REQUEST_FILENAME), 'w'):
+                pass
+        with open(plugin.data_path(test, 'output.txt', full=True), 'a'):
+            pass
+
+    plugin.execute = execute
+    plugin.check = lambda test: tmt.Result(dict(result='pass'), test.name)
+    results = plugin._run_shard(guest, [test])
+    assert executed == [0, 1]
+    assert [result.name for result in results] == ['/test']
+    # Data stored before the reboot are kept
+    assert os.path.exists(
+        plugin.data_path(test, 'data/restraint-result', full=True))
+
+
+def test_pull_overlap(tmpdir):
+    """ Only data of tests which did not pass are pulled at once """
+    plan = tmt.utils.Common(name='/plan', workdir=str(tmpdir))
+    plan.my_run = None
+    plan.data_directory = str(tmpdir.join('data'))
+    plugin = ExecuteInternal(Execute(plan, {}), {'name': 'default'})
+    pulled = []
+
+    def execute(command, **kwargs):
+        raise AssertionError(f"Unexpected command '{command}'.")
+
+    guest = SimpleNamespace(
+        name='default-0', localhost=False, push=lambda *args: None,
+        pull=lambda source, **kwargs: pulled.append(source), execute=execute)
+    tests = [
+        SimpleNamespace(name=f'/{name}', framework='shell')
+        for name in ['one', 'two', 'three']]
+
+    def execute_test(test, guest, progress, extra_environment):
+        plugin.data_path(test, 'data', full=True, create=True)
+        test.returncode = 1 if test.name == '/two' else 0
+
+    plugin.execute = execute_test
+    plugin.prepare_scripts = lambda guest: None
+    plugin.check = lambda test: tmt.Result(dict(result='pass'), test.name)
+    plugin._run_shard(guest, tests)
+    assert pulled == [[plugin.data_path(test, full=True)] for test in tests]
+
+
+def test_pull_plan_data_once(tmpdir):
+    """ Plan data are pulled from guests one by one after all shards """
+    plan = tmt.utils.Common(name='/plan', workdir=str(tmpdir))
+    plan.my_run = None
+    plan.data_directory = str(tmpdir.join('data'))
+    plugin = ExecuteInternal(Execute(plan, {}), {'name': 'default'})
+    plugin._results = []
+    events = []
+    guests = [
+        SimpleNamespace(
+            name=name, pull=lambda source, name=name: events.append(
+                (name, source)))
+        for name in ['one', 'two']]
+    tests = tests_with_durations('5m', '5m')
+
+    def run_shard(guest, tests, extra_environment=None):
+        events.append(guest.name)
+        return [tmt.Result(dict(result='pass'), test.name) for test in tests]
+
+    plugin.prepare_tests = lambda: tests
+    plugin._run_shard = run_shard
+    plugin._run_shards(guests)
+    assert sorted(events[:2]) == ['one', 'two']
+    assert events[2:] == [
+        ('one', plan.data_directory), ('two', plan.data_directory)]
+    assert [result.name for result in plugin.results()] == [
+        '/test/0', '/test/1']
+
+
+def test_parallel_header_once(tmpdir, monkeypatch):
+    """ Only the guest driving the shards executes the plugin """
+    plan = tmt.utils.Common(name='/plan', workdir=str(tmpdir))
+    plan.my_run = None
+    plugin = ExecuteInternal(
+        Execute(plan, {}), {'name': 'default', 'parallel': True})
+    guests = [SimpleNamespace(name=name, role='client') for name in 'ab']
+    started, executed = [], []
+    monkeypatch.setattr(
+        tmt.steps.execute.ExecutePlugin, 'go',
+        lambda self: started.append(True))
+    plugin._role_guests = lambda guest: guests
+    plugin._resume = lambda guests: None
+    plugin._run_shards = lambda guests: executed.append(guests)
+    for guest in guests:
+        plugin.go(guest)
+    assert started == [True]
+    assert executed == [guests]
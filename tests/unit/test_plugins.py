@@ -0,0 +1,18 @@
+# coding: utf-8
+
+import tmt.plugins
+import tmt.steps
+from tmt.steps import STEPS
+
+
+def test_manifest():
+    """ Plugin manifest matches methods implemented by native plugins """
+    tmt.plugins.explore()
+    for step in STEPS:
+        plugin = getattr(tmt.steps, step).__dict__[
+            f'{step.capitalize()}Plugin']
+        methods = {
+            method.name: method.class_.__module__.rsplit('.', 1)[1]
+            for method in plugin.methods()
+            if method.class_.__module__.startswith(f'tmt.steps.{step}.')}
+        assert methods == tmt.plugins.PLUGINS[step]
@@ -0,0 +1,44 @@
+# coding: utf-8
+
+from types import SimpleNamespace
+
+from tmt.steps.prepare import Prepare
+
+
+def prepare_step(worktree, data, guests):
+    """ Prepare step of a multihost plan with given guests """
+    step = Prepare.__new__(Prepare)
+    step.data = data
+    nothing = SimpleNamespace(requires=lambda: [], recommends=lambda: [])
+    step.plan = SimpleNamespace(
+        worktree=str(worktree), discover=nothing, prepare=nothing,
+        execute=nothing, report=nothing, finish=nothing,
+        provision=SimpleNamespace(
+            requires=lambda: [], is_multihost=True, guests=lambda: guests))
+    return step
+
+
+def test_fingerprint(tmpdir):
+    """ Fingerprint covers referenced files, ignores guest addresses """
+    tmpdir.join('setup.sh').write('echo one')
+    tmpdir.join('ansible', 'site.yml').write('- hosts: all', ensure=True)
+    tmpdir.join('rpms', 'one.rpm').write('one', ensure=True)
+    data = [
+        dict(how='shell', script=['bash ./setup.sh --quiet']),
+        dict(how='ansible', playbook='ansible/site.yml'),
+        dict(how='install', directory='rpms', package=['vim'])]
+    guest = SimpleNamespace(name='server', role='server', guest=None)
+    fingerprint = prepare_step(tmpdir, data, []).fingerprint()
+
+    # Guests provisioned later do not change the fingerprint
+    guest.guest = '192.168.0.1'
+    assert prepare_step(tmpdir, data, [guest]).fingerprint() == fingerprint
+
+    # Change of any referenced file does
+    for path in ['setup.sh', 'ansible/site.yml', 'rpms/one.rpm']:
+        tmpdir.join(path).write('changed')
+        changed = prepare_step(tmpdir, data, [guest]).fingerprint()
+        assert changed != fingerprint
+        fingerprint = changed
+    tmpdir.join('rpms', 'two.rpm').write('two')
+    assert prepare_step(tmpdir, data, []).fingerprint() != fingerprint
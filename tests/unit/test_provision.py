@@ -0,0 +1,154 @@
+# coding: utf-8
+
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import tmt
+import tmt.steps.provision
+from tmt.steps.provision import GuestAgent, GuestSsh
+
+
+class LocalGuest(GuestSsh):
+    """ Guest running the agent in a local shell instead of ssh """
+
+    def __init__(self, agent=None):
+        tmt.utils.Common.__init__(self)
+        self.guest = 'localhost'
+        self.user = 'root'
+        self._agent = agent
+
+    def _ssh_command(self, join=False):
+        return ['sh', '-c', 'eval "$2"', 'agent']
+
+    def _prepare_environment(self, execute_environment=None):
+        return dict(execute_environment or dict())
+
+
+def test_agent_execute():
+    """ Commands are executed in a single agent session """
+    guest = LocalGuest()
+    stdout, stderr = guest.execute('echo out; echo err >&2')
+    assert (stdout, stderr) == ('out\n', 'err\n')
+    process = guest._agent.process
+    stdout, stderr = guest.execute(
+        'echo $VALUE; pwd; echo err >&2', env=dict(VALUE='a b'), cwd='/',
+        join=True)
+    assert (stdout, stderr) == ('a b\n/\nerr\n', None)
+    assert guest._agent.process is process
+
+    with pytest.raises(tmt.utils.RunError) as error:
+        guest.execute('echo failed; exit 3')
+    assert error.value.returncode == 3
+    assert error.value.stdout == 'failed\n'
+
+    # Closed connection is reported as ssh does and the agent restarted
+    with pytest.raises(tmt.utils.RunError) as error:
+        guest.execute('kill $PPID')
+    assert error.value.returncode == 255
+    assert guest.execute('echo again') == ('again\n', '')
+    guest.stop()
+    assert guest._agent.process is None
+
+
+def test_agent_unsupported():
+    """ Agent is disabled when it cannot be started on the guest """
+    guest = LocalGuest()
+    guest._ssh_command = lambda join=False: ['sh', '-c', 'exit 1']
+    agent = GuestAgent(guest)
+    assert agent.execute('true') is None
+    assert not agent.supported
+
+
+def test_agent_banner():
+    """ Output printed by shell startup files is skipped """
+    guest = LocalGuest()
+    guest._ssh_command = lambda join=False: [
+        'sh', '-c', 'echo Welcome; echo :ready; eval "$2"', 'agent']
+    assert guest.execute('echo hi') == ('hi\n', '')
+    assert guest._agent.supported
+
+
+def test_agent_not_ready(monkeypatch):
+    """ Agent which does not become ready is stopped in time """
+    monkeypatch.setattr(tmt.steps.provision, 'AGENT_START_TIMEOUT', 0.5)
+    guest = LocalGuest()
+    guest._ssh_command = lambda join=False: [
+        'sh', '-c', 'echo Welcome; exec sleep 60', 'agent']
+    agent = GuestAgent(guest)
+    start = time.monotonic()
+    assert agent.execute('true') is None
+    assert time.monotonic() - start < 10
+    assert not agent.supported
+    assert agent.process is None
+
+
+def test_agent_closed_output(monkeypatch):
+    """ Finished session is detected even if its output stays open """
+    monkeypatch.setattr(tmt.steps.provision, 'AGENT_POLL_INTERVAL', 0.1)
+    guest = LocalGuest()
+    # The background process inherits the output of the session
+    guest._ssh_command = lambda join=False: [
+        'sh', '-c', 'sleep 10 & eval "$2"', 'agent']
+    assert guest.execute('echo hi') == ('hi\n', '')
+    start = time.monotonic()
+    with pytest.raises(tmt.utils.RunError) as error:
+        guest.execute('kill $PPID')
+    assert error.value.returncode == 255
+    assert time.monotonic() - start < 5
+
+
+def test_push_changes(tmpdir):
+    """ Only changed files are pushed once the workdir was pushed """
+    guest = LocalGuest()
+    workdir = tmpdir.mkdir('workdir')
+    workdir.join('same').write('same')
+    workdir.join('changed').write('old')
+    workdir.join('removed').write('removed')
+    guest._pushed = guest._workdir_manifest(str(workdir))
+
+    workdir.join('changed').write('new content')
+    workdir.join('removed').remove()
+    workdir.mkdir('new').join('file').write('new')
+    pushed, executed = [], []
+
+    def push(source=None, destination=None, options=None):
+        with open(options[options.index('--files-from') + 1]) as files:
+            pushed.extend(files.read().split())
+
+    guest.push = push
+    guest.execute = lambda command: executed.append(command)
+    guest._push_changes(guest._workdir_manifest(str(workdir)))
+    assert pushed == [
+        str(workdir.join(name)) for name in ['changed', 'new', 'new/file']]
+    assert executed == [['rm', '-rf', '--', str(workdir.join('removed'))]]
+    assert sorted(guest._pushed) == pushed + [str(workdir.join('same'))]
+
+
+def test_pulled_not_pushed(tmpdir):
+    """ Files pulled from the guest are not pushed back """
+    guest = LocalGuest()
+    workdir = tmpdir.mkdir('workdir')
+    workdir.join('data', 'old').write('old', ensure=True)
+    guest.parent = tmt.utils.Common()
+    guest.parent.plan = SimpleNamespace(workdir=str(workdir))
+    guest._pushed = guest._workdir_manifest(str(workdir))
+
+    def run(command):
+        # Pulled files get a new modification time
+        workdir.join('data', 'old').write('new')
+        workdir.join('data', 'logs', 'output.txt').write('log', ensure=True)
+        workdir.join('local').write('local')
+
+    guest.run = run
+    guest.pull(source=str(workdir.join('data')))
+    pushed = []
+
+    def push(source=None, destination=None, options=None):
+        with open(options[options.index('--files-from') + 1]) as files:
+            pushed.extend(files.read().split())
+
+    guest.push = push
+    guest._push_changes(guest._workdir_manifest(str(workdir)))
+    assert pushed == [str(workdir.join('local'))]
@@ -0,0 +1,94 @@
+# coding: utf-8
+
+import os
+
+import tmt.steps.provision.testcloud as testcloud
+from tmt.steps.provision.testcloud import GuestPool
+
+
+class FakeGuest(object):
+    """ Guest with the attributes used by the pool """
+
+    def __init__(self, key, instance_name, memory=2048):
+        self.key = key
+        self.instance_name = instance_name
+        self.image_url = 'file:///images/fedora.qcow2'
+        self.user = 'root'
+        self.memory = memory
+        self.disk = 10
+        self.connection = 'session'
+        self.arch = 'x86_64'
+
+    def save(self):
+        return dict(
+            role='server', pool=2, key=self.key,
+            instance_name=self.instance_name, guest='127.0.0.1')
+
+
+def test_guest_pool(tmpdir, monkeypatch):
+    """ Guests are taken only once and only for the same configuration """
+    monkeypatch.setattr(testcloud, 'TESTCLOUD_POOL', str(tmpdir.join('pool')))
+    key = tmpdir.join('id_ecdsa')
+    key.write('private')
+    pool = GuestPool(FakeGuest(str(key), 'one'))
+    assert pool.take() is None
+
+    assert pool.put(FakeGuest(str(key), 'one'), 2)
+    assert pool.put(FakeGuest(str(key), 'two'), 2)
+    # Surplus guests are not stored
+    assert not pool.put(FakeGuest(str(key), 'three'), 2)
+    assert pool.ready() == ['one', 'two']
+    assert GuestPool(FakeGuest(str(key), 'other', memory=4096)).ready() == []
+
+    data = pool.take()
+    assert data['instance_name'] == 'one'
+    assert 'role' not in data and 'pool' not in data
+    # The key is kept in the pool, outside of the run workdir
+    assert os.path.dirname(data['key']) == pool.directory
+    assert open(data['key']).read() == 'private'
+    assert pool.ready() == ['two']
+    assert pool.take()['instance_name'] == 'two'
+    assert pool.take() is None
+
+
+def test_guest_pool_booting(tmpdir, monkeypatch):
+    """ Guests being booted for the pool are counted as well """
+    monkeypatch.setattr(testcloud, 'TESTCLOUD_POOL', str(tmpdir.join('pool')))
+    key = tmpdir.join('id_ecdsa')
+    key.write('private')
+    pool = GuestPool(FakeGuest(str(key), 'one'))
+    assert pool.put(FakeGuest(str(key), 'one'), 3)
+    placeholders = pool.reserve(3)
+    assert len(placeholders) == 2
+    assert pool.booting() == sorted(placeholders)
+    # Nothing more to boot while the previous boots are in progress
+    assert pool.reserve(3) == []
+
+    # A booted guest takes the place of its placeholder
+    assert pool.put(FakeGuest(str(key), 'two'), 3, placeholders[0])
+    assert pool.ready() == ['one', 'two']
+    # Recycled guest does not fit while the other one is booting
+    assert not pool.put(FakeGuest(str(key), 'three'), 3)
+    pool.release(placeholders[1])
+    assert pool.booting() == []
+    assert len(pool.reserve(3)) == 1
+
+    # Placeholders of interrupted boots expire
+    for placeholder in pool.booting():
+        os.utime(placeholder, (0, 0))
+    assert pool.booting() == []
+    assert not any(name.endswith('.booting') for name in os.listdir(
+        pool.directory))
+
+
+def test_snapshot_path():
+    """ Snapshots are specific to both guest config and preparations """
+    snapshot_path = testcloud.GuestTestcloud._snapshot_path
+    guest = FakeGuest('key', 'one')
+    path = snapshot_path(guest, 'prepared')
+    assert os.path.dirname(path) == testcloud.TESTCLOUD_SNAPSHOTS
+    assert path.endswith('.qcow2')
+    assert snapshot_path(FakeGuest('other', 'two'), 'prepared') == path
+    assert snapshot_path(guest, 'different') != path
+    assert snapshot_path(FakeGuest('key', 'one', memory=4096), 'prepared') \
+        != path
@@ -1,8 +1,13 @@
 # coding: utf-8
 
+import json
 import os
 import re
+import shutil
+import tempfile
+import threading
 import unittest
+import unittest.mock
 
 import pytest
 
@@ -117,6 +122,41 @@ def test_duration_to_seconds():
         duration_to_seconds('bad')
 
 
+def test_buffered_output(capsys):
+    """ Messages are printed as a block when leaving the context """
+    common = Common()
+    with tmt.utils.buffered_output():
+        common.info('first')
+        common.warn('second')
+        captured = capsys.readouterr()
+        assert captured.out == captured.err == ''
+    captured = capsys.readouterr()
+    assert captured.out == 'first\n'
+    assert 'second' in captured.err
+    # Output is not buffered outside of the context
+    common.info('third')
+    assert capsys.readouterr().out == 'third\n'
+
+
+def test_buffered_output_nested(capsys):
+    """ Worker thread output is handed over to the parent buffer """
+    common = Common()
+    with tmt.utils.buffered_output():
+        common.info('first')
+        parent = tmt.utils.output_buffer()
+
+        def worker():
+            with tmt.utils.buffered_output(parent=parent):
+                common.info('second')
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        common.info('third')
+        assert capsys.readouterr().out == ''
+    assert capsys.readouterr().out == 'first\nsecond\nthird\n'
+
+
 class test_structured_field(unittest.TestCase):
     """ Self Test """
 
@@ -410,6 +450,12 @@ class test_structured_field(unittest.TestCase):
 
 class Run(unittest.TestCase):
 
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
     def test_interactive_not_joined(self):
         stdout, stderr = Common()._run(
             "echo abc; echo def >2", shell=True, interactive=True, cwd=".", env={}, log=None)
@@ -457,6 +503,26 @@ class Run(unittest.TestCase):
         self.assertIn("n n", stdout)
         self.assertEqual(len(stdout), 200000)
 
+    def test_output_file(self):
+        output_file = os.path.join(self.tmpdir, 'output.txt')
+        with unittest.mock.patch('tmt.utils.OUTPUT_TAIL_SIZE', 100):
+            with self.assertRaises(tmt.utils.RunError) as error:
+                Common()._run(
+                    "seq 1 1000; echo failed >&2; exit 1",
+                    shell=True,
+                    cwd=".",
+                    env={},
+                    log=None,
+                    join=True,
+                    output_file=output_file)
+        # Only the tail is kept in memory, the file contains everything
+        self.assertTrue(error.exception.stdout.endswith("1000\nfailed\n"))
+        self.assertLessEqual(len(error.exception.stdout), 100)
+        with open(output_file) as output:
+            content = output.read()
+        self.assertTrue(content.startswith("1\n2\n"))
+        self.assertTrue(content.endswith("1000\nfailed\n"))
+
 
 def test_get_distgit_handler():
     for wrong_remotes in [[], ["blah"]]:
@@ -614,3 +680,202 @@ class Test_validate_git_status:
 
         assert validation_result == (
             False, 'Not pushed changes in .fmf/version main.fmf')
+
+
+def test_events(tmpdir):
+    """ Events are stored with names of the objects they belong to """
+    class Top(Common):
+        _options = dict(events=True)
+
+    class Step(Common):
+        _event_field = 'step'
+
+    class Guest(Common):
+        _event_field = 'guest'
+
+    top = Top(workdir=str(tmpdir.join('run')))
+    step = Step(parent=top, name='execute')
+    guest = Guest(parent=step, name='default')
+    guest.debug('message')
+    with step.timed_event('test', test='/one') as finish:
+        finish['returncode'] = 1
+    with open(os.path.join(top.workdir, 'log.txt')) as log:
+        assert log.read().endswith(' message\n')
+    with open(os.path.join(top.workdir, 'events.jsonl')) as events:
+        events = [json.loads(line) for line in events]
+    assert [event['event'] for event in events] == [
+        'message', 'test-start', 'test-finish']
+    assert events[0]['level'] == 'debug'
+    assert events[0]['message'] == 'message'
+    assert events[0]['step'] == 'execute'
+    assert events[0]['guest'] == 'default'
+    assert events[2]['test'] == '/one'
+    assert events[2]['returncode'] == 1
+    assert events[2]['duration'] >= 0
+    assert 'returncode' not in events[1]
+
+
+def test_timed(tmpdir):
+    """ Nested calls of timed methods are recorded once """
+    class Guest(Common):
+        _event_field = 'guest'
+
+        @tmt.utils.timed('guest-push')
+        def push(self, nested=False):
+            if nested:
+                self.push()
+
+    top = Common(workdir=str(tmpdir.join('run')))
+    guest = Guest(parent=top, name='default')
+    guest.push(nested=True)
+    guest.push()
+    timings = top.timings()
+    assert [span['span'] for span in timings] == ['guest-push'] * 2
+    assert timings[0]['guest'] == 'default'
+    assert timings[0]['duration'] >= 0
+    assert guest.timings() == timings
+
+
+def test_timed_parent(tmpdir):
+    """ Spans are linked to the enclosing ones, across threads as well """
+    top = Common(workdir=str(tmpdir.join('run')))
+    step = Common(parent=top, name='step')
+
+    def phase():
+        with step.timed_event('phase'):
+            pass
+
+    with top.timed_event('run'):
+        with step.timed_event('step'):
+            thread = threading.Thread(
+                target=tmt.utils.in_current_span(phase), name='worker')
+            thread.start()
+            thread.join()
+    timings = {span['span']: span for span in top.timings()}
+    assert 'parent-id' not in timings['run']
+    assert timings['step']['parent-id'] == timings['run']['id']
+    assert timings['phase']['parent-id'] == timings['step']['id']
+    assert timings['phase']['thread'] == 'worker'
+
+
+def test_timed_concurrent(tmpdir):
+    """ Spans of the same object in concurrent threads do not mix """
+    top = Common(workdir=str(tmpdir.join('run')))
+    step = Common(parent=top, name='step')
+    barrier = threading.Barrier(2)
+
+    def phase():
+        with step.timed_event('phase'):
+            # Both threads have their span of the step in progress
+            barrier.wait()
+            with step.timed_event('test'):
+                barrier.wait()
+
+    threads = [
+        threading.Thread(target=phase, name=f'worker-{index}')
+        for index in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    phases = {
+        span['thread']: span for span in top.timings()
+        if span['span'] == 'phase'}
+    for span in top.timings():
+        if span['span'] == 'test':
+            assert span['parent-id'] == phases[span['thread']]['id']
+        else:
+            assert 'parent-id' not in span
+
+
+def test_git_cache(tmpdir):
+    """ Repositories are cloned from the mirror, updated when stale """
+    origin = str(tmpdir.join('origin'))
+    run(['git', 'init', '--quiet', '--initial-branch', 'main', origin])
+
+    def commit(content):
+        with open(os.path.join(origin, 'file'), 'w') as file:
+            file.write(content)
+        run(['git', 'add', 'file'], cwd=origin)
+        run(['git', '-c', 'user.name=tmt', '-c', 'user.email=tmt@localhost',
+             'commit', '--quiet', '--message', content], cwd=origin)
+        return run(['git', 'rev-parse', 'HEAD'], cwd=origin).stdout.strip()
+
+    commit('first')
+    directory = str(tmpdir.join('cache'))
+    cache = tmt.utils.GitCache(Common(), directory=directory)
+    cache.clone(origin, str(tmpdir.join('first')))
+    assert tmpdir.join('first', 'file').read() == 'first'
+    assert tmt.utils.default_branch(str(tmpdir.join('first'))) == 'main'
+    assert run(
+        ['git', 'remote', 'get-url', 'origin'],
+        cwd=str(tmpdir.join('first'))).stdout.strip() == origin
+
+    # Fresh mirror is not updated unless the ref is missing
+    second = commit('second')
+    cache.clone(origin, str(tmpdir.join('fresh')))
+    assert tmpdir.join('fresh', 'file').read() == 'first'
+    cache.clone(origin, str(tmpdir.join('second')), ref=second)
+    run(['git', 'checkout', '--quiet', second], cwd=str(tmpdir.join('second')))
+    assert tmpdir.join('second', 'file').read() == 'second'
+
+    # Update the mirror always if requested
+    third = commit('third')
+    cache.clone(origin, str(tmpdir.join('third')), update=True)
+    assert run(
+        ['git', 'rev-parse', 'HEAD'],
+        cwd=str(tmpdir.join('third'))).stdout.strip() == third
+
+    # Branches are fetched as a remote from the mirror
+    fourth = commit('fourth')
+    cache.fetch(origin, str(tmpdir.join('first')), 'reference', update=True)
+    assert run(
+        ['git', 'rev-parse', 'reference/main'],
+        cwd=str(tmpdir.join('first'))).stdout.strip() == fourth
+
+    # Known repositories are available offline
+    shutil.rmtree(origin)
+    cache = tmt.utils.GitCache(Common(), directory=directory, ttl=0)
+    cache.clone(origin, str(tmpdir.join('offline')), update=True)
+    assert tmpdir.join('offline', 'file').read() == 'fourth'
+
+    # Least recently used mirrors are evicted
+    cache = tmt.utils.GitCache(Common(), directory=directory, size=0)
+    cache.evict()
+    assert not os.path.exists(cache.path(origin))
+
+
+@pytest.mark.parametrize('method', tmt.utils.COPY_METHODS)
+def test_copy_tree(tmpdir, method):
+    """ Copy directory tree using all available methods """
+    source = tmpdir.join('source')
+    source.join('tests', 'test.fmf').write('test: ./test.sh', ensure=True)
+    source.join('build', 'output.bin').write('binary', ensure=True)
+    source.join('untracked').write('new')
+    source.join('.gitignore').write('build\n')
+    source.join('link').mksymlinkto('tests')
+    run(['git', 'init', '--quiet', str(source)])
+    run(['git', 'add', 'tests', 'link', '.gitignore'], cwd=str(source))
+    destination = tmpdir.join('destination')
+
+    if method == 'reflink':
+        try:
+            tmt.utils.copy_tree(str(source), str(destination), method=method)
+        except shutil.Error:
+            pytest.skip('Reflinks not supported by the filesystem.')
+    else:
+        tmt.utils.copy_tree(str(source), str(destination), method=method)
+    assert destination.join('tests', 'test.fmf').read() == 'test: ./test.sh'
+    assert destination.join('untracked').read() == 'new'
+    assert destination.join('link').readlink() == 'tests'
+    assert destination.join('build').exists() == (method != 'git')
+    assert destination.join('.git').exists() == (method != 'git')
+    assert os.path.samefile(
+        str(source.join('untracked')),
+        str(destination.join('untracked'))) == (method == 'hardlink')
+
+
+def test_copy_tree_invalid(tmpdir):
+    """ Invalid copy method is reported """
+    with pytest.raises(tmt.utils.GeneralError, match='Invalid copy method'):
+        tmt.utils.copy_tree(str(tmpdir), str(tmpdir.join('copy')), 'magic')
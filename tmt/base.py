@@ -1,14 +1,17 @@
 
 """ Base Metadata Classes """
 
-import copy
+import concurrent.futures
 import dataclasses
+import datetime
 import functools
+import json
 import os
 import re
 import shutil
 import subprocess
 import time
+import traceback
 from typing import List, Optional, Tuple
 
 import click
@@ -20,6 +23,7 @@ from ruamel.yaml.error import MarkedYAMLError
 
 import tmt.export
 import tmt.identifier
+import tmt.plugins
 import tmt.steps
 import tmt.steps.discover
 import tmt.steps.execute
@@ -40,6 +44,13 @@ DEFAULT_ORDER = 50
 # How many already existing lines should tmt run --follow show
 FOLLOW_LINES = 10
 
+# How many of the slowest tests should tmt run --profile show
+PROFILE_TESTS = 5
+
+# Guest operations and other spans summarized by tmt run --profile
+PROFILE_SPANS = [
+    'guest-execute', 'guest-push', 'guest-pull', 'library-fetch']
+
 # Obsoleted test keys
 OBSOLETED_TEST_KEYS = "relevancy coverage".split()
 
@@ -153,6 +164,26 @@ class Core(tmt.utils.Common):
         """ Node name """
         return self.name
 
+    @classmethod
+    def _filter_metadata(cls, node):
+        """
+        Node metadata as used by filters, without creating the object
+
+        Apply the same defaults and conversions as the initialization
+        does so that the result matches the _metadata attribute of the
+        object. Values are not validated.
+        """
+        data = node.data.copy()
+        data.update(dict(
+            (key, node.get(key)) for key in cls._keys if key != 'adjust'))
+        data['name'] = node.name
+        if data['enabled'] is None:
+            data['enabled'] = True
+        if data['order'] is None:
+            data['order'] = DEFAULT_ORDER
+        data['link'] = Link(data['link']).get()
+        return data
+
     def _update_metadata(self):
         """ Update the _metadata attribute """
         self._metadata.update(self.export(format_='dict'))
@@ -389,18 +420,7 @@ class Test(Core):
             raise tmt.utils.SpecificationError(
                 f"The 'test' attribute in '{self.name}' must be defined.")
 
-        # Path defaults to the directory where metadata are stored or to
-        # the root '/' if fmf metadata were not stored on the filesystem
-        try:
-            directory = os.path.dirname(self.node.sources[-1])
-            relative_path = os.path.relpath(directory, self.node.root)
-            if relative_path == '.':
-                default_path = '/'
-            else:
-                default_path = os.path.join('/', relative_path)
-        except (AttributeError, IndexError):
-            default_path = '/'
-        self._check('path', expected=str, default=default_path)
+        self._check('path', expected=str, default=self._default_path(node))
 
         # Check that lists are lists or strings, listify if needed
         for key in ['component', 'contact', 'require', 'recommend', 'tag']:
@@ -411,7 +431,7 @@ class Test(Core):
         # able to detect if the test has explicitly set the framework.
         self._check('framework', expected=str, default=None)
         if self.framework == 'beakerlib':
-            self.require.append('beakerlib')
+            self.require = self.require + ['beakerlib']
 
         # Check that environment is a dictionary
         self._check('environment', expected=dict, default={})
@@ -425,6 +445,42 @@ class Test(Core):
 
         self._update_metadata()
 
+    @staticmethod
+    def _default_path(node):
+        """
+        Path defaults to the directory where metadata are stored or to
+        the root '/' if fmf metadata were not stored on the filesystem
+        """
+        try:
+            directory = os.path.dirname(node.sources[-1])
+            relative_path = os.path.relpath(directory, node.root)
+        except (AttributeError, IndexError):
+            return '/'
+        if relative_path == '.':
+            return '/'
+        return os.path.join('/', relative_path)
+
+    @classmethod
+    def _filter_metadata(cls, node):
+        """ Node metadata as used by filters, see Core._filter_metadata """
+        data = super()._filter_metadata(node)
+        for key in ['component', 'contact', 'require', 'recommend', 'tag']:
+            data[key] = [] if data[key] is None else tmt.utils.listify(
+                data[key])
+        if data['framework'] == 'beakerlib':
+            data['require'] = data['require'] + ['beakerlib']
+        if data['path'] is None:
+            data['path'] = cls._default_path(node)
+        data['environment'] = dict(
+            (key, str(value))
+            for key, value in (data['environment'] or {}).items())
+        defaults = dict(
+            duration=DEFAULT_TEST_DURATION_L1, manual=False, result='respect')
+        for key, default in defaults.items():
+            if data[key] is None:
+                data[key] = default
+        return data
+
     @staticmethod
     def overview(tree):
         """ Show overview of available tests """
@@ -630,6 +686,8 @@ class Plan(Core):
         'gate',
         ]
 
+    _event_field = 'plan'
+
     def __init__(self, node, run=None):
         """ Initialize the plan """
         super().__init__(node, parent=run)
@@ -736,11 +794,18 @@ class Plan(Core):
             os.makedirs(self.worktree, exist_ok=True)
             return
 
-        # Sync metadata root to the worktree
-        self.debug(f"Sync the worktree to '{self.worktree}'.", level=2)
-        self.run([
-            "rsync", "-ar", "--exclude", ".git",
-            f"{tree_root}/", self.worktree])
+        # Sync metadata root to the existing worktree
+        if os.path.isdir(self.worktree):
+            self.debug(f"Sync the worktree to '{self.worktree}'.", level=2)
+            self.run([
+                "rsync", "-ar", "--exclude", ".git",
+                f"{tree_root}/", self.worktree])
+            return
+
+        # Copy metadata root using copy-on-write clones where possible
+        self.debug(f"Copy the worktree to '{self.worktree}'.", level=2)
+        tmt.utils.copy_tree(
+            tree_root, self.worktree, ignore=shutil.ignore_patterns('.git'))
 
     def _initialize_data_directory(self):
         """
@@ -1034,7 +1099,8 @@ class Plan(Core):
         try:
             abort = False
             for step in self.steps(skip=['finish']):
-                step.go()
+                with step.timed_event('step'):
+                    step.go()
                 # Finish plan if no tests found (except dry mode)
                 if (step.name == 'discover' and not step.tests()
                         and not self.opt('dry')):
@@ -1046,7 +1112,8 @@ class Plan(Core):
         # Make sure we run 'finish' step always if enabled
         finally:
             if not abort and self.finish.enabled:
-                self.finish.go()
+                with self.finish.timed_event('step'):
+                    self.finish.go()
 
     def export(self, format_='yaml'):
         """
@@ -1286,14 +1353,176 @@ class Story(Core):
                     len(invalid_keys) == 0])
 
 
+class FilterIndex(object):
+    """
+    Inverted index of node metadata used for filtering
+
+    Metadata of each fmf node, normalized as by the given node class,
+    are converted into lists of strings once, in the same way as
+    fmf.utils.filter() does, and values of the common keys are mapped
+    to names of nodes which contain them. Filters are evaluated as set
+    operations with regular expressions matched only against distinct
+    values. Remaining keys are checked node by node.
+    """
+
+    # Keys with a few distinct values shared by many nodes
+    _indexed_keys = ['tag', 'tier', 'component', 'contact', 'enabled']
+
+    def __init__(self, cls):
+        """ Initialize an empty index for nodes of given class """
+        self._cls = cls
+        # Normalized metadata of each node
+        self._data = dict()
+        # Names of nodes which define given key
+        self._keys = dict()
+        # Indexed key -> value -> names of nodes
+        self._index = dict()
+        # Link (relation, target) -> names of nodes
+        self._links = dict()
+
+    def __contains__(self, name):
+        """ Whether the node with given name is already indexed """
+        return name in self._data
+
+    def add(self, nodes, metadata=None):
+        """
+        Add fmf nodes which are not indexed yet
+
+        Already normalized metadata can be provided as a dictionary
+        indexed by node name to prevent normalizing them again.
+        """
+        metadata = metadata or dict()
+        for node in nodes:
+            if node.name in self._data:
+                continue
+            if node.name not in metadata:
+                metadata[node.name] = self._cls._filter_metadata(node)
+            data = dict()
+            for key, value in metadata[node.name].items():
+                # Add a lowercase version of bool variables for filtering
+                if isinstance(value, bool):
+                    value = [value, str(value).lower()]
+                if isinstance(value, list):
+                    data[key] = [str(item) for item in value]
+                else:
+                    data[key] = [str(value)]
+                self._keys.setdefault(key, set()).add(node.name)
+                if key in self._indexed_keys:
+                    values = self._index.setdefault(key, dict())
+                    for item in data[key]:
+                        values.setdefault(item, set()).add(node.name)
+            self._data[node.name] = data
+            try:
+                for link in metadata[node.name]['link']:
+                    relation = list(set(link.keys()) - set(['note']))[0]
+                    target = link[relation]
+                    # Links to fmf ids cannot be matched by a regexp
+                    if isinstance(target, str):
+                        self._links.setdefault(
+                            (relation, target), set()).add(node.name)
+            except BaseException:
+                # Handle broken link as not matching
+                pass
+
+    def _match(self, dimension, atom):
+        """ Names of nodes with a value of dimension matching the atom """
+        pattern = re.compile(f"^{atom}$")
+        if dimension in self._indexed_keys:
+            names = set()
+            for value, value_names in self._index.get(dimension, {}).items():
+                if pattern.match(value):
+                    names.update(value_names)
+            return names
+        return set(
+            name for name in self._keys.get(dimension, [])
+            if any([pattern.match(value)
+                    for value in self._data[name][dimension]]))
+
+    def _filter(self, filter_, names):
+        """ Names of nodes matching the filter, see fmf.utils.filter() """
+        if filter_ is None or filter_ == '':
+            return names
+        matched = set()
+        missing = set()
+        for clause in re.split(r"\s*(?<!\\)\|\s*", filter_):
+            clause = re.sub(r"\\\|", "|", clause)
+            clause_names = set(names)
+            for literal in re.split(r"\s*(?<!\\)&\s*", clause):
+                literal = re.sub(r"\\&", "&", literal)
+                parsed = re.match(r"^([^:]*)\s*:\s*(.*)$", literal)
+                # Node name search is not supported, filter fails
+                if not parsed:
+                    return set()
+                dimension, value = parsed.groups()
+                # Handle missing attributes as if filter failed
+                having = self._keys.get(dimension, set())
+                missing.update(names - having)
+                # At least one of comma-separated values must match
+                literal_names = set()
+                for atom in re.split(r"\s*,\s*", value):
+                    if atom.startswith('-'):
+                        literal_names.update(
+                            having - self._match(dimension, atom[1:]))
+                    else:
+                        literal_names.update(self._match(dimension, atom))
+                clause_names &= literal_names
+            matched.update(clause_names)
+        return matched - missing
+
+    def _link(self, link_object):
+        """ Names of nodes which contain specified link """
+        if isinstance(link_object, Link):
+            relation = list(set(link_object.keys()) - set(['note']))[0]
+            target = link_object[relation]
+        else:
+            # User text input
+            parts = link_object.split(':', maxsplit=1)
+            if len(parts) == 1:
+                relation, target = ".*", parts[0]
+            else:
+                relation, target = parts
+        names = set()
+        for (candidate_relation, candidate_target), candidate_names \
+                in self._links.items():
+            try:
+                if (re.search(relation, candidate_relation)
+                        and re.search(target, candidate_target)):
+                    names.update(candidate_names)
+            except re.error:
+                # Handle invalid expression as not matching
+                break
+        return names
+
+    def select(self, names, filters, links):
+        """ Names of nodes matching all filters and any of the links """
+        selected = set(names)
+        for filter_ in filters:
+            selected = self._filter(filter_, selected)
+        # Links are in OR relation
+        if links:
+            linked = set()
+            for link_ in links:
+                linked.update(self._link(link_))
+            selected &= linked
+        return selected
+
+
 class Tree(tmt.utils.Common):
     """ Test Metadata Tree """
 
-    def __init__(self, path='.', tree=None, context=None):
-        """ Initialize tmt tree from directory path or given fmf tree """
+    def __init__(self, path='.', tree=None, context=None, cache=False):
+        """
+        Initialize tmt tree from directory path or given fmf tree
+
+        Use cache=True to store the adjusted fmf tree in the persistent
+        cache and to reuse it when the metadata files have not changed.
+        """
         self._path = path
         self._tree = tree
         self._custom_context = context
+        self._cache = cache
+        # Filter index for each node class, built on the first use
+        self._filter_indexes = dict()
 
     def _fmf_context(self):
         """ Use custom fmf context if provided, default otherwise """
@@ -1301,56 +1530,63 @@ class Tree(tmt.utils.Common):
             return self._custom_context
         return super()._fmf_context()
 
-    def _filters_conditions(self, nodes, filters, conditions, links, excludes):
-        """ Apply filters and conditions, return pruned nodes """
-        result = []
-        for node in nodes:
-            filter_vars = copy.deepcopy(node._metadata)
-            cond_vars = node._metadata
-            # Add a lowercase version of bool variables for filtering
-            bool_vars = {
-                key: [value, str(value).lower()]
-                for key, value in filter_vars.items()
-                if isinstance(value, bool)}
-            filter_vars.update(bool_vars)
-            # Conditions
-            try:
-                if not all([fmf.utils.evaluate(condition, cond_vars, node)
+    def _filters_conditions(
+            self, nodes, cls, filters, conditions, links, excludes, **kwargs):
+        """
+        Apply filters and conditions, return pruned objects
+
+        Selection works with fmf nodes and their metadata normalized by
+        the given class. Objects of the class (created with provided
+        keyword arguments) are initialized only for selected nodes.
+        """
+        # Exclude
+        excludes = [re.compile(expr) for expr in excludes]
+        nodes = [
+            node for node in nodes
+            if not any([expr.search(node.name) for expr in excludes])]
+        metadata = dict()
+
+        # Conditions
+        if conditions:
+            selected = []
+            for node in nodes:
+                metadata[node.name] = cls._filter_metadata(node)
+                try:
+                    if not all([
+                            fmf.utils.evaluate(
+                                condition, metadata[node.name], node)
                             for condition in conditions]):
+                        continue
+                except fmf.utils.FilterError:
+                    # Handle missing attributes as if condition failed
                     continue
-            except fmf.utils.FilterError:
-                # Handle missing attributes as if condition failed
-                continue
-            except Exception as error:
-                raise tmt.utils.GeneralError(
-                    f"Invalid --condition raised exception: {error}")
-            # Filters
-            try:
-                if not all([fmf.utils.filter(filter_, filter_vars, regexp=True)
-                            for filter_ in filters]):
-                    continue
-            except fmf.utils.FilterError:
-                # Handle missing attributes as if filter failed
-                continue
-            # Links
-            try:
-                # Links are in OR relation
-                if links and all([not node.has_link(link_)
-                                 for link_ in links]):
-                    continue
-            except BaseException:
-                # Handle broken link as not matching
-                continue
-            # Exclude
-            if any([node for expr in excludes if re.search(expr, node.name)]):
-                continue
-            result.append(node)
-        return result
+                except Exception as error:
+                    raise tmt.utils.GeneralError(
+                        f"Invalid --condition raised exception: {error}")
+                selected.append(node)
+            nodes = selected
+
+        # Filters and links are looked up in the index
+        if nodes and (filters or links):
+            index = self._filter_indexes.setdefault(cls, FilterIndex(cls))
+            index.add(nodes, metadata)
+            selected = index.select(
+                set(node.name for node in nodes), filters, links)
+            nodes = [node for node in nodes if node.name in selected]
+
+        return [cls(node, **kwargs) for node in nodes]
 
     @property
     def tree(self):
         """ Initialize tree only when accessed """
         if self._tree is None:
+            # Use the cached tree if there were no changes
+            cache = None
+            if self._cache:
+                cache = tmt.utils.TreeCache(self._path, self._fmf_context())
+                self._tree = cache.load()
+                if self._tree is not None:
+                    return self._tree
             try:
                 self._tree = fmf.Tree(self._path)
             except fmf.utils.RootError:
@@ -1361,11 +1597,14 @@ class Tree(tmt.utils.Common):
                 raise tmt.utils.GeneralError(f"Invalid yaml syntax: {error}")
             # Adjust metadata for current fmf context
             self._tree.adjust(fmf.context.Context(**self._fmf_context()))
+            if cache:
+                cache.save(self._tree)
         return self._tree
 
     @tree.setter
     def tree(self, new_tree):
         self._tree = new_tree
+        self._filter_indexes = dict()
 
     @property
     def root(self):
@@ -1393,27 +1632,22 @@ class Tree(tmt.utils.Common):
                 node for node in nodes
                 if any([re.search(name, node.name) for name in names])]
 
-        # First let's build the list of test objects based on keys & names.
+        def select(names):
+            """ Select matching nodes, create and sort test objects """
+            nodes = name_filter(self.tree.prune(keys=keys, names=names))
+            tests = self._filters_conditions(
+                nodes, Test, filters, conditions, links, excludes)
+            return sorted(tests, key=lambda test: test.order)
+
         # If duplicate test names are allowed, match test name/regexp
         # one-by-one and preserve the order of tests within a plan.
         if not unique and names:
             tests = []
             for name in names:
-                selected_tests = [
-                    Test(test) for test
-                    in name_filter(self.tree.prune(keys=keys, names=[name]))]
-                tests.extend(
-                    sorted(selected_tests, key=lambda test: test.order))
+                tests.extend(select([name]))
+            return tests
         # Otherwise just perform a regular key/name filtering
-        else:
-            selected_tests = [
-                Test(test) for test
-                in name_filter(self.tree.prune(keys=keys, names=names))]
-            tests = sorted(selected_tests, key=lambda test: test.order)
-
-        # Apply filters & conditions
-        return self._filters_conditions(
-            tests, filters, conditions, links, excludes)
+        return select(names)
 
     def plans(self, keys=None, names=None, filters=None, conditions=None,
               run=None, links=None, excludes=None):
@@ -1426,13 +1660,11 @@ class Tree(tmt.utils.Common):
         links = (links or []) + list(Plan._opt('links', []))
         excludes = (excludes or []) + list(Plan._opt('exclude', []))
 
-        # Build the list, convert to objects, sort and filter
-        plans = [
-            Plan(plan, run=run) for plan
-            in self.tree.prune(keys=keys, names=names)]
-        return self._filters_conditions(
-            sorted(plans, key=lambda plan: plan.order),
-            filters, conditions, links, excludes)
+        # Build the list, filter, convert to objects and sort
+        plans = self._filters_conditions(
+            self.tree.prune(keys=keys, names=names),
+            Plan, filters, conditions, links, excludes, run=run)
+        return sorted(plans, key=lambda plan: plan.order)
 
     def stories(self, keys=None, names=None, filters=None, conditions=None,
                 whole=False, links=None, excludes=None):
@@ -1445,13 +1677,11 @@ class Tree(tmt.utils.Common):
         links = (links or []) + list(Story._opt('links', []))
         excludes = (excludes or []) + list(Story._opt('exclude', []))
 
-        # Build the list, convert to objects, sort and filter
-        stories = [
-            Story(story) for story
-            in self.tree.prune(keys=keys, names=names, whole=whole)]
-        return self._filters_conditions(
-            sorted(stories, key=lambda story: story.order),
-            filters, conditions, links, excludes)
+        # Build the list, filter, convert to objects and sort
+        stories = self._filters_conditions(
+            self.tree.prune(keys=keys, names=names, whole=whole),
+            Story, filters, conditions, links, excludes)
+        return sorted(stories, key=lambda story: story.order)
 
     @staticmethod
     def init(path, template, force, **kwargs):
@@ -1528,6 +1758,7 @@ class Run(tmt.utils.Common):
         self._plans = None
         self._environment_from_workdir = dict()
         self._environment_from_options = None
+        self._failed_plans = []
         self.remove = self.opt('remove')
 
     def _use_default_plan(self):
@@ -1692,6 +1923,10 @@ class Run(tmt.utils.Common):
         if self.remove and self.plans[0].finish.enabled:
             self._workdir_cleanup(self.workdir)
 
+        # Plans interrupted by an error make the whole run an error
+        if self._failed_plans:
+            raise SystemExit(2)
+
         # Skip handling of the exit codes in dry mode and
         # when there are no interesting results available
         if self.opt('dry') or not interesting_results:
@@ -1712,6 +1947,142 @@ class Run(tmt.utils.Common):
             raise SystemExit(0)
         raise SystemExit(2)
 
+    def profile(self):
+        """ Summarize where the time of individual plans went """
+        timings = self.timings()
+        self.info('')
+        self.info('profile', color='cyan')
+        for plan in self.plans:
+            spans = [span for span in timings if span.get('plan') == plan.name]
+            steps = [span for span in spans if span['span'] == 'step']
+            if not steps:
+                continue
+            total = sum(span['duration'] for span in steps)
+            self.info(plan.name, f'{total:.2f}s', color='magenta', shift=2)
+            # Steps in the order they were executed, phases in verbose mode
+            for step in steps:
+                self.info(step['step'], f"{step['duration']:.2f}s", shift=3)
+                for phase in spans:
+                    if (phase['span'] == 'phase'
+                            and phase.get('step') == step['step']):
+                        self.verbose(
+                            phase['phase'], f"{phase['duration']:.2f}s",
+                            shift=4)
+            # Guest operations and library fetching
+            for name in PROFILE_SPANS:
+                durations = [
+                    span['duration'] for span in spans if span['span'] == name]
+                if durations:
+                    self.info(name, (
+                        f"{sum(durations):.2f}s in "
+                        f"{listed(len(durations), 'call')}"), shift=3)
+            # The slowest tests
+            tests = sorted(
+                (span for span in spans if span['span'] == 'test'),
+                key=lambda span: span['duration'], reverse=True)
+            if tests:
+                self.info('slowest tests', shift=3)
+                for test in tests[:PROFILE_TESTS]:
+                    self.info(f"{test['duration']:.2f}s", test['test'], shift=4)
+
+    @staticmethod
+    def _span_name(span):
+        """ Name of the span shown in traces, e.g. 'step discover' """
+        name = span.get(span['span'])
+        return f"{span['span']} {name}" if name else span['span']
+
+    @staticmethod
+    def _span_fields(span):
+        """ Fields describing the span (except for timing and ids) """
+        return {
+            key: value for key, value in span.items()
+            if key not in ('span', 'start', 'duration', 'id', 'parent-id',
+                           'thread')}
+
+    def _trace_chrome(self, spans):
+        """ Convert spans into the Chrome trace event format """
+        threads = dict()
+        events = []
+        for span in spans:
+            start = datetime.datetime.fromisoformat(span['start'].rstrip('Z'))
+            thread = threads.setdefault(span['thread'], len(threads) + 1)
+            events.append(dict(
+                name=self._span_name(span),
+                cat=span['span'],
+                ph='X',
+                ts=int(start.replace(tzinfo=datetime.timezone.utc).timestamp()
+                       * 1e6),
+                dur=int(span['duration'] * 1e6),
+                pid=1,
+                tid=thread,
+                args=self._span_fields(span)))
+        # Name the process and threads
+        events.append(dict(
+            name='process_name', ph='M', pid=1,
+            args=dict(name=f'tmt {self.workdir}')))
+        for name, thread in threads.items():
+            events.append(dict(
+                name='thread_name', ph='M', pid=1, tid=thread,
+                args=dict(name=name)))
+        return dict(traceEvents=events, displayTimeUnit='ms')
+
+    def _trace_otlp(self, spans):
+        """ Convert spans into the OpenTelemetry (OTLP/JSON) format """
+        trace_id = os.urandom(16).hex()
+        otlp_spans = []
+        for span in spans:
+            start = datetime.datetime.fromisoformat(
+                span['start'].rstrip('Z')).replace(
+                    tzinfo=datetime.timezone.utc)
+            start_nano = int(start.timestamp() * 1e9)
+            otlp_span = dict(
+                traceId=trace_id,
+                spanId=span['id'],
+                name=self._span_name(span),
+                kind=1,
+                startTimeUnixNano=str(start_nano),
+                endTimeUnixNano=str(start_nano + int(span['duration'] * 1e9)),
+                attributes=[
+                    dict(key=f'tmt.{key}', value=dict(stringValue=str(value)))
+                    for key, value in self._span_fields(span).items()])
+            if 'parent-id' in span:
+                otlp_span['parentSpanId'] = span['parent-id']
+            otlp_spans.append(otlp_span)
+        return dict(resourceSpans=[dict(
+            resource=dict(attributes=[dict(
+                key='service.name', value=dict(stringValue='tmt'))]),
+            scopeSpans=[dict(
+                scope=dict(name='tmt', version=tmt.__version__),
+                spans=otlp_spans)])])
+
+    def trace(self):
+        """
+        Export the run trace
+
+        Save recorded spans into the workdir in the Chrome trace event
+        format (can be opened e.g. in Perfetto) and send them to the
+        OpenTelemetry collector if its endpoint was provided.
+        """
+        spans = self.timings()
+        self.write(
+            tmt.utils.TRACE_FILENAME,
+            json.dumps(self._trace_chrome(spans), default=str))
+        self.debug(f"Trace saved to '{tmt.utils.TRACE_FILENAME}'.")
+        endpoint = self.opt('trace_endpoint')
+        if not endpoint:
+            return
+        # Needed only for the trace export
+        import requests
+
+        url = endpoint.rstrip('/') + '/v1/traces'
+        self.debug(f"Send trace to '{url}'.")
+        try:
+            with tmt.utils.retry_session() as session:
+                response = session.post(url, json=self._trace_otlp(spans))
+            response.raise_for_status()
+        except requests.exceptions.RequestException as error:
+            self.warn(f"Failed to send trace to '{url}': {error}")
+
     def follow(self):
         """ Periodically check for new lines in the log. """
         logfile = open(os.path.join(self.workdir, tmt.utils.LOG_FILENAME), 'r')
@@ -1736,6 +2107,36 @@ class Run(tmt.utils.Common):
             else:
                 time.sleep(0.5)
 
+    def _go_plan(self, plan):
+        """ Execute a single plan, print its output as a block """
+        with tmt.utils.buffered_output():
+            try:
+                with plan.timed_event('plan'):
+                    plan.go()
+            # Unexpected errors must not affect other plans either
+            except Exception as error:
+                if isinstance(error, tmt.utils.GeneralError):
+                    plan.fail(str(error))
+                else:
+                    plan.debug(traceback.format_exc().rstrip(), level=3)
+                    plan.fail(f"{type(error).__name__}: {error}")
+                return error
+        return None
+
+    def _go_concurrently(self, jobs):
+        """ Execute plans in a pool of given number of workers """
+        self.verbose(f"Execute plans in {listed(jobs, 'job')}.")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+            errors = list(pool.map(
+                tmt.utils.in_current_span(self._go_plan), self.plans))
+        self._failed_plans = [
+            plan for plan, error in zip(self.plans, errors) if error]
+        if self._failed_plans:
+            self.info('')
+            self.fail(
+                f"Failed to execute "
+                f"{listed([plan.name for plan in self._failed_plans])}.")
+
     def go(self):
         """ Go and do test steps for selected plans """
         # Create the workdir and save last run
@@ -1797,9 +2198,25 @@ class Run(tmt.utils.Common):
         self.verbose('Found {0}.'.format(listed(self.plans, 'plan')))
         self.save()
 
-        # Iterate over plans
-        for plan in self.plans:
-            plan.go()
+        # Iterate over plans, execute them concurrently if requested
+        jobs = self.opt('jobs') or 1
+        try:
+            with self.timed_event('run'):
+                if jobs > 1 and len(self.plans) > 1:
+                    self._go_concurrently(jobs)
+                else:
+                    for plan in self.plans:
+                        with plan.timed_event('plan'):
+                            plan.go()
+        # Store timings even if the execution has been interrupted
+        finally:
+            self.write(
+                tmt.utils.TIMINGS_FILENAME,
+                tmt.utils.dict_to_yaml(dict(spans=self.timings())))
+            if self.opt('trace') or self.opt('trace_endpoint'):
+                self.trace()
+        if self.opt('profile'):
+            self.profile()
 
         # Update the last run id at the very end
         # (override possible runs created during execution)
@@ -1,9 +1,12 @@
 """ Handle BeakerLib Libraries """
 
+import concurrent.futures
+import hashlib
+import json
 import os
 import re
 import shutil
-from tempfile import TemporaryDirectory
+from threading import Lock
 from typing import Dict, List, Optional, Tuple, Union, cast
 
 import fmf
@@ -26,6 +29,12 @@ LIBRARY_REGEXP = re.compile(r'^library\(([^/]+)(/[^)]+)\)$')
 DEFAULT_REPOSITORY = 'https://github.com/beakerlib'
 DEFAULT_DESTINATION = 'libs'
 
+# Directory under the run workdir holding libraries shared by plans
+STORE_DIRECTORY = 'libraries'
+
+# Maximum number of libraries fetched at the same time
+MAX_PARALLEL = 4
+
 # List of git forges for which the .git suffix should be stripped
 STRIP_SUFFIX_FORGES = [
     'https://github.com',
@@ -36,12 +45,63 @@ STRIP_SUFFIX_FORGES = [
 
 class CommonWithLibraryCache(tmt.utils.Common):
     _library_cache: Dict[str, 'Library']
+    _library_store: 'LibraryStore'
 
 
 class LibraryError(Exception):
     """ Used when library cannot be parsed from the identifier """
 
 
+class LibraryStore(object):
+    """
+    Libraries fetched during a run
+
+    Each library (identified by the repository, url or path and ref)
+    is fetched only once for the whole run, into the 'libraries'
+    directory under the run workdir. Plans get a copy of the fetched
+    library with files hardlinked to the original ones.
+    """
+
+    def __init__(self, workdir: str) -> None:
+        """ Initialize the store under given workdir """
+        self.directory = os.path.join(workdir, STORE_DIRECTORY)
+        # Fetched libraries (key: path, default branch and ref)
+        self._libraries: Dict[str, Tuple[str, Optional[str], str]] = dict()
+        self._locks: Dict[str, Lock] = dict()
+        self._lock = Lock()
+
+    def materialize(self, library: 'Library', directory: str) -> None:
+        """ Fetch the library unless already stored, copy it to directory """
+        key = json.dumps([library.repo, library.url or library.path,
+                          library.ref])
+        with self._lock:
+            lock = self._locks.setdefault(key, Lock())
+        # Make sure the library is not fetched by several threads at once
+        with lock:
+            stored = self._libraries.get(key)
+            if stored is None or not os.path.isdir(stored[0]):
+                digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+                path = os.path.join(
+                    self.directory, f'{library.repo}-{digest[:12]}')
+                shutil.rmtree(path, ignore_errors=True)
+                library._clone(path)
+                assert library.ref is not None
+                self._libraries[key] = (
+                    path, library.default_branch, library.ref)
+            else:
+                library.parent.debug(
+                    f"Library '{library}' already fetched in this run.",
+                    level=3)
+                path, library.default_branch, library.ref = stored
+        library.parent.debug(
+            f"Link library '{library}' to '{directory}'.", level=3)
+        tmt.utils.copy_tree(path, directory, method='hardlink')
+
+
+# Protects creation of the library store
+_library_store_lock = Lock()
+
+
 class Library(object):
     """
     A beakerlib library
@@ -73,9 +133,15 @@ class Library(object):
     def __init__(
             self,
             identifier: BeakerlibIdentifierType,
-            parent: Optional[tmt.utils.Common] = None
+            parent: Optional[tmt.utils.Common] = None,
+            fetch: bool = True
             ) -> None:
-        """ Process the library identifier and fetch the library """
+        """
+        Process the library identifier and fetch the library
+
+        Use 'fetch=False' to only process the identifier and call the
+        fetch() method later.
+        """
         # Use an empty common class if parent not provided (for logging, cache)
         self.parent = parent or tmt.utils.Common(workdir=True)
 
@@ -154,11 +220,8 @@ class Library(object):
             raise LibraryError
 
         # Fetch the library
-        try:
+        if fetch:
             self.fetch()
-        except fmf.utils.RootError:
-            raise tmt.utils.SpecificationError(
-                f"Repository '{self.url}' does not contain fmf metadata.")
 
     def __str__(self) -> str:
         """ Use repo/name for string representation """
@@ -172,8 +235,29 @@ class Library(object):
 
         return cast(CommonWithLibraryCache, self.parent)._library_cache
 
+    @property
+    def _library_store(self) -> LibraryStore:
+        # Initialize library store shared by the whole run (top parent)
+        top = self.parent
+        while top.parent is not None:
+            top = top.parent
+        with _library_store_lock:
+            if not hasattr(top, '_library_store'):
+                cast(CommonWithLibraryCache, top)._library_store = \
+                    LibraryStore(top.workdir or self.parent.workdir)
+        return cast(CommonWithLibraryCache, top)._library_store
+
     def fetch(self) -> None:
         """ Fetch the library (unless already fetched) """
+        try:
+            with self.parent.timed_event('library-fetch', library=str(self)):
+                self._fetch()
+        except fmf.utils.RootError:
+            raise tmt.utils.SpecificationError(
+                f"Repository '{self.url}' does not contain fmf metadata.")
+
+    def _fetch(self) -> None:
+        """ Reuse the library from the cache or clone the repository """
         # Check if the library was already fetched
         try:
             library = self._library_cache[self.repo]
@@ -181,13 +265,11 @@ class Library(object):
             if library.url != self.url:
                 # tmt guessed url so try if repo exists
                 if self.format == 'rpm':
-                    with TemporaryDirectory() as tmp:
-                        command = ['git', 'clone', '--depth=1', str(self.url), str(tmp)]
-                        try:
-                            self.parent.run(command, env={"GIT_ASKPASS": "echo"})
-                        except tmt.utils.RunError:
-                            self.parent.debug(f"Repository '{self.url}' not found.")
-                            raise LibraryError
+                    try:
+                        tmt.utils.GitCache(self.parent).mirror(str(self.url))
+                    except (tmt.utils.RunError, OSError):
+                        self.parent.debug(f"Repository '{self.url}' not found.")
+                        raise LibraryError
                 # If repo does exist we really have unsolvable url conflict
                 raise tmt.utils.GeneralError(
                     f"Library '{self}' with url '{self.url}' conflicts "
@@ -210,53 +292,8 @@ class Library(object):
             # Prepare path, clone the repository, checkout ref
             assert self.parent.workdir
             directory = os.path.join(self.parent.workdir, self.dest, self.repo)
-            # Clone repo with disabled prompt to ignore missing/private repos
-            try:
-                if self.url:
-                    # Use 'git clone --depth=1 <url>' to speed up testing and
-                    # minimize data transfers if ref is not provided
-                    command = ['git', 'clone', '--depth=1', self.url,
-                               directory]
-                    if self.ref is not None:
-                        command = ['git', 'clone', self.url, directory]
-                    self.parent.run(command, env={"GIT_ASKPASS": "echo"})
-                else:
-                    # Either url or path must be defined
-                    assert self.path is not None
-                    self.parent.debug(
-                        f"Copy local library '{self.path}' to '{directory}'.",
-                        level=3)
-                    shutil.copytree(self.path, directory, symlinks=True)
-                # Detect the default branch from the origin
-                try:
-                    self.default_branch = tmt.utils.default_branch(directory)
-                except OSError:
-                    raise tmt.utils.GeneralError(
-                        f"Unable to detect default branch for '{directory}'. "
-                        f"Is the git repository '{self.url}' empty?")
-                # Use the default branch if no ref provided
-                if self.ref is None:
-                    self.ref = self.default_branch
-            except tmt.utils.RunError:
-                # Fallback to install during the prepare step if in rpm format
-                if self.format == 'rpm':
-                    self.parent.debug(f"Repository '{self.url}' not found.")
-                    raise LibraryError
-                self.parent.fail(
-                    f"Failed to fetch library '{self}' from '{self.url}'.")
-                raise
-            # Check out the requested branch
-            try:
-                self.parent.run(
-                    ['git', 'checkout', self.ref], cwd=directory)
-            except tmt.utils.RunError:
-                # Fallback to install during the prepare step if in rpm format
-                if self.format == 'rpm':
-                    self.parent.debug(f"Invalid reference '{self.ref}'.")
-                    raise LibraryError
-                self.parent.fail(
-                    f"Reference '{self.ref}' for library '{self}' not found.")
-                raise
+            # Clone the library once per run, link it for each plan
+            self._library_store.materialize(self, directory)
             # Initialize metadata tree, add self into the library index
             self.tree = fmf.Tree(directory)
             self._library_cache[self.repo] = self
@@ -291,11 +328,109 @@ class Library(object):
                     f"Unable to create a '{link}' symlink "
                     f"for a deep library ({error}).")
 
+    def _clone(self, directory: str) -> None:
+        """ Clone the library into given directory, check out the ref """
+        # Clone repo with disabled prompt to ignore missing/private repos
+        try:
+            if self.url:
+                # Clone from the persistent mirror to avoid transfers
+                tmt.utils.GitCache(self.parent).clone(
+                    self.url, directory, ref=self.ref)
+            else:
+                # Either url or path must be defined
+                assert self.path is not None
+                self.parent.debug(
+                    f"Copy local library '{self.path}' to '{directory}'.",
+                    level=3)
+                shutil.copytree(self.path, directory, symlinks=True)
+            # Detect the default branch from the origin
+            try:
+                self.default_branch = tmt.utils.default_branch(directory)
+            except OSError:
+                raise tmt.utils.GeneralError(
+                    f"Unable to detect default branch for '{directory}'. "
+                    f"Is the git repository '{self.url}' empty?")
+            # Use the default branch if no ref provided
+            if self.ref is None:
+                self.ref = self.default_branch
+        except tmt.utils.RunError:
+            # Fallback to install during the prepare step if in rpm format
+            if self.format == 'rpm':
+                self.parent.debug(f"Repository '{self.url}' not found.")
+                raise LibraryError
+            self.parent.fail(
+                f"Failed to fetch library '{self}' from '{self.url}'.")
+            raise
+        # Check out the requested branch
+        try:
+            self.parent.run(
+                ['git', 'checkout', self.ref], cwd=directory)
+        except tmt.utils.RunError:
+            # Fallback to install during the prepare step if in rpm format
+            if self.format == 'rpm':
+                self.parent.debug(f"Invalid reference '{self.ref}'.")
+                raise LibraryError
+            self.parent.fail(
+                f"Reference '{self.ref}' for library '{self}' not found.")
+            raise
+
+
+def _key(identifier: BeakerlibIdentifierType) -> str:
+    """ Hashable key of given dependency identifier """
+    if isinstance(identifier, dict):
+        return json.dumps(identifier, sort_keys=True)
+    return str(identifier).strip()
+
+
+def _fetch_libraries(
+        libraries: List[Library],
+        max_parallel: int) -> Dict[int, Union[Library, LibraryError]]:
+    """
+    Fetch given libraries, return results indexed by library position
+
+    The first library of each repository which is not cached yet is
+    fetched concurrently, using at most 'max_parallel' threads. The
+    rest is then fetched in the original order from the cache so that
+    url and ref conflicts are always detected in the same way.
+    """
+    results: Dict[int, Union[Library, LibraryError]] = dict()
+    leaders: Dict[str, int] = dict()
+    for index, library in enumerate(libraries):
+        if (library.repo not in library._library_cache
+                and library.repo not in leaders):
+            leaders[library.repo] = index
+
+    def fetch(index: int) -> None:
+        try:
+            libraries[index].fetch()
+            results[index] = libraries[index]
+        except LibraryError as error:
+            results[index] = error
+
+    if len(leaders) > 1 and max_parallel > 1:
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=max_parallel) as executor:
+            futures = [
+                executor.submit(tmt.utils.in_current_span(fetch), index)
+                for index in leaders.values()]
+            concurrent.futures.wait(futures)
+        # Report the first failure in the original order
+        for future in futures:
+            future.result()
+    else:
+        for index in leaders.values():
+            fetch(index)
+    for index in range(len(libraries)):
+        if index not in results:
+            fetch(index)
+    return results
+
 
 def dependencies(
     original_require: List[str],
     original_recommend: Optional[List[str]] = None,
-    parent: Optional[tmt.utils.Common] = None
+    parent: Optional[tmt.utils.Common] = None,
+    max_parallel: int = MAX_PARALLEL
         ) -> LibraryDependenciesType:
     """
     Check dependencies for possible beakerlib libraries
@@ -305,31 +440,56 @@ def dependencies(
     list of regular rpm package names aggregated from all fetched
     libraries, list of aggregated recommended packages and a list of
     gathered libraries (instances of the Library class).
+
+    Dependencies are resolved level by level, libraries of the same
+    level are fetched concurrently by at most 'max_parallel' threads.
     """
     # Initialize lists, use set for require & recommend
     processed_require = set()
     processed_recommend = set()
     gathered_libraries = []
-    original_require = original_require or []
-    original_recommend = original_recommend or []
-
-    for dependency in original_require + original_recommend:
-        # Library require/recommend
-        try:
-            library = Library(dependency, parent=parent)
-            gathered_libraries.append(library)
-            # Recursively check for possible dependent libraries
-            requires, recommends, libraries = dependencies(
-                library.require, library.recommend, parent)
-            processed_require.update(set(requires))
-            processed_recommend.update(set(recommends))
-            gathered_libraries.extend(libraries)
-        # Regular package require/recommend
-        except LibraryError:
-            if dependency in original_require:
-                processed_require.add(dependency)
-            if dependency in original_recommend:
-                processed_recommend.add(dependency)
+    # Libraries with already checked dependencies (prevents cycles)
+    expanded = set()
+    level: List[Tuple[BeakerlibIdentifierType, List[str], List[str]]] = [
+        (dependency, original_require or [], original_recommend or [])
+        for dependency in (original_require or [])
+        + (original_recommend or [])]
+
+    while level:
+        # Process identifiers, regular packages are not libraries
+        libraries: List[Library] = []
+        identifiers = []
+        for dependency, require, recommend in level:
+            if _key(dependency) in expanded:
+                continue
+            try:
+                libraries.append(
+                    Library(dependency, parent=parent, fetch=False))
+                identifiers.append((dependency, require, recommend))
+            except LibraryError:
+                if dependency in require:
+                    processed_require.add(dependency)
+                if dependency in recommend:
+                    processed_recommend.add(dependency)
+
+        # Fetch libraries, gather their dependencies for the next level
+        results = _fetch_libraries(libraries, max_parallel)
+        level = []
+        for index, (dependency, require, recommend) in enumerate(identifiers):
+            library = results[index]
+            # Library require/recommend
+            if isinstance(library, Library):
+                expanded.add(_key(dependency))
+                gathered_libraries.append(library)
+                level.extend(
+                    (item, library.require, library.recommend)
+                    for item in library.require + library.recommend)
+            # Regular package require/recommend (rpm fallback)
+            else:
+                if dependency in require:
+                    processed_require.add(dependency)
+                if dependency in recommend:
+                    processed_recommend.add(dependency)
 
     # Convert to list and return the results
     return list(processed_require), list(processed_recommend), gathered_libraries
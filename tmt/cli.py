@@ -16,14 +16,10 @@ import tmt.convert
 import tmt.export
 import tmt.identifier
 import tmt.options
-import tmt.plugins
 import tmt.steps
 import tmt.templates
 import tmt.utils
 
-# Explore available plugins (need to detect all supported methods first)
-tmt.plugins.explore()
-
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #  Custom Group
@@ -32,9 +28,25 @@ tmt.plugins.explore()
 class CustomGroup(click.Group):
     """ Custom Click Group """
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Commands created only when needed (name: function creating it)
+        self.lazy_commands = dict()
+
+    def add_lazy_command(self, name, create):
+        """ Add command which is created on the first use """
+        self.lazy_commands[name] = create
+
     def list_commands(self, context):
         """ Prevent alphabetical sorting """
-        return self.commands.keys()
+        return list(self.lazy_commands) + [
+            name for name in self.commands if name not in self.lazy_commands]
+
+    def _get_command(self, context, cmd_name):
+        """ Get command of given name, create it if needed """
+        if cmd_name in self.lazy_commands and cmd_name not in self.commands:
+            self.add_command(self.lazy_commands[cmd_name](), cmd_name)
+        return click.Group.get_command(self, context, cmd_name)
 
     def get_command(self, context, cmd_name):
         """ Allow command shortening """
@@ -42,7 +54,7 @@ class CustomGroup(click.Group):
         cmd_name = cmd_name.replace('convert', 'import')
         # Support both story & stories
         cmd_name = cmd_name.replace('story', 'stories')
-        found = click.Group.get_command(self, context, cmd_name)
+        found = self._get_command(context, cmd_name)
         if found is not None:
             return found
         matches = [command for command in self.list_commands(context)
@@ -50,7 +62,7 @@ class CustomGroup(click.Group):
         if not matches:
             return None
         elif len(matches) == 1:
-            return click.Group.get_command(self, context, matches[0])
+            return self._get_command(context, matches[0])
         context.fail('Did you mean {}?'.format(
             listed(sorted(matches), join='or')))
 
@@ -176,11 +188,14 @@ def implemented_verified_documented(function):
     help='Set the fmf context. Use KEY=VAL or KEY=VAL1,VAL2... format '
          'to define individual dimensions or the @FILE notation to load data '
          'from provided yaml file. Can be specified multiple times. ')
+@click.option(
+    '--no-cache', is_flag=True,
+    help='Do not use the persistent cache of the parsed metadata tree.')
 @verbose_debug_quiet
 @click.option(
     '--version', is_flag=True,
     help='Show tmt version and commit hash.')
-def main(click_contex, root, context, **kwargs):
+def main(click_contex, root, context, no_cache, **kwargs):
     """ Test Management Tool """
     # Show current tmt version and exit
     if kwargs.get('version'):
@@ -197,7 +212,7 @@ def main(click_contex, root, context, **kwargs):
     click_contex.obj.fmf_context = tmt.utils.context_to_dict(context)
 
     # Initialize metadata tree (from given path or current directory)
-    tree = tmt.Tree(root or os.curdir)
+    tree = tmt.Tree(root or os.curdir, cache=not no_cache)
     click_contex.obj.tree = tree
 
     # List of enabled steps
@@ -229,6 +244,21 @@ def main(click_contex, root, context, **kwargs):
 @click.option(
     '--follow', is_flag=True,
     help='Output the logfile as it grows.')
+@click.option(
+    '--events', is_flag=True,
+    help='Write a structured event log (events.jsonl) into the workdir.')
+@click.option(
+    '--profile', is_flag=True,
+    help='Show a summary of time spent in steps, guest operations and tests.')
+@click.option(
+    '--trace', is_flag=True,
+    help='Save the run trace (trace.json) in the Chrome trace format.')
+@click.option(
+    '--trace-endpoint', metavar='URL',
+    help='Send the run trace to given OpenTelemetry collector (OTLP/HTTP).')
+@click.option(
+    '-j', '--jobs', metavar='N', type=click.IntRange(min=1), default=1,
+    help='Number of plans to be executed concurrently.')
 @click.option(
     '-a', '--all', help='Run all steps, customize some.', is_flag=True)
 @click.option(
@@ -263,13 +293,13 @@ def run(context, id_, **kwargs):
     context.obj.run = run
 
 
-# Steps options
-run.add_command(tmt.steps.discover.DiscoverPlugin.command())
-run.add_command(tmt.steps.provision.ProvisionPlugin.command())
-run.add_command(tmt.steps.prepare.PreparePlugin.command())
-run.add_command(tmt.steps.execute.ExecutePlugin.command())
-run.add_command(tmt.steps.report.ReportPlugin.command())
-run.add_command(tmt.steps.finish.FinishPlugin.command())
+# Steps options (step plugins are imported only when the step is used)
+run.add_lazy_command('discover', tmt.steps.discover.DiscoverPlugin.command)
+run.add_lazy_command('provision', tmt.steps.provision.ProvisionPlugin.command)
+run.add_lazy_command('prepare', tmt.steps.prepare.PreparePlugin.command)
+run.add_lazy_command('execute', tmt.steps.execute.ExecutePlugin.command)
+run.add_lazy_command('report', tmt.steps.report.ReportPlugin.command)
+run.add_lazy_command('finish', tmt.steps.finish.FinishPlugin.command)
 run.add_command(tmt.steps.Login.command())
 run.add_command(tmt.steps.Reboot.command())
 
@@ -6,7 +6,7 @@ import importlib
 import os
 import pkgutil
 import sys
-from typing import Generator, Optional
+from typing import Dict, Generator, Optional, Set
 
 import fmf
 
@@ -15,18 +15,83 @@ from tmt.steps import STEPS
 
 log = fmf.utils.Logging('tmt').logger
 
+# Native plugin modules of individual steps and methods they implement
+# (method name: module name). Only modules implementing the requested
+# methods are imported. Modules not listed here (e.g. plugins installed
+# into the step directory by other packages) are imported always.
+PLUGINS: Dict[str, Dict[str, str]] = {
+    'discover': {
+        'fmf': 'fmf',
+        'shell': 'shell',
+        },
+    'provision': {
+        'artemis': 'artemis',
+        'connect': 'connect',
+        'container': 'podman',
+        'local': 'local',
+        'virtual.testcloud': 'testcloud',
+        },
+    'prepare': {
+        'ansible': 'ansible',
+        'install': 'install',
+        'multihost': 'multihost',
+        'shell': 'shell',
+        },
+    'execute': {
+        'beakerlib.tmt': 'internal',
+        'shell.tmt': 'internal',
+        'tmt': 'internal',
+        'upgrade': 'upgrade',
+        },
+    'report': {
+        'display': 'display',
+        'html': 'html',
+        'junit': 'junit',
+        },
+    'finish': {
+        'ansible': 'ansible',
+        'shell': 'shell',
+        },
+    }
+
+# Steps with all plugins already imported, modules imported so far
+_loaded_steps: Set[str] = set()
+_loaded_modules: Set[str] = set()
+
 
 def explore() -> None:
     """ Explore all available plugins """
+    for step in STEPS:
+        load(step)
+
+
+def load(step: str, how: Optional[str] = None) -> None:
+    """
+    Import plugins of given step
 
-    # Check all tmt steps for native plugins
+    All plugins of the step are imported by default. If 'how' is
+    provided, only native plugins implementing methods starting
+    with given prefix are imported. Plugins from the 'plugins'
+    directory and custom plugins are imported always as methods
+    they implement are not known in advance.
+    """
+    if step in _loaded_steps:
+        return
+    if how is None:
+        _loaded_steps.add(step)
+
+    # Check the step directory for native plugins
     root = os.path.dirname(os.path.realpath(tmt.__file__))
-    for step in STEPS:
-        for module in discover(os.path.join(root, 'steps', step)):
-            import_(f'tmt.steps.{step}.{module}')
+    known = PLUGINS.get(step, dict())
+    wanted = set(
+        module for method, module in known.items()
+        if how is None or method.startswith(how))
+    for module in discover(os.path.join(root, 'steps', step)):
+        if module in wanted or module not in known.values():
+            _import_once(f'tmt.steps.{step}.{module}')
     # Check for possible plugins in the 'plugins' directory
     for module in discover(os.path.join(root, 'plugins')):
-        import_(f'tmt.plugins.{module}')
+        _import_once(f'tmt.plugins.{module}')
 
     # Check environment variable for user plugins
     try:
@@ -40,7 +105,14 @@ def explore() -> None:
         for module in discover(path):
             if path not in sys.path:
                 sys.path.insert(0, path)
-            import_(module, path)
+            _import_once(module, path)
+
+
+def _import_once(module: str, path: Optional[str] = None) -> None:
+    """ Import requested module unless already imported by load() """
+    if module not in _loaded_modules:
+        import_(module, path)
+        _loaded_modules.add(module)
 
 
 def import_(module: str, path: Optional[str] = None) -> None:
@@ -33,6 +33,8 @@ PHASE_END = 90
 class Phase(tmt.utils.Common):
     """ A phase of a step """
 
+    _event_field = 'phase'
+
     def __init__(
             self,
             order: int = tmt.utils.DEFAULT_PLUGIN_ORDER,
@@ -77,6 +79,8 @@ class Step(tmt.utils.Common):
     # except for provision (virtual) and report (display)
     how: str = 'shell'
 
+    _event_field = 'step'
+
     def __init__(
             self,
             plan: 'Plan',
@@ -207,6 +211,15 @@ class Step(tmt.utils.Common):
         content.update(data)
         self.write('step.yaml', tmt.utils.dict_to_yaml(content))
 
+    def _cleanup_unfinished(self) -> None:
+        """
+        Clean up the workdir of a step which has not finished
+
+        Steps which are able to continue where they were interrupted
+        can override this to keep the data needed for that.
+        """
+        self._workdir_cleanup()
+
     def wake(self) -> None:
         """ Wake up the step (process workdir and command line) """
         # Cleanup possible old workdir if called with --force
@@ -221,7 +234,7 @@ class Step(tmt.utils.Common):
         # directory to give it another chance with a fresh start.
         if self.status() == 'todo':
             self.debug("Step has not finished. Let's try once more!", level=2)
-            self._workdir_cleanup()
+            self._cleanup_unfinished()
 
         # Importing here to avoid circular imports
         import tmt.steps.report
@@ -278,7 +291,8 @@ class Step(tmt.utils.Common):
         """ Run all loaded Login or Reboot action instances of the step """
         for phase in self.phases():
             if isinstance(phase, Action):
-                phase.go()
+                with phase.timed_event('phase'):
+                    phase.go()
 
     def go(self) -> None:
         """ Execute the test step """
@@ -366,6 +380,9 @@ class Plugin(Phase, metaclass=PluginIndex):
     # List of all supported methods aggregated from all plugins
     _supported_methods: List[Method]
 
+    # Name of the step the plugins belong to
+    _step_name: str
+
     def __init__(
             self,
             step: Step,
@@ -441,8 +458,16 @@ class Plugin(Phase, metaclass=PluginIndex):
         return command
 
     @classmethod
-    def methods(cls) -> List[Method]:
-        """ Return all supported methods ordered by priority """
+    def methods(cls, how: Optional[str] = None) -> List[Method]:
+        """
+        Return all supported methods ordered by priority
+
+        Plugins are imported only when their methods are needed, use
+        'how' to import only plugins implementing methods starting
+        with given prefix.
+        """
+        import tmt.plugins
+        tmt.plugins.load(cls._step_name, how)
         return sorted(cls._supported_methods, key=lambda method: method.order)
 
     @classmethod
@@ -457,7 +482,7 @@ class Plugin(Phase, metaclass=PluginIndex):
         The first matching method with the lowest 'order' wins.
         """
         # Filter matching methods, pick the one with the lowest order
-        for method in cls.methods():
+        for method in cls.methods(data['how']):
             if method.name.startswith(data['how']):
                 step.debug(
                     f"Using the '{method.class_.__name__}' plugin "
@@ -136,7 +136,8 @@ class Discover(tmt.steps.Step):
         self._tests = []
         for phase in self.phases():
             # Go and discover tests
-            phase.go()
+            with phase.timed_event('phase'):
+                phase.go()
             # Nothing more to be done for other plugins
             if not isinstance(phase, DiscoverPlugin):
                 continue
@@ -196,6 +197,9 @@ class DiscoverPlugin(tmt.steps.Plugin):
     # List of all supported methods aggregated from all plugins
     _supported_methods = []
 
+    # Name of the step, used for loading its plugins
+    _step_name = 'discover'
+
     # Common keys for all discover step implementations
     _common_keys = [
         "dist-git-source",
@@ -33,6 +33,9 @@ class DiscoverFmf(tmt.steps.discover.DiscoverPlugin):
             filter: 'tier: 1'
 
     If no 'ref' is provided, the default branch from the origin is used.
+    Remote repositories are cloned from a persistent local mirror which
+    is always updated first. If the remote repository cannot be reached,
+    the mirror is used as it is.
 
     For DistGit repo one can extract source tarball first and discover
     tests from it by using 'distgit-source: true'. It can be used
@@ -82,6 +85,17 @@ class DiscoverFmf(tmt.steps.discover.DiscoverPlugin):
     Note that internally the modified tests are appended to the list
     specified via 'test', so those tests will also be selected even if
     not modified.
+
+    The local repository is copied into the workdir using copy-on-write
+    file clones where the filesystem supports them. Use 'copy-method'
+    to choose a different approach: 'reflink' to require file clones,
+    'hardlink' to share files with the repository (changes made during
+    testing will modify the original files), 'git' to copy only files
+    tracked or not ignored by git, or 'copy' for a regular copy.
+
+        discover:
+            how: fmf
+            copy-method: git
     """
 
     # Supported methods
@@ -94,7 +108,7 @@ class DiscoverFmf(tmt.steps.discover.DiscoverPlugin):
         "dist-git-source", "dist-git-type",
         "dist-git-init", "dist-git-remove-fmf-root", "dist-git-merge",
         "dist-git-extract",
-        "fmf-id", "exclude"]
+        "fmf-id", "exclude", "copy-method"]
 
     REF_OPTION = click.option(
         '-r', '--ref', metavar='REVISION',
@@ -153,6 +167,10 @@ class DiscoverFmf(tmt.steps.discover.DiscoverPlugin):
                 '--sync-repo', default=False, is_flag=True,
                 help='Force the sync of the whole git repo. By default, the '
                      'repo is copied only if the used options require it.'),
+            click.option(
+                '--copy-method', type=click.Choice(tmt.utils.COPY_METHODS),
+                help='How to copy the local repository into the workdir '
+                     '(default: auto).'),
             click.option(
                 '--dist-git-source', is_flag=True,
                 help='Extract DistGit sources and run discover on top of it.'),
@@ -217,6 +235,7 @@ class DiscoverFmf(tmt.steps.discover.DiscoverPlugin):
         dist_git_init = self.get('dist-git-init', False)
         dist_git_extract = self.get('dist-git-extract', None)
         dist_git_remove_fmf_root = self.get('dist-git-remove-fmf-root', False)
+        copy_method = self.get('copy-method', 'auto')
 
         # Self checks
         if dist_git_source and not dist_git_merge and (ref or url):
@@ -271,12 +290,9 @@ class DiscoverFmf(tmt.steps.discover.DiscoverPlugin):
         if url:
             self.info('url', url, 'green')
             self.debug(f"Clone '{url}' to '{self.testdir}'.")
-            # Use 'git clone --depth=1 <url>' to speed up testing and
-            # minimize data transfers if ref is not provided
-            command = ['git', 'clone', '--depth=1', url, self.testdir]
-            if ref is not None:
-                command = ['git', 'clone', url, self.testdir]
-            self.run(command, env={"GIT_ASKPASS": "echo"})
+            # Clone from the persistent mirror to minimize data transfers
+            tmt.utils.GitCache(self).clone(
+                url, self.testdir, ref=ref, update=True)
             git_root = self.testdir
         # Copy git repository root to workdir
         else:
@@ -314,9 +330,16 @@ class DiscoverFmf(tmt.steps.discover.DiscoverPlugin):
             directory = git_root if requires_git else fmf_root
             self.info('directory', directory, 'green')
             if not dist_git_source or dist_git_merge:
-                self.debug(f"Copy '{directory}' to '{self.testdir}'.")
+                self.debug(
+                    f"Copy '{directory}' to '{self.testdir}' "
+                    f"using the '{copy_method}' method.")
                 if not self.opt('dry'):
-                    shutil.copytree(directory, self.testdir, symlinks=True)
+                    tmt.utils.copy_tree(
+                        directory, self.testdir, method=copy_method)
+                    # Git metadata are needed but not listed by git,
+                    # worktrees and submodules need a separate repository
+                    if requires_git:
+                        self._copy_git_metadata(directory)
 
         # Checkout revision if requested
         if ref:
@@ -370,8 +393,8 @@ class DiscoverFmf(tmt.steps.discover.DiscoverPlugin):
                             "explicit use of the '--dist-git-merge' option.")
                         self.debug(f"Copy '{git_root}' to '{self.testdir}'.")
                         if not self.opt('dry'):
-                            shutil.copytree(
-                                git_root, self.testdir, symlinks=True)
+                            tmt.utils.copy_tree(
+                                git_root, self.testdir, method=copy_method)
 
             # Initialize or remove fmf root
             if dist_git_init:
@@ -434,9 +457,8 @@ class DiscoverFmf(tmt.steps.discover.DiscoverPlugin):
         if modified_url:
             self.info('modified-url', modified_url, 'green')
             self.debug(f"Fetch also '{modified_url}' as 'reference'.")
-            self.run(['git', 'remote', 'add', 'reference', modified_url],
-                     cwd=self.testdir)
-            self.run(['git', 'fetch', 'reference'], cwd=self.testdir)
+            tmt.utils.GitCache(self).fetch(
+                modified_url, self.testdir, 'reference', update=True)
         if modified_only:
             modified_ref = self.get(
                 'modified-ref', tmt.utils.default_branch(self.testdir))
@@ -478,6 +500,38 @@ class DiscoverFmf(tmt.steps.discover.DiscoverPlugin):
             for test in self._tests:
                 test.environment['TMT_SOURCE_DIR'] = sourcedir
 
+    def _copy_git_metadata(self, directory):
+        """
+        Provide the test directory with its own git repository
+
+        The '.git' directory is copied unless already present. Worktrees
+        and submodules use a '.git' file pointing to a git directory of
+        the original repository, sharing it with the test directory would
+        let checkouts there rewrite the user's HEAD and index. Such
+        repositories are cloned instead (sharing objects only) and reset
+        to the current commit, keeping the copied files untouched.
+        """
+        git_path = os.path.join(directory, '.git')
+        destination = os.path.join(self.testdir, '.git')
+        if os.path.isdir(git_path):
+            if not os.path.isdir(destination):
+                tmt.utils.copy_tree(git_path, destination)
+            return
+        if not os.path.isfile(git_path):
+            return
+        if os.path.lexists(destination):
+            os.remove(destination)
+        commit = self.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=directory)[0].strip()
+        clone = os.path.join(self.workdir, 'git-clone')
+        shutil.rmtree(clone, ignore_errors=True)
+        self.run([
+            'git', 'clone', '--quiet', '--shared', '--no-checkout',
+            directory, clone])
+        os.rename(os.path.join(clone, '.git'), destination)
+        shutil.rmtree(clone)
+        self.run(['git', 'reset', '--quiet', commit], cwd=self.testdir)
+
     def tests(self):
         """ Return all discovered tests """
         return self._tests
@@ -1,5 +1,8 @@
+import json
 import os
 import re
+import shutil
+import threading
 import time
 from dataclasses import dataclass, field
 from typing import List
@@ -26,6 +29,34 @@ SCRIPTS_SRC_DIR = pkg_resources.resource_filename(
 # File in which report-result output is stored.
 RESTRAINT_REPORT_RESULT_OUTPUT = "restraint-result"
 
+# Append-only journal of results, one json object per line
+RESULTS_JOURNAL = 'results.jsonl'
+
+
+def finished_test(directory, beakerlib=None):
+    """
+    Check whether the test data directory belongs to a finished test
+
+    The test output must be saved and the result must be available
+    either in the tmt-report-result output or in the beakerlib results
+    file in the complete state. Result files appear locally only after
+    the test data have been pulled from the guest. Use 'beakerlib' to
+    check just one of the result files.
+    """
+    if not os.path.isfile(os.path.join(directory, TEST_OUTPUT_FILENAME)):
+        return False
+    if beakerlib is not True and os.path.isfile(os.path.join(
+            directory, TEST_DATA, RESTRAINT_REPORT_RESULT_OUTPUT)):
+        return True
+    if beakerlib is False:
+        return False
+    try:
+        with open(os.path.join(directory, 'TestResults')) as results:
+            return bool(re.search(
+                r'TESTRESULT_STATE="?complete"?', results.read()))
+    except OSError:
+        return False
+
 
 class Execute(tmt.steps.Step):
     """
@@ -49,6 +80,11 @@ class Execute(tmt.steps.Step):
         # List of Result() objects representing test results
         self._results = []
 
+        # Results recorded in the journal by an interrupted execution
+        # as a list of (guest name, Result) tuples
+        self._journal = []
+        self._journal_lock = threading.Lock()
+
         # List of scripts to install
         self.scripts = []
 
@@ -70,6 +106,26 @@ class Execute(tmt.steps.Step):
         except tmt.utils.FileError:
             self.debug('Test results not found.', level=2)
 
+        # Rebuild results from the journal if the execution did not finish
+        try:
+            journal = self.read(RESULTS_JOURNAL)
+        except tmt.utils.FileError:
+            self.debug('Results journal not found.', level=2)
+            return
+        self._journal = []
+        for line in journal.splitlines():
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError:
+                # The last line is incomplete if killed while writing
+                self.debug(f"Skip invalid journal line '{line}'.", level=3)
+                continue
+            guest = data.pop('guest')
+            name = data.pop('name')
+            self._journal.append((guest, tmt.Result(data, name)))
+        if self.status() != 'done':
+            self._results = [result for _, result in self._journal]
+
     def save(self, data=None):
         """ Save test results to the workdir """
         data = data or {}
@@ -78,6 +134,61 @@ class Execute(tmt.steps.Step):
             (result.name, result.export()) for result in self.results()])
         self.write('results.yaml', tmt.utils.dict_to_yaml(results))
 
+    def record(self, result, guest):
+        """ Append the test result to the results journal """
+        data = dict(guest=guest.name, name=result.name)
+        data.update(result.export())
+        with self._journal_lock:
+            self.write(
+                RESULTS_JOURNAL, json.dumps(data) + '\n', mode='a', level=3)
+
+    def recorded(self, guest):
+        """
+        Results recorded on the guest before the execution was interrupted
+
+        Return a dictionary mapping test names to their results.
+        """
+        return dict(
+            (result.name, result)
+            for name, result in self._journal if name == guest.name)
+
+    def _cleanup_unfinished(self):
+        """ Keep the journal and data of recorded and finished tests """
+        if self.workdir is None:
+            self._workdir_cleanup()
+            return
+        keep = set(
+            os.path.join(TEST_DATA, result.name.lstrip('/'))
+            for _, result in self._journal)
+        # Tests finished just before the interruption are not recorded
+        for directory, _, files in os.walk(
+                os.path.join(self.workdir, TEST_DATA)):
+            if 'metadata.yaml' in files and finished_test(directory):
+                keep.add(os.path.relpath(directory, self.workdir))
+        if not keep:
+            self._workdir_cleanup()
+            return
+        self.debug(
+            f"Keep data of {fmf.utils.listed(keep, 'test')}.", level=2)
+        for directory, subdirectories, files in os.walk(
+                self.workdir, topdown=True):
+            relative = os.path.relpath(directory, self.workdir)
+            for name in files:
+                if relative == '.' and name == RESULTS_JOURNAL:
+                    continue
+                os.remove(os.path.join(directory, name))
+            for name in list(subdirectories):
+                path = os.path.normpath(os.path.join(relative, name))
+                # Leave data of recorded tests untouched
+                if path in keep:
+                    subdirectories.remove(name)
+                # Descend into directories containing recorded tests
+                elif any(kept.startswith(path + os.sep) for kept in keep):
+                    continue
+                else:
+                    shutil.rmtree(os.path.join(directory, name))
+                    subdirectories.remove(name)
+
     def _map_old_methods(self):
         """ Map the old execute methods in a backward-compatible way """
         how = self.data[0]['how']
@@ -147,11 +258,17 @@ class Execute(tmt.steps.Step):
         if not self.plan.provision.guests():
             raise tmt.utils.ExecuteError("No guests available for execution.")
 
+        # Start a new journal, results of tests which are not executed
+        # again are recorded once more by the plugin
+        self.write(RESULTS_JOURNAL, '')
+        self._results = []
+
         # Execute the tests, store results
         for guest in self.plan.provision.guests():
             for phase in self.phases():
                 if phase.enabled_on_guest(guest):
-                    phase.go(guest)
+                    with phase.timed_event('phase', guest=guest.name):
+                        phase.go(guest)
                     if isinstance(phase, ExecutePlugin):
                         self._results.extend(phase.results())
 
@@ -188,6 +305,9 @@ class ExecutePlugin(tmt.steps.Plugin):
     # List of all supported methods aggregated from all plugins
     _supported_methods = []
 
+    # Name of the step, used for loading its plugins
+    _step_name = 'execute'
+
     # Common keys for all execute plugins
     _common_keys = ["exit-first"]
 
@@ -262,10 +382,11 @@ class ExecutePlugin(tmt.steps.Plugin):
         """
         tests = self.discover.tests()
         for test in tests:
-            metadata_filename = self.data_path(
-                test, filename='metadata.yaml', full=True, create=True)
-            self.write(
-                metadata_filename, tmt.utils.dict_to_yaml(test._metadata))
+            with self.timed_event('test-metadata', test=test.name):
+                metadata_filename = self.data_path(
+                    test, filename='metadata.yaml', full=True, create=True)
+                self.write(
+                    metadata_filename, tmt.utils.dict_to_yaml(test._metadata))
         return tests
 
     def prepare_scripts(self, guest):
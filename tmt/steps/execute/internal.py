@@ -1,8 +1,11 @@
 import os
+import shutil
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import click
+import fmf
 
 import tmt
 import tmt.steps.execute
@@ -38,6 +41,27 @@ REBOOT_REQUEST_FILENAME = "reboot_request"
 SCRIPTS = (TMT_FILE_SUBMIT_SCRIPT, TMT_REBOOT_SCRIPT, TMT_REPORT_RESULT_SCRIPT)
 
 
+def shard_tests(tests, count):
+    """
+    Split tests into given number of shards balanced by duration
+
+    Longest tests are assigned first, each one to the shard with the
+    smallest total duration so far. Tests in each shard keep their
+    original discover order. Return a list of test lists.
+    """
+    shards = [[] for _ in range(count)]
+    totals = [0] * count
+    durations = [
+        tmt.utils.duration_to_seconds(test.duration) for test in tests]
+    by_duration = sorted(
+        range(len(tests)), key=lambda index: durations[index], reverse=True)
+    for index in by_duration:
+        shard = totals.index(min(totals))
+        shards[shard].append(index)
+        totals[shard] += durations[index]
+    return [[tests[index] for index in sorted(shard)] for shard in shards]
+
+
 class ExecuteInternal(tmt.steps.execute.ExecutePlugin):
     """
     Use the internal tmt executor to execute tests
@@ -56,12 +80,16 @@ class ExecuteInternal(tmt.steps.execute.ExecutePlugin):
         ]
 
     # Supported keys
-    _keys = ["script", "interactive"]
+    _keys = ["script", "interactive", "parallel", "pull-interval"]
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._previous_progress_message = ""
         self.scripts = SCRIPTS
+        # Results recorded before the execution was interrupted
+        self._recorded = {}
+        # Check test data for tests finished before the interruption
+        self._detect_finished = False
 
     @classmethod
     def options(cls, how=None):
@@ -79,6 +107,16 @@ class ExecuteInternal(tmt.steps.execute.ExecutePlugin):
         options.append(click.option(
             '--no-progress-bar', is_flag=True,
             help='Disable interactive progress bar showing the current test.'))
+        # Split tests across guests of the same role
+        options.append(click.option(
+            '--parallel', is_flag=True,
+            help='Split tests across all guests with the same role '
+                 'and execute them concurrently.'))
+        # Pull data of several tests at once
+        options.append(click.option(
+            '--pull-interval', metavar='COUNT', type=int,
+            help='Pull test data from the guest after given number '
+                 'of tests, after each test by default.'))
         return options + super().options(how)
 
     def wake(self, keys=None):
@@ -106,6 +144,11 @@ class ExecuteInternal(tmt.steps.execute.ExecutePlugin):
         if not sys.stdout.isatty() or self.opt('no-progress-bar'):
             return
 
+        # Progress bar cannot be shared by concurrently executed shards
+        # or plans
+        if self.get('parallel') or self.opt('jobs', 1) > 1:
+            return
+
         # For debug mode show just an info message (unless finishing)
         message = f"{test_name} [{progress}]" if not finish else ""
         if self.opt('debug'):
@@ -163,7 +206,8 @@ class ExecuteInternal(tmt.steps.execute.ExecutePlugin):
         self.debug(f"Use workdir '{workdir}'.", level=3)
 
         # Create data directory, prepare test environment
-        environment = self._test_environment(test, extra_environment)
+        with self.timed_event('test-environment', test=test.name):
+            environment = self._test_environment(test, extra_environment)
 
         # Prepare the test command (use default options for shell tests)
         if test.framework == "shell":
@@ -175,42 +219,101 @@ class ExecuteInternal(tmt.steps.execute.ExecutePlugin):
         def log(key, value=None, color=None, shift=1, level=1):
             self.verbose(key, value, color, shift=2, level=3)
 
-        # Execute the test, save the output and return code
+        # Execute the test, stream the output to a file, save return code
+        output = self.data_path(test, TEST_OUTPUT_FILENAME, full=True)
         timeout = ''
         start = time.time()
-        try:
-            stdout, stderr = guest.execute(
-                command, cwd=workdir, env=environment,
-                join=True, interactive=self.get('interactive'), log=log,
-                timeout=tmt.utils.duration_to_seconds(test.duration))
-            test.returncode = 0
-        except tmt.utils.RunError as error:
-            stdout = error.stdout
-            test.returncode = error.returncode
-            if test.returncode == tmt.utils.PROCESS_TIMEOUT:
-                timeout = ' (timeout)'
-                self.debug(f"Test duration '{test.duration}' exceeded.")
+        event = self.timed_event('test', test=test.name, guest=guest.name)
+        with event as finish:
+            try:
+                guest.execute(
+                    command, cwd=workdir, env=environment,
+                    join=True, interactive=self.get('interactive'), log=log,
+                    timeout=tmt.utils.duration_to_seconds(test.duration),
+                    output_file=f'{output}.partial')
+                test.returncode = 0
+            except tmt.utils.RunError as error:
+                test.returncode = error.returncode
+                if test.returncode == tmt.utils.PROCESS_TIMEOUT:
+                    timeout = ' (timeout)'
+                    self.debug(f"Test duration '{test.duration}' exceeded.")
+            finish['returncode'] = test.returncode
         end = time.time()
-        self.write(
-            self.data_path(test, TEST_OUTPUT_FILENAME, full=True),
-            stdout or '', mode='a', level=3)
+        self._store_output(f'{output}.partial', output)
         test.real_duration = self.test_duration(start, end)
         duration = click.style(test.real_duration, fg='cyan')
         shift = 1 if self.opt('verbose') < 2 else 2
         self.verbose(
             f"{duration} {test.name} [{progress}]{timeout}", shift=shift)
 
+    def _store_output(self, partial, output):
+        """
+        Append the streamed test output to the output file
+
+        The output file is created only once the test is finished so
+        that its presence can be used to detect finished tests.
+        """
+        if not os.path.exists(partial):
+            # Nothing captured in the interactive mode
+            self.write(output, '', mode='a', level=3)
+            return
+        self.debug(f"Append to file '{output}'.", level=3)
+        if not os.path.exists(output):
+            os.rename(partial, output)
+        else:
+            with open(partial, 'rb') as source, open(output, 'ab') as target:
+                shutil.copyfileobj(source, target)
+            os.remove(partial)
+
     def check(self, test):
         """ Check the test result """
         self.debug(f"Check result of '{test.name}'.")
-        if test.framework == 'beakerlib':
-            return self.check_beakerlib(test)
-        else:
+        with self.timed_event('test-check', test=test.name):
+            if test.framework == 'beakerlib':
+                return self.check_beakerlib(test)
             try:
                 return self.check_result_file(test)
             except tmt.utils.FileError:
                 return self.check_shell(test)
 
+    def _finished(self, test):
+        """
+        Check whether the test finished before the interruption
+
+        The test result must be available in the data pulled from the
+        guest and no reboot may be pending. Prepare the test for the
+        result check, the real duration is not known.
+        """
+        directory = self.data_path(test, full=True)
+        if not tmt.steps.execute.finished_test(
+                directory, beakerlib=test.framework == 'beakerlib'):
+            return False
+        if os.path.exists(os.path.join(
+                directory, tmt.steps.execute.TEST_DATA,
+                REBOOT_REQUEST_FILENAME)):
+            return False
+        test.returncode = 0
+        test.real_duration = None
+        return True
+
+    def _reset_test_data(self, test):
+        """ Remove data left by an unfinished test, keep the metadata """
+        directory = self.data_path(test, full=True)
+        data = os.path.join(directory, tmt.steps.execute.TEST_DATA)
+        names = [
+            name for name in os.listdir(directory) if name != 'metadata.yaml']
+        # Nothing to do for tests which have not been started yet
+        if names == [tmt.steps.execute.TEST_DATA] and not os.listdir(data):
+            return
+        for name in names:
+            self.debug(f"Remove '{name}' left by '{test.name}'.", level=3)
+            path = os.path.join(directory, name)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        os.makedirs(data)
+
     def _handle_reboot(self, test, guest):
         """
         Reboot the guest if the test requested it.
@@ -249,23 +352,134 @@ class ExecuteInternal(tmt.steps.execute.ExecutePlugin):
 
     def go(self, guest):
         """ Execute available tests """
-        super().go()
         self._results = []
 
+        # Shards are executed on all guests of the same role at once,
+        # driven by the first one of them
+        if self.get('parallel'):
+            guests = self._role_guests(guest)
+            if guest is not guests[0]:
+                self.debug(
+                    f"Tests already executed on guests with "
+                    f"the '{guest.role}' role.", level=2)
+                return
+
+        super().go()
+
         # Nothing to do in dry mode
         if self.opt('dry'):
-            self._results = []
             return
 
+        # Execute shards on all guests of the same role at once
+        if self.get('parallel'):
+            self._resume(guests)
+            self._run_shards(guests)
+            return
+
+        self._resume([guest])
         self._run_tests(guest)
 
+    def _resume(self, guests):
+        """ Load results recorded on guests by an interrupted execution """
+        self._recorded = {}
+        for guest in guests:
+            self._recorded.update(self.step.recorded(guest))
+        # Test data directories are shared by all guests, they identify
+        # a finished test only if there is a single guest
+        self._detect_finished = len(self.step.plan.provision.guests()) == 1
+        if self._recorded:
+            self.info(
+                'resume', fmf.utils.listed(
+                    self._recorded, 'test') + ' already executed',
+                'green', shift=1)
+
+    def _role_guests(self, guest):
+        """ List of enabled guests sharing the role with given guest """
+        if guest.role is None:
+            return [guest]
+        return [
+            other for other in self.step.plan.provision.guests()
+            if other.role == guest.role and self.enabled_on_guest(other)]
+
     def _run_tests(self, guest, extra_environment=None):
         """ Execute tests on provided guest """
-        extra_environment = extra_environment or {}
-
         # Prepare tests and helper scripts, check options
         tests = self.prepare_tests()
+        self._results.extend(
+            self._run_shard(guest, tests, extra_environment))
+        self._pull_plan_data(guest)
+
+    def _run_shards(self, guests, extra_environment=None):
+        """ Split tests across provided guests and execute them """
+        tests = self.prepare_tests()
+        shards = shard_tests(tests, len(guests))
+        for guest, shard in zip(guests, shards):
+            self.verbose(
+                'shard', f"{guest.name}: {fmf.utils.listed(shard, 'test')}",
+                'green', level=2)
+        with ThreadPoolExecutor(max_workers=len(guests)) as executor:
+            futures = [
+                executor.submit(
+                    tmt.utils.in_current_span(self._run_shard),
+                    guest, shard, extra_environment)
+                for guest, shard in zip(guests, shards)]
+            # Propagate the first failure, otherwise merge the results
+            results = [future.result() for future in futures]
+        # Guests share the plan data directory, pull it one by one
+        for guest in guests:
+            self._pull_plan_data(guest)
+
+        # Keep results in the discover order
+        by_name = {
+            result.name: result for shard in results for result in shard}
+        self._results.extend(
+            by_name[test.name] for test in tests if test.name in by_name)
+
+    def _run_shard(self, guest, tests, extra_environment=None):
+        """ Execute given tests on provided guest, return results """
+        extra_environment = extra_environment or {}
         exit_first = self.get('exit-first', default=False)
+        interval = int(self.get('pull-interval') or 1)
+        results = []
+        # Executed tests waiting for their data to be pulled and checked
+        pending = []
+
+        def store(checked):
+            """ Record results of checked tests, True to stop execution """
+            stop = False
+            for test, result in checked:
+                results.append(result)
+                self.step.record(result, guest)
+                if (exit_first and not stop and
+                        result.result not in ('pass', 'info')):
+                    # Clear the progress bar before outputting
+                    self._show_progress('', '', True)
+                    self.warn(
+                        f'Test {test.name} failed, stopping execution.')
+                    stop = True
+            return stop
+
+        def check_pending():
+            """ Check pending tests, their data must be already pulled """
+            checked = [(test, self.check(test)) for test in pending]
+            pending.clear()
+            return checked
+
+        def check_pulled():
+            """ Wait for the background pull, return its tests checked """
+            checked = []
+            for future, pulled in background:
+                future.result()
+                checked.extend((test, self.check(test)) for test in pulled)
+            background.clear()
+            return checked
+
+        # Pull test data in the background while the next test is being
+        # executed unless results of each test are needed immediately
+        overlap = not (guest.localhost or exit_first)
+        background = []
+        puller = ThreadPoolExecutor(max_workers=1)
+        output = tmt.utils.output_buffer()
 
         # Prepare scripts, except localhost guest
         if not guest.localhost:
@@ -273,46 +487,122 @@ class ExecuteInternal(tmt.steps.execute.ExecutePlugin):
 
         # Push workdir to guest and execute tests
         guest.push()
-        # We cannot use enumerate here due to continue in the code
-        index = 0
-        while index < len(tests):
-            test = tests[index]
-            if not hasattr(test, "_reboot_count"):
-                test._reboot_count = 0
-            self.execute(
-                test, guest, progress=f"{index + 1}/{len(tests)}",
-                extra_environment=extra_environment)
-
-            # Pull test logs from the guest, exclude beakerlib backups
-            if test.framework == "beakerlib":
-                exclude = [
-                    "--exclude",
-                    self.data_path(test, "backup*", full=True)]
-            else:
-                exclude = None
-            guest.pull(
-                source=self.data_path(test, full=True),
-                extend_options=exclude)
-
-            # Handle reboot, check results
-            if self._handle_reboot(test, guest):
-                continue
-            self._results.append(self.check(test))
-            if (exit_first and
-                    self._results[-1].result not in ('pass', 'info')):
-                # Clear the progress bar before outputting
-                self._show_progress('', '', True)
-                self.warn(
-                    f'Test {test.name} failed, stopping execution.')
-                break
-            index += 1
+        try:
+            # We cannot use enumerate here due to continue in the code
+            index = 0
+            while index < len(tests):
+                test = tests[index]
+                if not hasattr(test, "_reboot_count"):
+                    test._reboot_count = 0
+                # Only tests carried over from the interrupted execution may
+                # be finished already, a rebooted test continues running
+                resumed = self._detect_finished and not test._reboot_count
+                # Reuse the result recorded before the interruption
+                if test.name in self._recorded:
+                    self.debug(f"Reuse the recorded result of '{test.name}'.")
+                    self._pull_test_data(guest, pending)
+                    checked = check_pulled() + check_pending() + [
+                        (test, self._recorded[test.name])]
+                # Or check the result of a test finished but not recorded
+                elif resumed and self._finished(test):
+                    self.verbose(
+                        'resume', f"{test.name} finished before", 'green',
+                        shift=1)
+                    self._pull_test_data(guest, pending)
+                    checked = check_pulled() + check_pending() + [
+                        (test, self.check(test))]
+                else:
+                    if resumed:
+                        self._reset_test_data(test)
+                    self.execute(
+                        test, guest, progress=f"{index + 1}/{len(tests)}",
+                        extra_environment=extra_environment)
+
+                    # Pull test logs from the guest once enough tests are
+                    # executed, the last one or a reboot possibly requested
+                    pending.append(test)
+                    last = index + 1 == len(tests)
+                    reboot = (interval > 1 or overlap) and \
+                        self._reboot_possible(test, guest)
+                    if len(pending) < interval and not last and not reboot:
+                        index += 1
+                        continue
+
+                    # Pull in the background, check results of the previous
+                    # pull which has been overlapping with this test
+                    if overlap and not last and not reboot:
+                        checked = check_pulled()
+                        background.append((puller.submit(
+                            tmt.utils.in_current_span(
+                                self._pull_in_background),
+                            guest, list(pending), output), list(pending)))
+                        pending.clear()
+                        if store(checked):
+                            break
+                        index += 1
+                        continue
+
+                    # Handle reboot (the test continues afterwards)
+                    checked = check_pulled()
+                    self._pull_test_data(guest, pending)
+                    if self._handle_reboot(test, guest):
+                        pending.pop()
+                        if store(checked + check_pending()):
+                            break
+                        continue
+                    checked += check_pending()
+
+                # Store results in the journal as soon as they are known
+                if store(checked):
+                    break
+                index += 1
+            store(check_pulled())
+        finally:
+            # Never leave a pull running, even if the execution failed
+            puller.shutdown()
         # Overwrite the progress bar, the test data is irrelevant
         self._show_progress('', '', True)
+        return results
 
-        # Pull artifacts created in the plan data directory
+    def _pull_plan_data(self, guest):
+        """ Pull artifacts created in the plan data directory """
         self.debug("Pull the plan data directory.", level=2)
         guest.pull(source=self.step.plan.data_directory)
 
+    def _reboot_possible(self, test, guest):
+        """
+        Check whether the test may have requested a reboot
+
+        The tmt-reboot script terminates the test so only a test which
+        did not pass may have requested it. Data of such tests are
+        pulled at once and the request is looked up in them instead of
+        checking it on the guest, see _handle_reboot().
+        """
+        if guest.localhost:
+            return os.path.exists(os.path.join(
+                self.data_path(test, full=True), tmt.steps.execute.TEST_DATA,
+                REBOOT_REQUEST_FILENAME))
+        return test.returncode != 0
+
+    def _pull_in_background(self, guest, tests, output):
+        """ Pull test data, hand over messages to the given buffer """
+        with tmt.utils.buffered_output(parent=output):
+            self._pull_test_data(guest, tests)
+
+    def _pull_test_data(self, guest, tests):
+        """ Pull data directories of given tests from the guest at once """
+        if not tests:
+            return
+        # Exclude beakerlib backups
+        exclude = []
+        for test in tests:
+            if test.framework == "beakerlib":
+                exclude.extend([
+                    "--exclude", self.data_path(test, "backup*", full=True)])
+        guest.pull(
+            source=[self.data_path(test, full=True) for test in tests],
+            extend_options=exclude or None)
+
     def results(self):
         """ Return test results """
         return self._results
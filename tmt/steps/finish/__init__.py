@@ -69,7 +69,8 @@ class Finish(tmt.steps.Step):
             guest_copy = copy.copy(guest)
             guest_copy.parent = self
             for phase in self.phases():
-                phase.go(guest_copy)
+                with phase.timed_event('phase', guest=guest.name):
+                    phase.go(guest_copy)
             # Pull artifacts created in the plan data directory
             # if there was at least one plugin executed
             if self.phases():
@@ -105,6 +106,9 @@ class FinishPlugin(tmt.steps.Plugin):
     # List of all supported methods aggregated from all plugins
     _supported_methods = []
 
+    # Name of the step, used for loading its plugins
+    _step_name = 'finish'
+
     @classmethod
     def base_command(cls, method_class=None, usage=None):
         """ Create base click command (common for all finish plugins) """
@@ -1,5 +1,9 @@
 import collections
 import copy
+import hashlib
+import json
+import os
+import shlex
 
 import click
 import fmf
@@ -72,16 +76,9 @@ class Prepare(tmt.steps.Step):
                 host_mapping[guest.name] = guest.guest
         return host_mapping
 
-    def go(self):
-        """ Prepare the guests """
-        super().go()
-
-        # Nothing more to do if already done
-        if self.status() == 'done':
-            self.info('status', 'done', 'green', shift=1)
-            self.summary()
-            self.actions()
-            return
+    def _implicit_phases(self):
+        """ Data of phases added to the explicitly configured ones """
+        phases = []
 
         # Required packages
         requires = set(
@@ -94,41 +91,119 @@ class Prepare(tmt.steps.Step):
             )
 
         if requires:
-            data = dict(
+            phases.append(dict(
                 how='install',
                 name='requires',
                 summary='Install required packages',
                 order=tmt.utils.DEFAULT_PLUGIN_ORDER_REQUIRES,
-                package=list(requires))
-            self._phases.append(PreparePlugin.delegate(self, data))
+                package=sorted(requires)))
 
         # Recommended packages
         recommends = self.plan.discover.recommends()
         if recommends:
-            data = dict(
+            phases.append(dict(
                 how='install',
                 name='recommends',
                 summary='Install recommended packages',
                 order=tmt.utils.DEFAULT_PLUGIN_ORDER_RECOMMENDS,
                 package=recommends,
-                missing='skip')
-            self._phases.append(PreparePlugin.delegate(self, data))
+                missing='skip'))
 
         # Implicit multihost setup
         if self.plan.provision.is_multihost:
-            data = dict(
+            phases.append(dict(
                 how='multihost',
                 name='multihost',
                 summary='Setup guest for multihost testing',
                 order=tmt.utils.DEFAULT_PLUGIN_ORDER_MULTIHOST,
                 roles=self._prepare_roles(),
                 hosts=self._prepare_hosts(),
-                )
+                ))
+
+        return phases
+
+    def _file_digests(self, data):
+        """
+        Digests of local files referenced by the phase data
+
+        Cover playbooks, local packages and package directories and
+        worktree files used by shell scripts. Paths are relative to the
+        worktree, a copy of the metadata tree root.
+        """
+        files = []
+        for key in ['playbook', 'playbooks', 'package']:
+            files.extend(tmt.utils.listify(data.get(key) or []))
+        for script in tmt.utils.listify(data.get('script') or []):
+            try:
+                words = shlex.split(script)
+            except ValueError:
+                words = script.split()
+            files.extend(word for word in words if not os.path.isabs(word))
+        directories = tmt.utils.listify(data.get('directory') or [])
+        for directory in directories:
+            path = os.path.join(self.plan.worktree, directory)
+            if os.path.isdir(path):
+                files.extend(
+                    os.path.join(directory, name)
+                    for name in sorted(os.listdir(path)))
+
+        digests = dict()
+        for name in files:
+            path = os.path.join(self.plan.worktree, str(name))
+            if name in digests or not os.path.isfile(path):
+                continue
+            digest = hashlib.sha256()
+            with open(path, 'rb') as content:
+                for chunk in iter(lambda: content.read(1024 * 1024), b''):
+                    digest.update(chunk)
+            digests[name] = digest.hexdigest()
+        return digests
+
+    def fingerprint(self):
+        """
+        Fingerprint of all preparations to be applied
+
+        Used to decide whether a snapshot of an already prepared guest
+        can be used instead of applying the same preparations again.
+        Content of referenced local files is included. Names and
+        addresses of guests in the multihost setup are not, they are
+        not known yet when the first guest is being provisioned.
+        """
+        phases = []
+        for data in [dict(data) for data in self.data] + \
+                self._implicit_phases():
+            if data.get('how') == 'multihost':
+                data.pop('roles', None)
+                data.pop('hosts', None)
+            data['files'] = self._file_digests(data)
+            phases.append(data)
+        return hashlib.sha256(json.dumps(
+            phases, sort_keys=True, default=str).encode()).hexdigest()
+
+    def go(self):
+        """ Prepare the guests """
+        super().go()
+
+        # Nothing more to do if already done
+        if self.status() == 'done':
+            self.info('status', 'done', 'green', shift=1)
+            self.summary()
+            self.actions()
+            return
+
+        # Add required and recommended packages and multihost setup
+        fingerprint = self.fingerprint()
+        for data in self._implicit_phases():
             self._phases.append(PreparePlugin.delegate(self, data))
 
         # Prepare guests (including workdir sync)
         for guest in self.plan.provision.guests():
             guest.push()
+            # Nothing to do for guests started from a prepared snapshot
+            if guest.restored(fingerprint):
+                self.info('guest', f"{guest.name} restored from a snapshot",
+                          'green', shift=1)
+                continue
             # Create a guest copy and change its parent so that the
             # operations inside prepare plugins on the guest use the
             # prepare step config rather than provision step config.
@@ -138,12 +213,14 @@ class Prepare(tmt.steps.Step):
             for phase in self.phases():
                 if phase.enabled_on_guest(guest_copy):
                     self.preparations_applied += 1
-                    phase.go(guest_copy)
+                    with phase.timed_event('phase', guest=guest.name):
+                        phase.go(guest_copy)
                     self.info('')
             # Pull artifacts created in the plan data directory
             # if there was at least one plugin executed
             if self.phases():
                 guest_copy.pull(self.plan.data_directory)
+            guest.snapshot_prepared(fingerprint)
 
         # Give a summary, update status and save
         self.summary()
@@ -170,6 +247,9 @@ class PreparePlugin(tmt.steps.Plugin):
     # List of all supported methods aggregated from all plugins
     _supported_methods = []
 
+    # Name of the step, used for loading its plugins
+    _step_name = 'prepare'
+
     # Common keys for all prepare step implementations
     _common_keys = ['where']
 
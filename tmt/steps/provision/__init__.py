@@ -1,12 +1,16 @@
+import base64
 import collections
+import concurrent.futures
 import datetime
 import os
 import random
 import re
+import select
 import shlex
 import string
 import subprocess
 import tempfile
+import threading
 import time
 
 import click
@@ -23,10 +27,50 @@ CONNECTION_TIMEOUT = 60 * 60
 # Wait time when reboot happens in seconds
 RECONNECT_INITIAL_WAIT_TIME = 5
 
+# Maximum number of guests provisioned concurrently
+DEFAULT_MAX_PARALLEL = 4
+
 # Default rsync options
 DEFAULT_RSYNC_OPTIONS = [
     "-R", "-r", "-z", "--links", "--safe-links", "--delete"]
 
+# Maximum number of paths removed on the guest by a single command
+PUSH_REMOVE_CHUNK = 500
+
+# Time in seconds to wait for the agent session to become ready
+AGENT_START_TIMEOUT = 60
+
+# Interval in seconds of checking that the agent session is alive
+AGENT_POLL_INTERVAL = 5
+
+# Close ssh connections to a guest not responding for five minutes
+SSH_ALIVE_OPTIONS = ['-oServerAliveInterval=5', '-oServerAliveCountMax=60']
+
+# Shell loop executing base64 encoded commands on the guest, see the
+# GuestAgent class for details about the protocol
+AGENT_SCRIPT = """
+command -v base64 >/dev/null || exit 1
+dir=$(mktemp -d) || exit 1
+trap 'rm -rf "$dir"' EXIT
+echo ":ready $marker"
+while read -r join encoded; do
+    printf '%s\\n' "$encoded" | base64 -d > "$dir/command"
+    if [ "$join" = 1 ]; then
+        "${SHELL:-sh}" "$dir/command" < /dev/null > "$dir/stdout" 2>&1
+    else
+        "${SHELL:-sh}" "$dir/command" \\
+            < /dev/null > "$dir/stdout" 2> "$dir/stderr"
+    fi
+    status=$?
+    echo ':stdout'
+    base64 < "$dir/stdout"
+    echo ':stderr'
+    [ "$join" = 1 ] || base64 < "$dir/stderr"
+    echo ":status $status"
+    rm -f "$dir/stdout" "$dir/stderr"
+done
+"""
+
 
 class Provision(tmt.steps.Step):
     """ Provision an environment for testing or use localhost. """
@@ -126,18 +170,25 @@ class Provision(tmt.steps.Step):
         save = True
         self.is_multihost = sum([isinstance(phase, ProvisionPlugin)
                                 for phase in self.phases()]) > 1
+        max_parallel = self.opt('max-parallel') or DEFAULT_MAX_PARALLEL
         try:
-            for phase in self.phases():
-                try:
-                    phase.go()
-                    if isinstance(phase, ProvisionPlugin):
-                        phase.guest().details()
+            # Consecutive provision plugins are run concurrently, other
+            # phases (such as login or reboot) one by one between them
+            phases = self.phases()
+            while phases:
+                if isinstance(phases[0], ProvisionPlugin):
+                    count = 1
+                    while (count < len(phases)
+                            and isinstance(phases[count], ProvisionPlugin)):
+                        count += 1
+                    self._go_plugins(phases[:count], max_parallel)
+                    phases = phases[count:]
+                else:
+                    phase = phases.pop(0)
+                    with phase.timed_event('phase'):
+                        phase.go()
                     if self.is_multihost:
                         self.info('')
-                finally:
-                    if isinstance(phase, ProvisionPlugin):
-                        if phase.guest():
-                            self._guests.append(phase.guest())
 
             # Give a summary, update status and save
             self.summary()
@@ -153,6 +204,52 @@ class Provision(tmt.steps.Step):
             if save:
                 self.save()
 
+    def _go_plugin(self, plugin, output=None):
+        """ Provision a single guest, buffer output if requested """
+        with tmt.utils.buffered_output(parent=output):
+            with plugin.timed_event('phase'):
+                plugin.go()
+            plugin.guest().details()
+            if self.is_multihost:
+                self.info('')
+
+    def _go_plugins(self, plugins, max_parallel):
+        """
+        Provision guests of given plugins concurrently
+
+        At most 'max_parallel' guests are provisioned at the same time,
+        output of each plugin is shown as a block. Provisioned guests
+        are stored in the phase order. If provisioning of any guest
+        fails, all failures are reported and the first one is raised.
+        """
+        try:
+            if len(plugins) == 1 or max_parallel == 1:
+                for plugin in plugins:
+                    self._go_plugin(plugin)
+                return
+
+            output = tmt.utils.output_buffer()
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=max_parallel) as executor:
+                futures = [
+                    executor.submit(
+                        tmt.utils.in_current_span(self._go_plugin),
+                        plugin, output)
+                    for plugin in plugins]
+                concurrent.futures.wait(futures)
+            errors = [
+                (plugin, future.exception())
+                for plugin, future in zip(plugins, futures)
+                if future.exception() is not None]
+            for plugin, error in errors:
+                self.fail(f"Failed to provision guest '{plugin.name}': {error}")
+            if errors:
+                raise errors[0][1]
+        finally:
+            for plugin in plugins:
+                if plugin.guest():
+                    self._guests.append(plugin.guest())
+
     def guests(self):
         """ Return the list of all provisioned guests """
         return self._guests
@@ -180,6 +277,9 @@ class ProvisionPlugin(tmt.steps.Plugin):
     # List of all supported methods aggregated from all plugins
     _supported_methods = []
 
+    # Name of the step, used for loading its plugins
+    _step_name = 'provision'
+
     # Common keys for all provision step implementations
     _common_keys = ['role']
 
@@ -197,6 +297,10 @@ class ProvisionPlugin(tmt.steps.Plugin):
         @click.option(
             '-h', '--how', metavar='METHOD',
             help='Use specified method for provisioning.')
+        @click.option(
+            '--max-parallel', metavar='N', type=click.IntRange(min=1),
+            help=f'Maximum number of guests provisioned concurrently '
+                 f'(default: {DEFAULT_MAX_PARALLEL}).')
         def provision(context, **kwargs):
             context.obj.steps.add('provision')
             Provision._save_context(context)
@@ -253,6 +357,8 @@ class Guest(tmt.utils.Common):
     # (used for import/export to/from attributes during load and save)
     _keys = ['role', 'guest']
 
+    _event_field = 'guest'
+
     def __init__(self, data, name=None, parent=None):
         """ Initialize guest data """
         super().__init__(parent, name)
@@ -328,6 +434,26 @@ class Guest(tmt.utils.Common):
         """
         self.debug(f"Doing nothing to start guest '{self.guest}'.")
 
+    def restored(self, fingerprint):
+        """
+        Check whether the guest was started from a prepared snapshot
+
+        Return True if the guest was restored from a snapshot taken
+        after the preparations with given fingerprint were applied so
+        that the prepare step can skip them.
+        """
+        return False
+
+    def snapshot_prepared(self, fingerprint):
+        """
+        Store a snapshot of the prepared guest
+
+        Called by the prepare step once all preparations with given
+        fingerprint were applied. Guests which support snapshots can
+        store their state so that future runs can start from it.
+        """
+        self.debug(f"Doing nothing to snapshot guest '{self.guest}'.")
+
     def details(self):
         """ Show guest details such as distro and kernel """
         # Skip distro & kernel check in dry mode
@@ -558,6 +684,163 @@ class Guest(tmt.utils.Common):
         return []
 
 
+class GuestAgent(object):
+    """
+    Persistent session for executing commands on the guest
+
+    A small shell loop (see AGENT_SCRIPT) is started on the guest over
+    a single ssh channel. Each command is sent as one line containing
+    the join flag and the base64 encoded script. Once the command is
+    finished, its base64 encoded stdout and stderr and the exit code
+    are sent back separated by ':stdout', ':stderr' and ':status'
+    lines, which saves spawning a new ssh process for every command.
+    """
+
+    def __init__(self, guest):
+        """ Initialize the session for given guest """
+        self.guest = guest
+        self.lock = threading.Lock()
+        self.process = None
+        # Complete lines and the incomplete rest of the agent output
+        self._lines = collections.deque()
+        self._rest = b''
+        # Set to False when the guest cannot run the agent
+        self.supported = True
+
+    def start(self):
+        """ Start the agent, return True if it is ready """
+        # Unique marker, shell startup files may print anything
+        marker = os.urandom(8).hex()
+        command = self.guest._ssh_command() + [
+            self.guest._ssh_guest(), f'marker={marker}\n{AGENT_SCRIPT}']
+        self.guest.debug("Start the agent session.", level=3)
+        self.process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL)
+        self._lines.clear()
+        self._rest = b''
+        deadline = time.monotonic() + AGENT_START_TIMEOUT
+        timeout = False
+        try:
+            while True:
+                line = self._read(deadline=deadline)
+                if line == f':ready {marker}':
+                    return True
+                self.guest.debug(f"Skip agent output '{line}'.", level=3)
+        except EOFError:
+            pass
+        except TimeoutError:
+            self.guest.debug("The agent session did not start in time.")
+            timeout = True
+        # Connection failures are worth trying again later, other
+        # errors mean that the agent cannot run on the guest at all
+        if self._terminate() != 255 or timeout:
+            self.guest.debug("The agent is not supported by the guest.")
+            self.supported = False
+        return False
+
+    def _read(self, deadline=None):
+        """
+        Read a single line of the agent output
+
+        Raise EOFError when the session is closed or the ssh process is
+        gone, TimeoutError if there is no line before the deadline (as
+        given by time.monotonic()).
+        """
+        stdout = self.process.stdout
+        while not self._lines:
+            timeout = AGENT_POLL_INTERVAL
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+                if timeout <= 0:
+                    raise TimeoutError
+            ready, _, _ = select.select([stdout], [], [], timeout)
+            if not ready:
+                # Processes left on the guest side may keep the output
+                # open even if the session itself has finished
+                if self.process.poll() is not None:
+                    raise EOFError
+                continue
+            chunk = os.read(stdout.fileno(), 65536)
+            if not chunk:
+                raise EOFError
+            *lines, self._rest = (self._rest + chunk).split(b'\n')
+            self._lines.extend(lines)
+        return self._lines.popleft().decode('ascii', errors='replace')
+
+    def execute(self, script, join=False):
+        """
+        Execute the script, return stdout, stderr and the exit code
+
+        Return None if the agent is not available. Closed connection
+        (e.g. caused by a reboot) is reported as the exit code 255 in
+        the same way as ssh does.
+        """
+        if not self.supported or not self.lock.acquire(blocking=False):
+            return None
+        try:
+            if self.process is None and not self.start():
+                return None
+            encoded = base64.b64encode(script.encode('utf-8')).decode('ascii')
+            try:
+                self.process.stdin.write(f"{int(join)} {encoded}\n".encode())
+                self.process.stdin.flush()
+            except BrokenPipeError:
+                # The command was not sent at all
+                self.guest.debug("The agent session was closed.", level=3)
+                self.stop()
+                return None
+            output = dict(stdout=[], stderr=[])
+            stream = None
+            try:
+                while True:
+                    line = self._read()
+                    if line.startswith(':status '):
+                        break
+                    if line.startswith(':'):
+                        stream = output[line[1:]]
+                    else:
+                        stream.append(line)
+            except EOFError:
+                self.guest.debug("The agent session was closed.", level=3)
+                self.stop()
+                return '', None if join else '', 255
+            stdout, stderr = [
+                base64.b64decode(''.join(output[name])).decode(
+                    'utf-8', errors='replace')
+                for name in ['stdout', 'stderr']]
+            return stdout, None if join else stderr, int(line.split()[1])
+        finally:
+            self.lock.release()
+
+    def _terminate(self):
+        """ Close the input, stop the process, return its exit code """
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        try:
+            self.process.wait(timeout=3)
+        except subprocess.TimeoutExpired:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=3)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        returncode = self.process.returncode
+        self.process.stdout.close()
+        self.process = None
+        return returncode
+
+    def stop(self):
+        """ Close the agent session """
+        if self.process is not None:
+            self._terminate()
+
+
 class GuestSsh(Guest):
     """
     Guest provisioned for test execution, capable of accepting SSH connections
@@ -583,6 +866,14 @@ class GuestSsh(Guest):
     _ssh_master_process = None
     _ssh_socket_path = None
 
+    # Persistent session for command execution
+    _agent = None
+
+    # Manifest of the plan workdir as it was pushed to the guest
+    _pushed = None
+    # Pulls running in the background update the manifest as well
+    _pushed_lock = threading.Lock()
+
     def _ssh_guest(self):
         """ Return user@guest """
         return f'{self.user}@{self.guest}'
@@ -606,7 +897,7 @@ class GuestSsh(Guest):
             '-oForwardX11=no',
             '-oStrictHostKeyChecking=no',
             '-oUserKnownHostsFile=/dev/null',
-            ]
+            ] + SSH_ALIVE_OPTIONS
         if self.key or self.password:
             # Skip ssh-agent (it adds additional identities)
             options.append('-oIdentitiesOnly=yes')
@@ -665,6 +956,7 @@ class GuestSsh(Guest):
             env=self._prepare_environment())
         self._ansible_summary(stdout)
 
+    @tmt.utils.timed('guest-execute')
     def execute(self, command, **kwargs):
         """
         Execute command on the guest
@@ -693,11 +985,52 @@ class GuestSsh(Guest):
         if isinstance(command, (list, tuple)):
             command = ' '.join(command)
         self.debug(f"Execute command '{command}' on guest '{self.guest}'.")
+        script = f'{environment}{directory}{command}'
+
+        # Use the agent session unless the output should be streamed
+        # or the command needs a terminal or a timeout
+        if not (interactive or kwargs.get('timeout') or
+                kwargs.get('output_file') or self.opt('dry')):
+            output = self._agent_execute(script, **kwargs)
+            if output is not None:
+                return output
+
         command = (
             self._ssh_command() + interactive + [self._ssh_guest()] +
-            [f'{environment}{directory}{command}'])
+            [script])
         return self.run(command, **kwargs)
 
+    def _agent_execute(self, script, join=False, log=None, **kwargs):
+        """
+        Execute the script using the agent session
+
+        Follow the output handling of the run() method. Return None if
+        the agent cannot be used so that the command is executed using
+        a new ssh connection instead.
+        """
+        if self._agent is None:
+            self._agent = GuestAgent(self)
+        self.debug(f"Run command '{script}' using the agent.", level=2)
+        result = self._agent.execute(script, join=join)
+        if result is None:
+            return None
+        stdout, stderr, returncode = result
+
+        # Log the output in the same way as the run() method
+        log = log or self.debug
+        for name, output in [('out', stdout), ('err', stderr)]:
+            for line in (output or '').splitlines():
+                log(name, line, 'yellow', level=3)
+
+        if returncode != 0:
+            message = kwargs.get('message') or f"Run command '{script}'."
+            raise tmt.utils.RunError(
+                f"Failed to {message[0].lower()}{message[1:]} "
+                f"Reason: Command returned '{returncode}'.",
+                script, returncode, stdout, stderr)
+        return tmt.utils.CommandOutput(stdout, stderr)
+
+    @tmt.utils.timed('guest-push')
     def push(self, source=None, destination=None, options=None):
         """
         Push files to the guest
@@ -706,7 +1039,19 @@ class GuestSsh(Guest):
         on the guest. Use the 'source' and 'destination' to sync custom
         location and the 'options' parametr to modify default options
         which are '-Rrz --links --safe-links --delete'.
+
+        Once the whole workdir has been pushed, only files changed since
+        then are transferred and files removed from the workdir are
+        removed from the guest as well.
         """
+        # Push only changes if the workdir has already been pushed
+        manifest = None
+        if source is None and destination is None and options is None:
+            manifest = self._workdir_manifest(self.parent.plan.workdir)
+            if self._pushed is not None:
+                self._push_changes(manifest)
+                return
+
         # Prepare options and the push command
         if options is None:
             options = DEFAULT_RSYNC_OPTIONS
@@ -739,7 +1084,84 @@ class GuestSsh(Guest):
                     f"Failed to push workdir to the guest. This usually means "
                     f"that login as '{self.user}' to the guest does not work.")
                 raise
+        if manifest is not None:
+            self._pushed = manifest
 
+    @staticmethod
+    def _workdir_manifest(workdir):
+        """
+        Prepare the manifest of all files under the workdir
+
+        Return a dictionary mapping paths to their size and modification
+        time which identify changed files in the same way as rsync's
+        quick check does. Directories are included as well so that the
+        new empty ones are created.
+        """
+        manifest = dict()
+        for root, directories, files in os.walk(workdir):
+            for name in directories + files:
+                path = os.path.join(root, name)
+                if name in directories and not os.path.islink(path):
+                    manifest[path] = 'directory'
+                    continue
+                try:
+                    stat = os.lstat(path)
+                except FileNotFoundError:
+                    continue
+                manifest[path] = (stat.st_size, stat.st_mtime_ns)
+        return manifest
+
+    def _push_changes(self, manifest):
+        """ Push workdir files changed since the last push """
+        with self._pushed_lock:
+            pushed = self._pushed
+            changed = sorted(
+                path for path, stat in manifest.items()
+                if pushed.get(path) != stat)
+            removed = sorted(path for path in pushed if path not in manifest)
+        self.debug(
+            f"Push {fmf.utils.listed(changed, 'changed file')} and remove "
+            f"{fmf.utils.listed(removed, 'file')} on guest '{self.guest}'.")
+        for start in range(0, len(removed), PUSH_REMOVE_CHUNK):
+            self.execute(['rm', '-rf', '--'] + [
+                shlex.quote(path)
+                for path in removed[start:start + PUSH_REMOVE_CHUNK]])
+        if changed:
+            with tempfile.NamedTemporaryFile('w') as files:
+                files.write('\n'.join(changed) + '\n')
+                files.flush()
+                self.push(
+                    source='/', destination='/',
+                    options=['--files-from', files.name, '-z', '--links',
+                             '--safe-links'])
+        with self._pushed_lock:
+            self._pushed = manifest
+
+    def _record_pulled(self, sources):
+        """
+        Record files pulled into the workdir as pushed
+
+        Pulled files get a new modification time but their content is
+        the same as on the guest, there is no need to push them back.
+        """
+        workdir = self.parent.plan.workdir
+        pulled = dict()
+        for source in sources:
+            path = os.path.normpath(source)
+            if os.path.commonpath([path, workdir]) != workdir:
+                continue
+            if os.path.isdir(path) and not os.path.islink(path):
+                pulled[path] = 'directory'
+                pulled.update(self._workdir_manifest(path))
+            elif os.path.lexists(path):
+                stat = os.lstat(path)
+                pulled[path] = (stat.st_size, stat.st_mtime_ns)
+        # Update in place, guest copies used by steps share the manifest
+        with self._pushed_lock:
+            if self._pushed is not None:
+                self._pushed.update(pulled)
+
+    @tmt.utils.timed('guest-pull')
     def pull(
             self,
             source=None,
@@ -753,8 +1175,11 @@ class GuestSsh(Guest):
         location on the guest. Use the 'source' and 'destination' to
         sync custom location, the 'options' parameter to modify
         default options '-Rrz --links --safe-links --protect-args'
-        and 'extend_options' to extend them (e.g. by exclude).
+        and 'extend_options' to extend them (e.g. by exclude). Provide
+        a list of sources to pull several locations at once.
         """
+        # Files are pulled into the same location with default options
+        same_location = options is None and destination is None
         # Prepare options and the pull command
         if options is None:
             options = "-Rrz --links --safe-links --protect-args".split()
@@ -767,13 +1192,15 @@ class GuestSsh(Guest):
             self.debug(f"Pull workdir from guest '{self.guest}'.")
         else:
             self.debug(f"Copy '{source}' from the guest to '{destination}'.")
+        sources = source if isinstance(source, list) else [source]
 
         def rsync():
             """ Run the rsync command """
             self.run(
                 ["rsync"] + options
                 + ["-e", self._ssh_command(join=True)]
-                + [f"{self._ssh_guest()}:{source}", destination])
+                + [f"{self._ssh_guest()}:{source}" for source in sources]
+                + [destination])
 
         # Try to pull twice, check for rsync after the first failure
         try:
@@ -790,6 +1217,8 @@ class GuestSsh(Guest):
                     f"This usually means that login as '{self.user}' "
                     f"to the guest does not work.")
                 raise
+        if same_location:
+            self._record_pulled(sources)
 
     def stop(self):
         """
@@ -800,7 +1229,9 @@ class GuestSsh(Guest):
         necessary to store the instance status to disk.
         """
 
-        # Close the master ssh connection
+        # Close the agent session and the master ssh connection
+        if self._agent:
+            self._agent.stop()
         if self._ssh_master_process:
             self.debug("Close the master ssh connection.", level=3)
             try:
@@ -68,6 +68,7 @@ class GuestLocal(tmt.Guest):
             env=self._prepare_environment())
         self._ansible_summary(stdout)
 
+    @tmt.utils.timed('guest-execute')
     def execute(self, command, **kwargs):
         """ Execute command on localhost """
         # Prepare the environment (plan/cli variables override)
@@ -89,9 +90,11 @@ class GuestLocal(tmt.Guest):
 
         return False
 
+    @tmt.utils.timed('guest-push')
     def push(self, source=None, destination=None, options=None):
         """ Nothing to be done to push workdir """
 
+    @tmt.utils.timed('guest-pull')
     def pull(
             self,
             source=None,
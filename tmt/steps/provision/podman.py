@@ -189,6 +189,7 @@ class GuestContainer(tmt.Guest):
         """ Run given command via podman """
         return self.run(['podman'] + command, **kwargs)
 
+    @tmt.utils.timed('guest-execute')
     def execute(self, command, **kwargs):
         """ Execute given commands in podman via shell """
         if not self.container and not self.opt('dry'):
@@ -216,6 +217,7 @@ class GuestContainer(tmt.Guest):
             ['exec'] + interactive +
             [self.container or 'dry', 'bash', '-c', command], **kwargs)
 
+    @tmt.utils.timed('guest-push')
     def push(self, source=None, destination=None, options=None):
         """ Make sure that the workdir has a correct selinux context """
         self.debug("Update selinux context of the run workdir.", level=3)
@@ -227,6 +229,7 @@ class GuestContainer(tmt.Guest):
         if destination:
             self.podman(["cp", source, f"{self.container}:{destination}"])
 
+    @tmt.utils.timed('guest-pull')
     def pull(
             self,
             source=None,
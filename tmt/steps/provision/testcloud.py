@@ -1,8 +1,15 @@
 # coding: utf-8
 
+import contextlib
+import fcntl
+import hashlib
+import json
 import os
 import platform
 import re
+import shutil
+import tempfile
+import threading
 import time
 from typing import Optional
 
@@ -36,6 +43,11 @@ def import_testcloud():
 # Testcloud cache to our tmt's workdir root
 TESTCLOUD_DATA = os.path.join(WORKDIR_ROOT, 'testcloud')
 TESTCLOUD_IMAGES = os.path.join(TESTCLOUD_DATA, 'images')
+TESTCLOUD_POOL = os.path.join(TESTCLOUD_DATA, 'pool')
+TESTCLOUD_SNAPSHOTS = os.path.join(TESTCLOUD_DATA, 'snapshots')
+
+# Guests provisioned concurrently must not download the same image twice
+IMAGE_LOCK = threading.Lock()
 
 # Userdata for cloud-init
 USER_DATA = """#cloud-config
@@ -145,6 +157,9 @@ DEFAULT_CONNECT_TIMEOUT = 60   # seconds
 NON_KVM_ADDITIONAL_WAIT = 10       # seconds
 NON_KVM_TIMEOUT_COEF = 10          # times
 
+# Guests booting for the pool longer than this are considered lost
+POOL_BOOT_TIMEOUT = 3600           # seconds
+
 # SSH key type, set None for ssh-keygen default one
 SSH_KEYGEN_TYPE = "ecdsa"
 
@@ -165,6 +180,8 @@ class ProvisionTestcloud(tmt.steps.provision.ProvisionPlugin):
             image: fedora
             user: root
             memory: 2048
+            pool: 2
+            snapshot: true
 
     As the image use 'fedora' for the latest released Fedora compose,
     'rawhide' for the latest Rawhide compose, short aliases such as
@@ -189,6 +206,17 @@ class ProvisionTestcloud(tmt.steps.provision.ProvisionPlugin):
 
     In addition to the qcow2 format, vagrant boxes can be used as well,
     testcloud will take care of unpacking the image for you.
+
+    Use 'pool' to keep the given number of booted guests ready for
+    future plans with the same configuration. A ready guest is used
+    instantly instead of booting a new one, the pool is replenished
+    in the background and guests are returned to the pool with a
+    clean disk once the plan is finished.
+
+    Enable 'snapshot' to store the guest disk once the prepare step is
+    finished. Future plans with the same provision and prepare config
+    start from the snapshot and skip the preparation. Snapshots are
+    removed together with images by 'tmt clean images'.
     """
 
     # Guest instance
@@ -200,7 +228,9 @@ class ProvisionTestcloud(tmt.steps.provision.ProvisionPlugin):
         ]
 
     # Supported keys
-    _keys = ["image", "user", "memory", "disk", "connection", "arch"]
+    _keys = [
+        "image", "user", "memory", "disk", "connection", "arch", "pool",
+        "snapshot"]
 
     @classmethod
     def options(cls, how=None):
@@ -227,6 +257,12 @@ class ProvisionTestcloud(tmt.steps.provision.ProvisionPlugin):
                 '-a', '--arch',
                 type=click.Choice(['x86_64', 'aarch64', 's390x', 'ppc64le']),
                 help="What architecture to virtualize, host arch by default."),
+            click.option(
+                '--pool', metavar='COUNT', type=int,
+                help='Keep given number of booted guests ready for reuse.'),
+            click.option(
+                '--snapshot', is_flag=True,
+                help='Start from a snapshot of the prepared guest.'),
             ] + super().options(how)
 
     def default(self, option, default=None):
@@ -292,8 +328,14 @@ class ProvisionTestcloud(tmt.steps.provision.ProvisionPlugin):
             clean.warn(
                 f"Directory '{TESTCLOUD_IMAGES}' does not exist.", shift=2)
             return
-        for image in os.listdir(TESTCLOUD_IMAGES):
-            image = os.path.join(TESTCLOUD_IMAGES, image)
+        images = [
+            os.path.join(TESTCLOUD_IMAGES, image)
+            for image in os.listdir(TESTCLOUD_IMAGES)]
+        if os.path.exists(TESTCLOUD_SNAPSHOTS):
+            images.extend(
+                os.path.join(TESTCLOUD_SNAPSHOTS, snapshot)
+                for snapshot in os.listdir(TESTCLOUD_SNAPSHOTS))
+        for image in images:
             if dry:
                 clean.verbose(f"Would remove '{image}'.", shift=2)
             else:
@@ -301,6 +343,127 @@ class ProvisionTestcloud(tmt.steps.provision.ProvisionPlugin):
                 os.remove(image)
 
 
+class GuestPool(object):
+    """
+    Booted testcloud guests ready to be used by future plans
+
+    Each guest is stored as a yaml file with its wake up data in the
+    directory specific to the guest configuration. Guests are taken
+    from the pool by renaming the file so that concurrently running
+    plans never get the same guest. Guests being booted for the pool
+    are represented by placeholder files so that the pool is never
+    filled over the requested size.
+    """
+
+    # Guest attributes which must match for the guest to be reused
+    _keys = ['image_url', 'user', 'memory', 'disk', 'connection', 'arch']
+
+    def __init__(self, guest):
+        """ Prepare pool directory for the guest configuration """
+        config = dict((key, getattr(guest, key)) for key in self._keys)
+        digest = hashlib.sha256(
+            json.dumps(config, sort_keys=True).encode()).hexdigest()
+        self.directory = os.path.join(TESTCLOUD_POOL, digest[:16])
+        os.makedirs(self.directory, exist_ok=True)
+
+    @contextlib.contextmanager
+    def _lock(self):
+        """ Lock the pool against concurrently running plans """
+        with open(os.path.join(self.directory, 'lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def ready(self):
+        """ Names of instances ready in the pool """
+        return sorted(
+            name[:-len('.yaml')] for name in os.listdir(self.directory)
+            if name.endswith('.yaml'))
+
+    def booting(self):
+        """ Placeholders of guests being booted for the pool """
+        placeholders = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.booting'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                age = time.time() - os.path.getmtime(path)
+            except FileNotFoundError:
+                continue
+            # Boot interrupted without removing its placeholder
+            if age > POOL_BOOT_TIMEOUT:
+                self.release(path)
+                continue
+            placeholders.append(path)
+        return sorted(placeholders)
+
+    def reserve(self, size):
+        """ Reserve places for guests missing in the pool of given size """
+        with self._lock():
+            missing = size - len(self.ready()) - len(self.booting())
+            placeholders = []
+            for _ in range(missing):
+                handle, path = tempfile.mkstemp(
+                    suffix='.booting', dir=self.directory)
+                os.close(handle)
+                placeholders.append(path)
+            return placeholders
+
+    def release(self, placeholder):
+        """ Remove the placeholder of a guest which failed to boot """
+        try:
+            os.remove(placeholder)
+        except FileNotFoundError:
+            pass
+
+    def take(self):
+        """ Take a guest from the pool, return its data or None """
+        for name in self.ready():
+            path = os.path.join(self.directory, f'{name}.yaml')
+            taken = f'{path}.taken'
+            try:
+                os.rename(path, taken)
+            except FileNotFoundError:
+                # Already taken by somebody else
+                continue
+            with open(taken) as data:
+                content = tmt.utils.yaml_to_dict(data.read())
+            os.remove(taken)
+            return content
+        return None
+
+    def put(self, guest, size, placeholder=None):
+        """
+        Store the guest in the pool unless it has given size already
+
+        Release the placeholder reserved for the guest if provided.
+        Return True if the guest was stored, False otherwise.
+        """
+        with self._lock():
+            if placeholder:
+                self.release(placeholder)
+            if len(self.ready()) + len(self.booting()) >= size:
+                return False
+            data = guest.save()
+            for key in ['role', 'pool', 'prepared']:
+                data.pop(key, None)
+            # The key has to outlive the run workdir
+            key = os.path.join(self.directory, f'{guest.instance_name}.key')
+            if guest.key != key:
+                shutil.copyfile(guest.key, key)
+                os.chmod(key, 0o600)
+            data['key'] = key
+            path = os.path.join(
+                self.directory, f'{guest.instance_name}.yaml')
+            with open(f'{path}.new', 'w') as content:
+                content.write(tmt.utils.dict_to_yaml(data))
+            os.rename(f'{path}.new', path)
+            return True
+
+
 class GuestTestcloud(tmt.GuestSsh):
     """
     Testcloud Instance
@@ -313,6 +476,8 @@ class GuestTestcloud(tmt.GuestSsh):
         disk ....... disk size for vm
         connection . either session (default) or system, to be passed to qemu
         arch ....... architecture for the VM, host arch is the default
+        pool ....... number of booted guests to keep ready for reuse
+        snapshot ... start from a snapshot of the prepared guest
     """
 
     # Not to be saved, recreated from image_url/instance_name/... every
@@ -419,6 +584,10 @@ class GuestTestcloud(tmt.GuestSsh):
         self.disk = data.get('disk')
         self.connection = data.get('connection')
         self.arch = data.get('arch')
+        self.pool = data.get('pool')
+        self.snapshot = data.get('snapshot')
+        # Fingerprint of preparations applied in the snapshot used
+        self.prepared = data.get('prepared')
 
     def save(self):
         """ Save guest data for future wake up """
@@ -426,8 +595,16 @@ class GuestTestcloud(tmt.GuestSsh):
         data['instance_name'] = self.instance_name
         data['image'] = self.image
         data['image_url'] = self.image_url
+        data['memory'] = self.memory
+        data['disk'] = self.disk
         data['connection'] = self.connection
         data['arch'] = self.arch
+        if self.pool:
+            data['pool'] = self.pool
+        if self.snapshot:
+            data['snapshot'] = self.snapshot
+        if self.prepared:
+            data['prepared'] = self.prepared
         return data
 
     def wake(self):
@@ -500,13 +677,21 @@ class GuestTestcloud(tmt.GuestSsh):
             self.image_url = self._guess_image_url(self.image_url)
             self.debug(f"Guessed image url: '{self.image_url}'", level=3)
 
+        # Use a booted guest from the pool if there is one
+        if self.pool:
+            taken = self._take_from_pool()
+            self._replenish_pool()
+            if taken:
+                return
+
         # Initialize and prepare testcloud image
         self._image = testcloud.image.Image(self.image_url)
         self.verbose('qcow', self._image.name, 'green')
-        if not os.path.exists(self._image.local_path):
-            self.info('progress', 'downloading...', 'cyan')
         try:
-            self._image.prepare()
+            with IMAGE_LOCK:
+                if not os.path.exists(self._image.local_path):
+                    self.info('progress', 'downloading...', 'cyan')
+                self._image.prepare()
         except FileNotFoundError as error:
             raise ProvisionError(
                 f"Image '{self._image.local_path}' not found.", original=error)
@@ -554,6 +739,7 @@ class GuestTestcloud(tmt.GuestSsh):
         self._instance.disk_size = self.disk
         try:
             self._instance.prepare()
+            self._restore_snapshot()
             self._instance.spawn_vm()
             self._instance.start(DEFAULT_BOOT_TIMEOUT * time_coeff)
         except (testcloud.exceptions.TestcloudInstanceError,
@@ -565,8 +751,10 @@ class GuestTestcloud(tmt.GuestSsh):
         self.verbose('ip', self.guest, 'green')
         self.verbose('port', self.port, 'green')
         self._instance.create_ip_file(self.guest)
+        self._wait_for_connection(time_coeff)
 
-        # Wait a bit until the box is up
+    def _wait_for_connection(self, time_coeff):
+        """ Wait a bit until the box is up """
         timeout = DEFAULT_CONNECT_TIMEOUT * time_coeff
         wait = 1
         while True:
@@ -593,6 +781,158 @@ class GuestTestcloud(tmt.GuestSsh):
                 f"for non-kvm instance...")
             time.sleep(NON_KVM_ADDITIONAL_WAIT)
 
+    def _snapshot_path(self, fingerprint):
+        """ Snapshot path for given preparations and guest config """
+        config = dict((key, getattr(self, key)) for key in GuestPool._keys)
+        config['prepared'] = fingerprint
+        digest = hashlib.sha256(
+            json.dumps(config, sort_keys=True).encode()).hexdigest()
+        return os.path.join(TESTCLOUD_SNAPSHOTS, f'{digest[:16]}.qcow2')
+
+    def _restore_snapshot(self):
+        """ Back the instance disk by the snapshot if available """
+        if not self.snapshot:
+            return
+        fingerprint = self.parent.plan.prepare.fingerprint()
+        path = self._snapshot_path(fingerprint)
+        if not os.path.exists(path):
+            self.debug(f"Snapshot '{path}' not found.")
+            return
+        self.run([
+            'qemu-img', 'create', '-f', 'qcow2', '-F', 'qcow2',
+            '-b', path, self._instance.image_path, f'{self.disk}G'])
+        self.prepared = fingerprint
+        self.verbose('snapshot', path, 'green')
+
+    def restored(self, fingerprint):
+        """ Check whether the guest was started from a prepared snapshot """
+        return self.prepared == fingerprint
+
+    def snapshot_prepared(self, fingerprint):
+        """ Store the disk of the prepared guest """
+        if not self.snapshot or self.opt('dry') or self.restored(fingerprint):
+            return
+        path = self._snapshot_path(fingerprint)
+        if os.path.exists(path):
+            return
+        self.info('snapshot', 'storing...', 'cyan')
+        # The disk overlay is stored as it is, backed by the original
+        # image, which requires the instance to be stopped meanwhile
+        self.execute('sync')
+        os.makedirs(TESTCLOUD_SNAPSHOTS, exist_ok=True)
+        try:
+            self._instance.stop()
+            tmt.GuestSsh.stop(self)
+            # Concurrent plans may store the same snapshot at once
+            temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.new'
+            try:
+                shutil.copyfile(self._instance.image_path, temporary)
+                os.replace(temporary, path)
+            except BaseException:
+                if os.path.exists(temporary):
+                    os.remove(temporary)
+                raise
+            time_coeff = NON_KVM_TIMEOUT_COEF if not self._instance.kvm else 1
+            self._instance.start(DEFAULT_BOOT_TIMEOUT * time_coeff)
+        except (testcloud.exceptions.TestcloudInstanceError,
+                libvirt.libvirtError) as error:
+            raise ProvisionError(f'Failed to store the snapshot ({error}).')
+        self._wait_for_connection(time_coeff)
+        self.prepared = fingerprint
+        self.verbose('snapshot', path, 'green')
+
+    def _take_from_pool(self):
+        """ Take a booted guest from the pool, return True on success """
+        pool = GuestPool(self)
+        while True:
+            data = pool.take()
+            if data is None:
+                self.debug('No booted guest ready in the pool.')
+                return False
+            self.load(dict(self.save(), **data))
+            self.wake()
+            try:
+                self.execute('whoami')
+            except tmt.utils.RunError:
+                self.debug(
+                    f"Pooled guest '{self.instance_name}' is not responding.")
+                self._discard()
+                continue
+            self.verbose('name', self.instance_name, 'green')
+            self.info('progress', 'taken from the pool', 'cyan')
+            return True
+
+    def _replenish_pool(self):
+        """ Boot new guests in the background to fill up the pool """
+        pool = GuestPool(self)
+        for index, placeholder in enumerate(pool.reserve(self.pool)):
+            data = self.save()
+            data.pop('pool')
+            data.pop('role', None)
+            data['image'] = self.image_url
+            guest = GuestTestcloud(
+                data, name=f'{self.name}-pool-{index}', parent=self.parent)
+            self.debug(f"Boot guest '{guest.name}' for the pool.")
+            threading.Thread(
+                target=tmt.utils.in_current_span(guest._boot_for_pool),
+                args=(pool, self.pool, placeholder)).start()
+
+    def _boot_for_pool(self, pool, size, placeholder):
+        """ Boot the guest and store it in the pool of given size """
+        try:
+            with tmt.utils.buffered_output():
+                self.start()
+            # Close the master connection, the guest keeps running
+            tmt.GuestSsh.stop(self)
+            if pool.put(self, size, placeholder):
+                return
+            self.debug(f"Pool is full, remove '{self.instance_name}'.")
+        except Exception as error:
+            self.warn(f"Failed to boot guest for the pool: {error}")
+            pool.release(placeholder)
+        self._discard()
+
+    def _recycle(self):
+        """ Reset the disk and return the guest to the pool if needed """
+        pool = GuestPool(self)
+        if len(pool.ready()) + len(pool.booting()) >= self.pool:
+            return False
+        self.debug(f"Return '{self.instance_name}' to the pool.")
+        try:
+            try:
+                self._instance.stop()
+            except testcloud.exceptions.TestcloudInstanceError:
+                # Already stopped by the finish step
+                pass
+            # Recreate the disk overlay on top of the original image
+            self.run([
+                'qemu-img', 'create', '-f', 'qcow2', '-F', 'qcow2',
+                '-b', self._image.local_path, self._instance.image_path,
+                f'{self.disk}G'])
+            time_coeff = NON_KVM_TIMEOUT_COEF if not self._instance.kvm else 1
+            self._instance.start(DEFAULT_BOOT_TIMEOUT * time_coeff)
+            self._wait_for_connection(time_coeff)
+            tmt.GuestSsh.stop(self)
+            if not pool.put(self, self.pool):
+                self.debug("Pool has been filled meanwhile.")
+                return False
+        except (tmt.utils.GeneralError,
+                testcloud.exceptions.TestcloudInstanceError,
+                libvirt.libvirtError) as error:
+            self.warn(f"Failed to return guest to the pool: {error}")
+            return False
+        self.info('guest', 'returned to the pool', 'green')
+        return True
+
+    def _discard(self):
+        """ Remove a broken pooled instance, ignore errors """
+        if not self._instance:
+            return
+        try:
+            self._instance.remove(autostop=True)
+        except Exception as error:
+            self.debug(f"Failed to remove '{self.instance_name}': {error}")
+
     def stop(self):
         """ Stop provisioned guest """
         super().stop()
@@ -608,6 +948,8 @@ class GuestTestcloud(tmt.GuestSsh):
 
     def remove(self):
         """ Remove the guest (disk cleanup) """
+        if self._instance and self.pool and self._recycle():
+            return
         if self._instance:
             self.debug(f"Removing testcloud instance '{self.instance_name}'.")
             try:
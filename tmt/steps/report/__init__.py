@@ -51,7 +51,8 @@ class Report(tmt.steps.Step):
 
         # Perform the reporting
         for phase in self.phases():
-            phase.go()
+            with phase.timed_event('phase'):
+                phase.go()
 
         # Give a summary, update status and save
         self.summary()
@@ -81,6 +82,9 @@ class ReportPlugin(tmt.steps.Plugin):
     # List of all supported methods aggregated from all plugins
     _supported_methods = []
 
+    # Name of the step, used for loading its plugins
+    _step_name = 'report'
+
     @classmethod
     def base_command(cls, method_class=None, usage=None):
         """ Create base click command (common for all report plugins) """
@@ -1,26 +1,33 @@
 
 """ Test Metadata Utilities """
 
+import atexit
+import codecs
 import contextlib
 import dataclasses
 import datetime
+import fcntl
 import glob
+import hashlib
 import io
+import json
 import os
+import pickle
 import pprint
 import re
 import shlex
 import shutil
 import subprocess
 import sys
+import time
 import unicodedata
-from collections import OrderedDict
-from functools import lru_cache
+from collections import OrderedDict, deque
+from functools import lru_cache, wraps
 from pathlib import Path
-from threading import Thread
-from typing import (IO, TYPE_CHECKING, Any, Dict, Generator, Iterable, List,
-                    NamedTuple, Optional, Pattern, Tuple, Type, TypeVar, Union,
-                    cast, overload)
+from threading import Lock, Thread, current_thread, local
+from typing import (IO, TYPE_CHECKING, Any, Callable, ContextManager, Deque,
+                    Dict, Generator, Iterable, List, NamedTuple, Optional,
+                    Pattern, Tuple, Type, TypeVar, Union, cast, overload)
 
 import click
 import fmf
@@ -51,6 +58,15 @@ WORKDIR_MAX = 1000
 # Log in workdir
 LOG_FILENAME = 'log.txt'
 
+# Structured event log in workdir (enabled by 'tmt run --events')
+EVENTS_FILENAME = 'events.jsonl'
+
+# Timings of steps, phases, tests and guest operations in workdir
+TIMINGS_FILENAME = 'timings.yaml'
+
+# Trace of the run in the Chrome trace event format in workdir
+TRACE_FILENAME = 'trace.json'
+
 # Maximum number of lines of stdout/stderr to show upon errors
 OUTPUT_LINES = 100
 # Default output width
@@ -69,9 +85,34 @@ DEFAULT_PLUGIN_ORDER_RECOMMENDS = 75
 # Config directory
 CONFIG_PATH = '~/.config/tmt'
 
+# Cache directory (can be changed using the TMT_CACHE environment
+# variable) and parsed metadata tree cache settings
+CACHE_PATH = '~/.cache/tmt'
+TREE_CACHE_DIRECTORY = 'trees'
+# Least recently used trees are removed when the total size of the
+# cache exceeds given number of bytes or when not used for given
+# number of seconds
+TREE_CACHE_SIZE = 256 * 1024 ** 2
+TREE_CACHE_AGE = 30 * 24 * 3600
+# Files modified less than given number of seconds ago are not cached
+# (modification time resolution of some filesystems is quite coarse)
+TREE_CACHE_RACY_WINDOW = 2
+# Git repository mirrors are fetched again when older than given number
+# of seconds, least recently used mirrors are removed when the total
+# size of the cache exceeds given number of bytes
+GIT_CACHE_DIRECTORY = 'git'
+GIT_CACHE_TTL = 600
+GIT_CACHE_SIZE = 2 * 1024 ** 3
+
 # Special process return code
 PROCESS_TIMEOUT = 124
 
+# Size of the command output tail kept in memory when streamed to a file
+OUTPUT_TAIL_SIZE = 1024 * 1024
+
+# Maximum size of a single chunk of the command output read at once
+OUTPUT_CHUNK_SIZE = 64 * 1024
+
 # Default select.select(timeout) in seconds
 DEFAULT_SELECT_TIMEOUT = 5
 
@@ -90,6 +131,9 @@ ENVFILE_RETRY_SESSION_BACKOFF_FACTOR: float = 1
 # A stand-in variable for generic use.
 T = TypeVar('T')
 
+# A stand-in variable for decorated functions.
+F = TypeVar('F', bound=Callable[..., Any])
+
 # A FMF context type, representing name/values context.
 FmfContextType = Dict[str, List[str]]
 
@@ -215,6 +259,377 @@ class Config(object):
         return None
 
 
+def cache_path() -> str:
+    """ Path to the cache directory """
+    return os.path.expanduser(os.environ.get('TMT_CACHE', CACHE_PATH))
+
+
+class TreeCache(object):
+    """
+    Persistent cache of parsed and adjusted fmf trees
+
+    The adjusted tree is stored in a pickle file under the cache
+    directory, one file for each combination of the metadata root and
+    fmf context. Path, modification time and size of all metadata
+    files are stored together with the tree and the cached tree is
+    used only if none of the files has been added, removed or changed.
+
+    Trees not used for 'age' seconds are removed, least recently used
+    trees are removed when the cache grows over 'size' bytes.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            context: FmfContextType,
+            directory: Optional[str] = None,
+            size: int = TREE_CACHE_SIZE,
+            age: int = TREE_CACHE_AGE) -> None:
+        """ Find the metadata root, prepare the cache file path """
+        self.root = self._find_root(path)
+        self.directory = os.path.join(
+            os.path.expanduser(directory or cache_path()),
+            TREE_CACHE_DIRECTORY)
+        self.size = size
+        self.age = age
+        self._manifest: Optional[List[Tuple[str, int, int]]] = None
+        key = json.dumps([
+            self.root,
+            sorted(context.items()),
+            fmf.__version__,
+            list(sys.version_info[:2]),
+            ])
+        self.path = os.path.join(
+            self.directory,
+            hashlib.sha256(key.encode('utf-8')).hexdigest() + '.pickle')
+
+    @staticmethod
+    def _find_root(path: str) -> Optional[str]:
+        """ Return the metadata root for given path, None if not found """
+        root = os.path.abspath(path)
+        while not os.path.isdir(os.path.join(root, '.fmf')):
+            if root == os.path.dirname(root):
+                return None
+            root = os.path.dirname(root)
+        return root
+
+    def manifest(self) -> List[Tuple[str, int, int]]:
+        """ Path, modification time and size of all metadata files """
+        if self._manifest is not None:
+            return self._manifest
+        assert self.root is not None
+        manifest = []
+        visited = set()
+        for dirpath, dirnames, filenames in os.walk(
+                self.root, followlinks=True):
+            # Avoid symlink loops, skip hidden directories like fmf does
+            real_path = os.path.realpath(dirpath)
+            if real_path in visited:
+                dirnames[:] = []
+                continue
+            visited.add(real_path)
+            dirnames[:] = [
+                dirname for dirname in dirnames
+                if not dirname.startswith('.') or dirname == '.fmf']
+            for filename in filenames:
+                if not (filename.endswith('.fmf')
+                        or os.path.basename(dirpath) == '.fmf'):
+                    continue
+                full_path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(full_path)
+                except OSError:
+                    continue
+                manifest.append((
+                    os.path.relpath(full_path, self.root),
+                    stat.st_mtime_ns,
+                    stat.st_size))
+        self._manifest = sorted(manifest)
+        return self._manifest
+
+    def load(self) -> Optional[fmf.Tree]:
+        """ Return the cached tree if it is still valid """
+        if self.root is None:
+            return None
+        try:
+            with open(self.path, 'rb') as cache:
+                data = pickle.load(cache)
+        except (OSError, pickle.PickleError, EOFError,
+                AttributeError, ImportError):
+            return None
+        if data.get('manifest') != self.manifest():
+            log.debug(f"Metadata tree cache '{self.path}' is outdated.")
+            return None
+        log.debug(f"Using metadata tree cache '{self.path}'.")
+        # Mark the tree as recently used
+        try:
+            os.utime(self.path)
+        except OSError:
+            pass
+        return cast(fmf.Tree, data.get('tree'))
+
+    def save(self, tree: fmf.Tree) -> None:
+        """ Store the tree, silently give up if not possible """
+        if self.root is None:
+            return
+        # Changes in freshly modified files might go unnoticed
+        racy_limit = (
+            datetime.datetime.now().timestamp() - TREE_CACHE_RACY_WINDOW) * 1e9
+        if any(mtime > racy_limit for _, mtime, _ in self.manifest()):
+            log.debug("Metadata recently modified, not caching the tree.")
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Write to a temporary file first to make the update atomic
+            temporary = f"{self.path}.{os.getpid()}"
+            with open(temporary, 'wb') as cache:
+                pickle.dump(
+                    {'manifest': self.manifest(), 'tree': tree},
+                    cache, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self.path)
+        except (OSError, pickle.PickleError, RecursionError) as error:
+            log.debug(f"Unable to cache the metadata tree: {error}")
+            return
+        self.evict()
+
+    def evict(self) -> None:
+        """ Remove old and least recently used trees over the limit """
+        trees = []
+        for path in glob.glob(os.path.join(self.directory, '*.pickle')):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            trees.append((stat.st_mtime, stat.st_size, path))
+        trees.sort()
+        total = sum(size for _, size, _ in trees)
+        limit = time.time() - self.age
+        for mtime, size, path in trees:
+            if total <= self.size and mtime >= limit:
+                break
+            if path == self.path:
+                continue
+            log.debug(f"Remove metadata tree cache '{path}'.")
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+
+class GitCache(object):
+    """
+    Persistent cache of git repository mirrors
+
+    Each remote repository is stored as a bare clone under the cache
+    directory. Mirrors older than 'ttl' seconds are updated before use
+    and when the requested ref is not available, 'update' can be used
+    to always fetch the latest changes. If the remote cannot be
+    reached the mirror is used as it is. Repositories are cloned
+    from the mirror, no network access is needed for known ones.
+
+    Concurrent tmt processes are synchronized using file locks. When
+    the cache grows over 'size' bytes, least recently used mirrors
+    are removed.
+    """
+
+    # Files tracking the last update and the last use of a mirror
+    FETCHED = 'tmt-fetched'
+    USED = 'tmt-used'
+
+    def __init__(
+            self,
+            common: 'Common',
+            directory: Optional[str] = None,
+            ttl: int = GIT_CACHE_TTL,
+            size: int = GIT_CACHE_SIZE) -> None:
+        """ Prepare the cache directory path """
+        self.common = common
+        self.directory = os.path.join(
+            os.path.expanduser(directory or cache_path()),
+            GIT_CACHE_DIRECTORY)
+        self.ttl = ttl
+        self.size = size
+
+    def path(self, url: str) -> str:
+        """ Mirror path for given repository url """
+        name = re.sub(r'[^\w.-]', '_', url.rstrip('/').split('/')[-1])
+        digest = hashlib.sha256(url.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.directory, f'{name}-{digest}.git')
+
+    @contextlib.contextmanager
+    def _lock(
+            self,
+            path: str,
+            shared: bool = False,
+            blocking: bool = True) -> Generator[None, None, None]:
+        """ Lock given mirror, raise BlockingIOError if not available """
+        os.makedirs(self.directory, exist_ok=True)
+        with open(f'{path}.lock', 'a') as lock:
+            operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+            if not blocking:
+                operation |= fcntl.LOCK_NB
+            fcntl.flock(lock, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _git(self, command: List[str], cwd: Optional[str] = None) -> str:
+        """ Run git command with disabled prompt, return its output """
+        output = self.common.run(
+            ['git'] + command, cwd=cwd, env={"GIT_ASKPASS": "echo"})
+        return output.stdout or ''
+
+    def _has_ref(self, path: str, ref: str) -> bool:
+        """ Check whether the mirror contains given ref """
+        try:
+            self._git(
+                ['rev-parse', '--verify', '--quiet', f'{ref}^{{commit}}'],
+                cwd=path)
+            return True
+        except RunError:
+            return False
+
+    def mirror(
+            self,
+            url: str,
+            ref: Optional[str] = None,
+            update: bool = False) -> str:
+        """
+        Create or update the mirror of given repository if needed
+
+        Use 'update' to fetch the latest changes regardless of the
+        mirror age (unless 'ref' is a commit already available).
+        """
+        path = self.path(url)
+        with self._lock(path):
+            # Clone into a temporary directory to keep the mirror complete
+            if not os.path.isdir(path):
+                self.common.debug(f"Create mirror of '{url}' in '{path}'.")
+                temporary = f'{path}.{os.getpid()}'
+                shutil.rmtree(temporary, ignore_errors=True)
+                try:
+                    self._git(['clone', '--bare', url, temporary])
+                    # Track branches and tags only (not pull requests etc.)
+                    self._git([
+                        'config', 'remote.origin.fetch',
+                        '+refs/heads/*:refs/heads/*'], cwd=temporary)
+                except RunError:
+                    shutil.rmtree(temporary, ignore_errors=True)
+                    raise
+                Path(temporary, self.FETCHED).touch()
+                os.rename(temporary, path)
+                created = True
+            else:
+                created = False
+                fetched = os.path.join(path, self.FETCHED)
+                age = time.time() - os.path.getmtime(fetched)
+                has_ref = ref is None or self._has_ref(path, ref)
+                is_commit = ref is not None and has_ref and bool(
+                    re.fullmatch(r'[0-9a-f]{40}', ref))
+                if age > self.ttl or not has_ref or (
+                        update and not is_commit):
+                    self.common.debug(f"Update mirror of '{url}'.")
+                    try:
+                        self._git(
+                            ['fetch', '--prune', '--tags', 'origin'], cwd=path)
+                        Path(fetched).touch()
+                    except RunError:
+                        self.common.warn(
+                            f"Unable to update mirror of '{url}', "
+                            f"using the cached copy.")
+            Path(path, self.USED).touch()
+        if created:
+            self.evict(keep=path)
+        return path
+
+    @contextlib.contextmanager
+    def _mirror_locked(
+            self,
+            url: str,
+            ref: Optional[str] = None,
+            update: bool = False) -> Generator[str, None, None]:
+        """ Provide the mirror path, prevent its update or removal """
+        while True:
+            path = self.mirror(url, ref, update)
+            with self._lock(path, shared=True):
+                # The mirror might have been evicted in the meantime
+                if os.path.isdir(path):
+                    yield path
+                    return
+
+    def clone(
+            self,
+            url: str,
+            destination: str,
+            ref: Optional[str] = None,
+            update: bool = False) -> None:
+        """ Clone repository into destination, use mirror if possible """
+        # Local clone hardlinks objects where possible and stays valid
+        # even if the mirror is removed from the cache later
+        try:
+            with self._mirror_locked(url, ref, update) as path:
+                self.common.debug(f"Clone '{url}' from mirror '{path}'.")
+                self._git(['clone', '--quiet', path, destination])
+        except OSError as error:
+            self.common.debug(f"Git cache not available: {error}")
+            self._git(['clone', url, destination])
+            return
+        self._git(['remote', 'set-url', 'origin', url], cwd=destination)
+
+    def fetch(
+            self,
+            url: str,
+            repository: str,
+            remote: str,
+            update: bool = False) -> None:
+        """ Add url as a remote of repository, fetch it using mirror """
+        self._git(['remote', 'add', remote, url], cwd=repository)
+        try:
+            with self._mirror_locked(url, update=update) as path:
+                self.common.debug(f"Fetch '{url}' from mirror '{path}'.")
+                self._git(
+                    ['fetch', '--quiet', '--tags', path,
+                     f'+refs/heads/*:refs/remotes/{remote}/*'],
+                    cwd=repository)
+        except OSError as error:
+            self.common.debug(f"Git cache not available: {error}")
+            self._git(['fetch', remote], cwd=repository)
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """ Remove least recently used mirrors over the size limit """
+        def usage(path: str) -> float:
+            try:
+                return os.path.getmtime(os.path.join(path, self.USED))
+            except OSError:
+                return 0
+
+        def disk_size(path: str) -> int:
+            return sum(
+                os.path.getsize(os.path.join(dirpath, filename))
+                for dirpath, _, filenames in os.walk(path)
+                for filename in filenames)
+
+        mirrors = sorted(
+            glob.glob(os.path.join(self.directory, '*.git')), key=usage)
+        sizes = {path: disk_size(path) for path in mirrors}
+        total = sum(sizes.values())
+        for path in mirrors:
+            if total <= self.size:
+                break
+            if path == keep:
+                continue
+            # Skip mirrors currently used by other processes
+            try:
+                with self._lock(path, blocking=False):
+                    self.common.debug(f"Remove mirror '{path}' from cache.")
+                    shutil.rmtree(path, ignore_errors=True)
+            except BlockingIOError:
+                continue
+            total -= sizes[path]
+
+
 class StreamLogger(Thread):
     """
     Reading pipes of running process in threads.
@@ -226,19 +641,26 @@ class StreamLogger(Thread):
     def __init__(self,
                  stream: Optional[IO[bytes]],
                  log_header: str,
-                 logger: BaseLoggerFnType) -> None:
+                 logger: BaseLoggerFnType,
+                 output_file: Optional[IO[str]] = None) -> None:
         super().__init__(daemon=True)
         self.stream = stream
-        self.output: List[str] = []
+        self.output: Deque[str] = deque()
+        self.output_size = 0
         self.log_header = log_header
         self.logger = logger
+        # Write the whole output to the file, keep only the tail
+        self.output_file = output_file
 
     def run(self) -> None:
         if self.stream is None:
             return
 
-        for _line in self.stream:
-            line = _line.decode('utf-8', errors='replace')
+        # Read long lines in chunks, do not break multibyte characters
+        stream = self.stream
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        for chunk in iter(lambda: stream.readline(OUTPUT_CHUNK_SIZE), b''):
+            line = decoder.decode(chunk)
             if line != '':
                 self.logger(
                     self.log_header,
@@ -246,6 +668,12 @@ class StreamLogger(Thread):
                     'yellow',
                     level=3)
             self.output.append(line)
+            if self.output_file is None:
+                continue
+            self.output_file.write(line)
+            self.output_size += len(line)
+            while self.output_size > OUTPUT_TAIL_SIZE:
+                self.output_size -= len(self.output.popleft())
 
     def get_output(self) -> str:
         return "".join(self.output)
@@ -263,6 +691,111 @@ class CommandOutput(NamedTuple):
     stderr: Optional[str]
 
 
+# Messages of the current thread waiting to be printed as a single block
+_output_buffer = local()
+_output_lock = Lock()
+
+# Serialize writing to the log files shared by all threads
+_log_lock = Lock()
+
+# Timed events and spans in progress in the current thread
+_timed_events = local()
+
+
+def _echo(message: str, err: bool = False) -> None:
+    """ Print the message or store it if output buffering is enabled """
+    messages = getattr(_output_buffer, 'messages', None)
+    if messages is None:
+        echo(message, err=err)
+    else:
+        messages.append((message, err))
+
+
+def output_buffer() -> Optional[List[Tuple[str, bool]]]:
+    """ Return messages buffered by the current thread, if buffering """
+    return cast(
+        Optional[List[Tuple[str, bool]]],
+        getattr(_output_buffer, 'messages', None))
+
+
+@contextlib.contextmanager
+def buffered_output(
+        parent: Optional[List[Tuple[str, bool]]] = None
+        ) -> Generator[None, None, None]:
+    """
+    Buffer messages printed by the current thread
+
+    All messages printed using the Common logging methods inside the
+    context are kept in memory and printed as a single uninterrupted
+    block when the context is left. Useful for keeping the output of
+    concurrently running plans readable.
+
+    Messages are handed over to the outer buffer of the current thread
+    or to the provided 'parent' buffer (see output_buffer()) instead of
+    being printed if there is one, so that buffering can be nested even
+    across worker threads.
+    """
+    outer = output_buffer()
+    _output_buffer.messages = []
+    try:
+        yield
+    finally:
+        messages = _output_buffer.messages
+        _output_buffer.messages = outer
+        target = parent if parent is not None else outer
+        with _output_lock:
+            if target is not None:
+                target.extend(messages)
+            else:
+                for message, err in messages:
+                    echo(message, err=err)
+
+
+def timed(event: str) -> Callable[[F], F]:
+    """
+    Record each call of the decorated method as a timed event
+
+    Decorated method has to belong to a Common object. Nested calls
+    of methods recording the same event (e.g. push() calling itself
+    or an overridden method calling its parent) are recorded once.
+    """
+    def decorator(method: F) -> F:
+        @wraps(method)
+        def wrapper(self: 'Common', *args: Any, **kwargs: Any) -> Any:
+            active = _timed_events.__dict__.setdefault('active', set())
+            if event in active:
+                return method(self, *args, **kwargs)
+            active.add(event)
+            try:
+                with self.timed_event(event):
+                    return method(self, *args, **kwargs)
+            finally:
+                active.discard(event)
+        return cast(F, wrapper)
+    return decorator
+
+
+def in_current_span(function: F) -> F:
+    """
+    Run the function inside the span in progress in the current thread
+
+    Spans in progress are tracked for each thread separately. Wrap
+    functions handed over to worker threads so that spans they record
+    are enclosed by the span in which the work was submitted.
+    """
+    submitted = list(_timed_events.__dict__.get('spans', []))
+
+    @wraps(function)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        outer = _timed_events.__dict__.get('spans')
+        _timed_events.spans = list(submitted)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _timed_events.spans = outer if outer is not None else []
+    return cast(F, wrapper)
+
+
 class Common(object):
     """
     Common shared stuff
@@ -278,6 +811,15 @@ class Common(object):
     _options: Dict[str, Any] = dict()
     _workdir: WorkdirType = None
 
+    # Event log field identifying objects of this class (e.g. 'step')
+    _event_field: Optional[str] = None
+
+    # Log files opened by the top parent
+    _log_files: Optional[Dict[str, IO[str]]] = None
+
+    # Timed spans recorded by the top parent
+    _timings: Optional[List[Dict[str, Any]]] = None
+
     def __init__(
             self,
             parent: Optional[CommonDerivedType] = None,
@@ -410,7 +952,27 @@ class Common(object):
             color=color,
             level=self._level() + shift)
 
-    def _log(self, message: str) -> None:
+    def _log_file(
+            self,
+            filename: str,
+            line_buffering: bool = False) -> IO[str]:
+        """ Open given log file in the workdir once, return its handle """
+        assert self.workdir is not None
+        path = os.path.join(self.workdir, filename)
+        if self._log_files is None:
+            self._log_files = dict()
+        log = self._log_files.get(path)
+        if log is None or log.closed:
+            log = open(path, 'a', buffering=1 if line_buffering else -1)
+            atexit.register(log.close)
+            self._log_files[path] = log
+        return log
+
+    def _log(
+            self,
+            message: str,
+            level: str = 'info',
+            origin: Optional['Common'] = None) -> None:
         """ Append provided message to the current log """
         # Nothing to do if there is no workdir
         if self.workdir is None:
@@ -418,11 +980,120 @@ class Common(object):
 
         # Store log only in the top parent
         if self.parent:
-            self.parent._log(message)
-        else:
-            with open(os.path.join(self.workdir, LOG_FILENAME), 'a') as log:
-                log.write(datetime.datetime.utcnow().strftime('%H:%M:%S') + ' '
-                          + remove_color(message) + '\n')
+            self.parent._log(message, level, origin or self)
+            return
+        message = remove_color(message)
+        with _log_lock:
+            self._log_file(LOG_FILENAME, line_buffering=True).write(
+                datetime.datetime.utcnow().strftime('%H:%M:%S') + ' '
+                + message + '\n')
+        self.event(
+            'message', level=level, message=message.strip(), origin=origin)
+
+    def event(
+            self,
+            event: str,
+            origin: Optional['Common'] = None,
+            **fields: Any) -> None:
+        """
+        Record an event in the structured event log
+
+        Events are stored as JSON Lines in the workdir of the top parent
+        if enabled by the 'tmt run --events' option. Each event contains
+        the timestamp, event type and names of the plan, step, phase and
+        guest it belongs to (if any) together with provided fields.
+        """
+        if self.parent:
+            self.parent.event(event, origin=origin or self, **fields)
+            return
+        if self.workdir is None or not self.opt('events'):
+            return
+        data: Dict[str, Any] = dict(
+            timestamp=datetime.datetime.utcnow().isoformat() + 'Z',
+            event=event)
+        data.update(self._event_context(origin or self))
+        data.update(fields)
+        with _log_lock:
+            events = self._log_file(EVENTS_FILENAME)
+            events.write(json.dumps(data, default=str) + '\n')
+            # Make finished steps and tests visible to readers right away
+            if event.endswith('-finish'):
+                events.flush()
+
+    @staticmethod
+    def _event_context(origin: 'Common') -> Dict[str, str]:
+        """ Names of the plan, step, phase and guest given object is in """
+        context: Dict[str, str] = dict()
+        current: Optional[Common] = origin
+        while current is not None:
+            if current._event_field and current._event_field not in context:
+                context[current._event_field] = current.name
+            current = current.parent
+        return context
+
+    def timing(
+            self,
+            span: str,
+            start: datetime.datetime,
+            duration: float,
+            origin: Optional['Common'] = None,
+            **fields: Any) -> None:
+        """ Record a timed span in the top parent """
+        if self.parent:
+            self.parent.timing(
+                span, start, duration, origin=origin or self, **fields)
+            return
+        if self.workdir is None:
+            return
+        data: Dict[str, Any] = dict(
+            span=span, start=start.isoformat() + 'Z', duration=duration)
+        data.update(self._event_context(origin or self))
+        data.update(fields)
+        with _log_lock:
+            if self._timings is None:
+                self._timings = list()
+            self._timings.append(data)
+
+    def timings(self) -> List[Dict[str, Any]]:
+        """ Timed spans recorded so far (in the order they finished) """
+        if self.parent:
+            return self.parent.timings()
+        with _log_lock:
+            return list(self._timings or [])
+
+    @contextlib.contextmanager
+    def timed_event(
+            self,
+            event: str,
+            **fields: Any) -> Generator[Dict[str, Any], None, None]:
+        """
+        Record the start and finish events of the enclosed block
+
+        The '<event>-start' event is recorded when entering the context,
+        '<event>-finish' with the duration in seconds when leaving it.
+        Fields added to the yielded dictionary are included in the
+        finish event. The block is recorded as a timed span as well,
+        together with the span enclosing it and the thread it ran in
+        so that the run can be exported as a trace.
+        """
+        self.event(f'{event}-start', **fields)
+        finish = dict(fields)
+        span = os.urandom(8).hex()
+        spans = _timed_events.__dict__.setdefault('spans', [])
+        parent = spans[-1] if spans else None
+        spans.append(span)
+        started = datetime.datetime.utcnow()
+        start = time.monotonic()
+        try:
+            yield finish
+        finally:
+            duration = round(time.monotonic() - start, 3)
+            spans.pop()
+            self.event(f'{event}-finish', duration=duration, **finish)
+            trace = dict(id=span, thread=current_thread().name)
+            if parent is not None:
+                trace['parent-id'] = parent
+            self.timing(event, started, duration, **trace, **finish)
 
     def print(
             self,
@@ -432,8 +1103,8 @@ class Common(object):
             shift: int = 0,
             err: bool = False) -> None:
         """ Print a message regardless the quiet mode """
-        self._log(self._indent(key, value, color=None, shift=shift))
-        echo(self._indent(key, value, color, shift), err=err)
+        self._log(self._indent(key, value, color=None, shift=shift), 'print')
+        _echo(self._indent(key, value, color, shift), err=err)
 
     def info(
             self,
@@ -445,7 +1116,7 @@ class Common(object):
         """ Show a message unless in quiet mode """
         self._log(self._indent(key, value, color=None, shift=shift))
         if not self.opt('quiet'):
-            echo(self._indent(key, value, color, shift), err=err)
+            _echo(self._indent(key, value, color, shift), err=err)
 
     def verbose(
             self,
@@ -460,9 +1131,9 @@ class Common(object):
 
         In quiet mode verbose messages are not displayed.
         """
-        self._log(self._indent(key, value, color=None, shift=shift))
+        self._log(self._indent(key, value, color=None, shift=shift), 'verbose')
         if not self.opt('quiet') and self.opt('verbose') >= level:
-            echo(self._indent(key, value, color, shift), err=err)
+            _echo(self._indent(key, value, color, shift), err=err)
 
     def debug(
             self,
@@ -477,9 +1148,9 @@ class Common(object):
 
         In quiet mode debug messages are not displayed.
         """
-        self._log(self._indent(key, value, color=None, shift=shift))
+        self._log(self._indent(key, value, color=None, shift=shift), 'debug')
         if not self.opt('quiet') and self.opt('debug') >= level:
-            echo(self._indent(key, value, color, shift), err=err)
+            _echo(self._indent(key, value, color, shift), err=err)
 
     def warn(self, message: str, shift: int = 0) -> None:
         """ Show a yellow warning message on info level, send to stderr """
@@ -497,13 +1168,16 @@ class Common(object):
              log: Optional[BaseLoggerFnType],
              join: bool = False,
              interactive: bool = False,
-             timeout: Optional[int] = None) -> CommandOutput:
+             timeout: Optional[int] = None,
+             output_file: Optional[str] = None) -> CommandOutput:
         """
         Run command, capture the output
 
         By default stdout and stderr are captured separately.
         Use join=True to merge stderr into stdout.
         Use timeout=<seconds> to finish process after given time
+        Use output_file=<path> to write stdout to the file as it comes,
+        only its tail (see OUTPUT_TAIL_SIZE) is kept in memory then.
         """
         # By default command ouput is logged using debug
         if not log:
@@ -541,23 +1215,29 @@ class Common(object):
             raise RunError(
                 f"File '{error.filename}' not found.", command, 127)
 
-        stdout_thread = StreamLogger(
-            process.stdout, log_header='out', logger=log)
-        stderr_thread = stdout_thread
-        if not join:
-            stderr_thread = StreamLogger(
-                process.stderr, log_header='err', logger=log)
-        stdout_thread.start()
-        if not join:
-            stderr_thread.start()
-        try:
-            process.wait(timeout=timeout)
-        except subprocess.TimeoutExpired:
-            process.kill()
-            process.returncode = PROCESS_TIMEOUT
-        stdout_thread.join()
-        if not join:
-            stderr_thread.join()
+        output: ContextManager[Optional[IO[str]]] = contextlib.nullcontext()
+        if output_file:
+            output = open(
+                output_file, 'w', encoding='utf-8', errors='replace')
+        with output as stream:
+            stdout_thread = StreamLogger(
+                process.stdout, log_header='out', logger=log,
+                output_file=stream)
+            stderr_thread = stdout_thread
+            if not join:
+                stderr_thread = StreamLogger(
+                    process.stderr, log_header='err', logger=log)
+            stdout_thread.start()
+            if not join:
+                stderr_thread.start()
+            try:
+                process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.returncode = PROCESS_TIMEOUT
+            stdout_thread.join()
+            if not join:
+                stderr_thread.join()
 
         # Handle the exit code, return output
         if process.returncode != 0:
@@ -584,7 +1264,8 @@ class Common(object):
             interactive: bool = False,
             join: bool = False,
             log: Optional[BaseLoggerFnType] = None,
-            timeout: Optional[int] = None) -> CommandOutput:
+            timeout: Optional[int] = None,
+            output_file: Optional[str] = None) -> CommandOutput:
         """
         Run command, give message, handle errors
 
@@ -619,7 +1300,8 @@ class Common(object):
 
         try:
             return self._run(
-                command, cwd, shell, env, log, join, interactive, timeout)
+                command, cwd, shell, env, log, join, interactive, timeout,
+                output_file)
         except RunError as error:
             self.debug(error.message, level=3)
             message += f" Reason: {error.message}"
@@ -906,6 +1588,114 @@ def copytree(
     return dst
 
 
+# Linux ioctl creating a copy-on-write clone of a file (reflink)
+FICLONE = 0x40049409
+
+# Methods available for copying directory trees
+COPY_METHODS = ['auto', 'reflink', 'hardlink', 'git', 'copy']
+
+
+def reflink(source: str, destination: str) -> None:
+    """ Create a copy-on-write clone of the file, keep its metadata """
+    # Opening special files like named pipes could block
+    if not os.path.isfile(source):
+        raise shutil.SpecialFileError(f"'{source}' is not a regular file.")
+    with open(source, 'rb') as source_file:
+        with open(destination, 'wb') as destination_file:
+            fcntl.ioctl(
+                destination_file.fileno(), FICLONE, source_file.fileno())
+    shutil.copystat(source, destination)
+
+
+def hardlink(source: str, destination: str) -> None:
+    """ Create a hardlink of the file, copy it if not possible """
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+def _copy_function(method: str) -> Callable[[str, str], Any]:
+    """ Function copying a single file using given method """
+    if method == 'reflink':
+        return reflink
+    if method == 'hardlink':
+        return hardlink
+    if method == 'copy':
+        return shutil.copy2
+    # Use reflinks until the filesystem turns out not to support them
+    supported = True
+
+    def copy(source: str, destination: str) -> None:
+        nonlocal supported
+        if supported and os.path.isfile(source):
+            try:
+                reflink(source, destination)
+                return
+            except OSError:
+                supported = False
+        shutil.copy2(source, destination)
+    return copy
+
+
+def copy_tree(
+        source: str,
+        destination: str,
+        method: str = 'auto',
+        ignore: Optional[Callable[[str, List[str]], Iterable[str]]] = None,
+        ) -> None:
+    """
+    Copy directory tree using given method
+
+    auto ....... copy-on-write file clones if supported, copy otherwise
+    reflink .... copy-on-write file clones, fail if not supported
+    hardlink ... hardlinks where possible, files are shared with source
+    git ........ copy only files tracked or not ignored by git
+    copy ....... regular copy of all files
+
+    The 'git' method falls back to 'auto' outside of a git repository,
+    'ignore' has the same meaning as for shutil.copytree() and it is
+    not applied for the 'git' method.
+    """
+    if method not in COPY_METHODS:
+        raise GeneralError(
+            f"Invalid copy method '{method}', "
+            f"should be one of {fmf.utils.listed(COPY_METHODS, join='or')}.")
+    if method != 'git':
+        shutil.copytree(
+            source, destination, symlinks=True, ignore=ignore,
+            copy_function=_copy_function(method))
+        return
+
+    # Copy files reported by git, keep symlinks, copy submodules whole
+    try:
+        output = subprocess.run(
+            ['git', 'ls-files', '-z', '--cached', '--others',
+             '--exclude-standard'],
+            cwd=source, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            check=True).stdout.decode('utf-8')
+    except (OSError, subprocess.CalledProcessError):
+        log.debug(f"No git repository in '{source}', copying all files.")
+        copy_tree(source, destination, ignore=ignore)
+        return
+    copy = _copy_function('auto')
+    os.makedirs(destination, exist_ok=True)
+    for name in sorted(set(filter(None, output.split('\0')))):
+        source_path = os.path.join(source, name)
+        destination_path = os.path.join(destination, name)
+        os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+        if os.path.islink(source_path):
+            os.symlink(os.readlink(source_path), destination_path)
+        elif os.path.isdir(source_path):
+            shutil.copytree(
+                source_path, destination_path, symlinks=True,
+                copy_function=copy)
+        # Tracked files deleted from the working tree are skipped
+        elif os.path.exists(source_path):
+            copy(source_path, destination_path)
+    shutil.copystat(source, destination)
+
+
 # These two are helpers for shell_to_dict and environment_to_dict -
 # there is some overlap of their functionality.
 def _add_simple_var(result: EnvironmentType, var: str) -> None: